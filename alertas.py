@@ -0,0 +1,212 @@
+# alertas.py
+# Motor de alertas con estado por (estación, parámetro).
+# Una alerta se abre cuando el valor supera el umbral de entrada durante
+# varias horas seguidas y se cierra cuando baja del umbral de salida (más
+# bajo) otras tantas horas: un valor que oscila alrededor de un umbral no
+# abre y cierra alertas cada hora. Tras cerrarse hay un tiempo de
+# enfriamiento antes de poder abrirse otra.
+#
+# El estado se guarda en almacen/alertas_estado.json y en cada evaluación solo
+# se procesan las horas nuevas. Solo se emiten transiciones (inicio / fin),
+# que quedan en almacen/alertas.jsonl para el envío de correos (cli.py alertas).
+# La lectura, el avance y la escritura del estado se hacen con un bloqueo de
+# archivo: varias sesiones o procesos que ven una versión nueva a la vez no
+# emiten dos veces las mismas transiciones.
+
+import contextlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+import almacen
+from calidad import HORAS_BRECHA
+from motor import nivel_contaminacion
+
+RUTA_ESTADO = os.path.join(almacen.DIR_ALMACEN, "alertas_estado.json")
+RUTA_EVENTOS = os.path.join(almacen.DIR_ALMACEN, "alertas.jsonl")
+RUTA_CURSOR_ENVIO = os.path.join(almacen.DIR_ALMACEN, "alertas_enviadas.json")
+
+# Entrada: sobre el límite de "Dañino" (mismos cortes que nivel_contaminacion)
+REGLAS = {
+    'pm25': {'entrada': 55, 'salida': 45, 'horas_entrada': 2, 'horas_salida': 3, 'enfriamiento': 6},
+    'pm10': {'entrada': 254, 'salida': 200, 'horas_entrada': 2, 'horas_salida': 3, 'enfriamiento': 6},
+}
+HORAS_ARRANQUE = 48  # historia que se revisa la primera vez que aparece una estación
+
+
+def _estado_inicial():
+    return {'activa': False, 'sobre': 0, 'bajo': 0, 'ultima': None, 'desde': None, 'fin': None,
+            'valor': None, 'maximo': None, 'nombre': None}
+
+
+class EstadoAlertas:
+    def __init__(self, ruta=RUTA_ESTADO):
+        self.ruta = ruta
+        self.estados = {}
+        self.horas_procesadas = 0
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                for clave, estado in json.load(f).items():
+                    location_id, parametro = clave.split("|")
+                    for campo in ('ultima', 'desde', 'fin'):
+                        if estado[campo]:
+                            estado[campo] = pd.Timestamp(estado[campo])
+                    self.estados[(int(location_id), parametro)] = estado
+
+    def _pendientes(self, df):
+        """Lecturas válidas posteriores a la última hora procesada de cada serie."""
+        filtro = df['parameter'].isin(list(REGLAS)) & df['dato_valido']
+        ultimas = [e['ultima'] for e in self.estados.values() if e['ultima'] is not None]
+        if ultimas:
+            # Con estado previo solo interesa lo posterior a la serie más atrasada;
+            # las series que aparecen por primera vez traen su historia de arranque
+            recientes = filtro & (df['datetimeLocal'] > min(ultimas))
+            series = set(zip(df.loc[recientes, 'location_id'].tolist(), df.loc[recientes, 'parameter'].tolist()))
+            estaciones_nuevas = {loc for loc, par in series if (loc, par) not in self.estados}
+            if estaciones_nuevas:
+                recientes |= filtro & df['location_id'].isin(list(estaciones_nuevas))
+            filtro = recientes
+        datos = df.loc[filtro, ['location_id', 'location_name', 'parameter', 'value', 'datetimeLocal']]
+        ultimas = pd.DataFrame(
+            [(loc, par, e['ultima']) for (loc, par), e in self.estados.items()],
+            columns=['location_id', 'parameter', 'ultima'])
+        ultimas['ultima'] = pd.to_datetime(ultimas['ultima'], utc=True)
+        datos = datos.merge(ultimas, on=['location_id', 'parameter'], how='left')
+        tiempo = datos['datetimeLocal'].dt.tz_convert("UTC")
+        arranque = datos.groupby(['location_id', 'parameter'])['datetimeLocal'].transform('max').dt.tz_convert("UTC") \
+            - pd.Timedelta(hours=HORAS_ARRANQUE)
+        nuevas = tiempo > datos['ultima'].fillna(arranque)
+        return datos[nuevas].sort_values(['location_id', 'parameter', 'datetimeLocal'])
+
+    def procesar(self, df):
+        """Avanza las máquinas de estado con las horas nuevas. Devuelve las transiciones."""
+        transiciones = []
+        pendientes = self._pendientes(df)
+        self.horas_procesadas += len(pendientes)
+        for fila in pendientes.itertuples(index=False):
+            clave = (int(fila.location_id), fila.parameter)
+            estado = self.estados.setdefault(clave, _estado_inicial())
+            transicion = _paso(estado, REGLAS[fila.parameter], fila.datetimeLocal, float(fila.value))
+            estado['nombre'] = fila.location_name
+            if transicion:
+                nivel, _ = nivel_contaminacion(estado['maximo'], fila.parameter)
+                transiciones.append({
+                    'tipo': transicion, 'location_id': clave[0], 'location_name': fila.location_name,
+                    'parameter': fila.parameter, 'hora': fila.datetimeLocal.isoformat(),
+                    'valor': float(fila.value), 'maximo': estado['maximo'], 'nivel': nivel,
+                    'desde': estado['desde'].isoformat(),
+                })
+        return transiciones
+
+    def activas(self):
+        """Alertas abiertas, de mayor a menor valor actual."""
+        filas = [{'location_id': loc, 'location_name': e['nombre'], 'parameter': par, 'value': e['valor'],
+                  'nivel': nivel_contaminacion(e['valor'], par)[0], 'desde': e['desde'], 'maximo': e['maximo']}
+                 for (loc, par), e in self.estados.items() if e['activa']]
+        return sorted(filas, key=lambda f: -f['value'])
+
+    def guardar(self):
+        directorio = os.path.dirname(self.ruta) or "."
+        os.makedirs(directorio, exist_ok=True)
+        datos = {f"{loc}|{par}": {k: (v.isoformat() if isinstance(v, pd.Timestamp) else v) for k, v in e.items()}
+                 for (loc, par), e in self.estados.items()}
+        fd, ruta_tmp = tempfile.mkstemp(prefix=".alertas.", suffix=".tmp", dir=directorio)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(ruta_tmp, self.ruta)
+
+
+def _paso(estado, regla, hora, valor):
+    """Una hora de la máquina de estados. Devuelve 'inicio', 'fin' o None."""
+    if estado['ultima'] is not None and hora - estado['ultima'] > pd.Timedelta(hours=HORAS_BRECHA):
+        estado['sobre'] = estado['bajo'] = 0  # tras una brecha se vuelve a contar desde cero
+    estado['ultima'] = hora
+    estado['valor'] = valor
+
+    if estado['activa']:
+        estado['maximo'] = max(estado['maximo'], valor)
+        estado['bajo'] = estado['bajo'] + 1 if valor <= regla['salida'] else 0
+        if estado['bajo'] >= regla['horas_salida']:
+            estado.update(activa=False, fin=hora, sobre=0, bajo=0)
+            return 'fin'
+        return None
+
+    estado['sobre'] = estado['sobre'] + 1 if valor > regla['entrada'] else 0
+    enfriando = estado['fin'] is not None and hora - estado['fin'] < pd.Timedelta(hours=regla['enfriamiento'])
+    if estado['sobre'] >= regla['horas_entrada'] and not enfriando:
+        estado.update(activa=True, desde=hora, maximo=valor, bajo=0)
+        return 'inicio'
+    return None
+
+
+def registrar_eventos(transiciones, ruta=RUTA_EVENTOS):
+    if not transiciones:
+        return
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "a", encoding="utf-8") as f:
+        for t in transiciones:
+            f.write(json.dumps(t, ensure_ascii=False) + "\n")
+
+
+@contextlib.contextmanager
+def _bloqueo(ruta):
+    """Bloqueo exclusivo entre procesos sobre ruta + '.lock' (flock en Unix, msvcrt en Windows)."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta + ".lock", "a+") as f:
+        try:
+            import fcntl  # solo Unix
+        except ImportError:
+            fcntl = None
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # reintenta ~10 s y luego falla
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def actualizar(df, ruta=RUTA_ESTADO, ruta_eventos=RUTA_EVENTOS):
+    """Carga el estado, procesa las horas nuevas y lo guarda. Devuelve (activas, transiciones)."""
+    with _bloqueo(ruta):
+        estado = EstadoAlertas(ruta)
+        transiciones = estado.procesar(df)
+        if estado.horas_procesadas:
+            estado.guardar()
+            registrar_eventos(transiciones, ruta_eventos)
+    return estado.activas(), transiciones
+
+
+def eventos_sin_enviar(ruta_eventos=RUTA_EVENTOS, ruta_cursor=RUTA_CURSOR_ENVIO):
+    """Transiciones registradas después del último envío. Devuelve (eventos, posición)."""
+    posicion = 0
+    if os.path.exists(ruta_cursor):
+        with open(ruta_cursor, encoding="utf-8") as f:
+            posicion = json.load(f)['posicion']
+    if not os.path.exists(ruta_eventos):
+        return [], posicion
+    with open(ruta_eventos, "rb") as f:
+        f.seek(posicion)
+        contenido = f.read()
+    completo = contenido[:contenido.rfind(b"\n") + 1]  # una línea a medio escribir queda para la próxima vez
+    eventos = [json.loads(linea) for linea in completo.decode("utf-8").splitlines() if linea]
+    return eventos, posicion + len(completo)
+
+
+def marcar_enviados(posicion, ruta_cursor=RUTA_CURSOR_ENVIO):
+    with open(ruta_cursor, "w", encoding="utf-8") as f:
+        json.dump({'posicion': posicion}, f)
@@ -0,0 +1,155 @@
+# almacen.py
+# Almacén compartido de datos preparados para AirCesfam.
+# Las tablas se guardan en formato Arrow IPC (Feather v2, sin compresión) y
+# cada proceso de Streamlit las mapea en memoria de solo lectura: las páginas
+# se comparten a través del page cache del sistema operativo y un worker nuevo
+# no necesita volver a leer ni preparar los CSV.
+#
+# Las mediciones también se publican como dataset Parquet particionado por
+# estación y mes (estilo Hive: location_id=356/mes=2025-07/). Las vistas que
+# muestran un rango de fechas lo leen con pyarrow.dataset: solo se abren los
+# archivos de los meses del rango y, dentro de ellos, los grupos de filas cuyas
+# estadísticas de 'fecha' lo cruzan.
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+
+DIR_ALMACEN = os.getenv("AIRCESFAM_ALMACEN", "almacen")
+CLAVE_VERSION = b"aircesfam_version"
+
+
+def version_fuentes(archivos):
+    """Huella de un conjunto de archivos fuente (nombre, tamaño y fecha de modificación)."""
+    h = hashlib.sha256()
+    for archivo in sorted(archivos):
+        st_archivo = os.stat(archivo)
+        h.update(f"{os.path.abspath(archivo)}|{st_archivo.st_size}|{st_archivo.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+
+def ruta_tabla(nombre, directorio=None):
+    return os.path.join(directorio or DIR_ALMACEN, f"{nombre}.arrow")
+
+
+def publicar(df, nombre, version, directorio=None):
+    """Escribe la tabla (DataFrame o pyarrow.Table) y la reemplaza de forma atómica (os.replace).
+
+    Los procesos que ya tienen mapeada la versión anterior la siguen leyendo
+    sin problemas: el archivo viejo solo se libera cuando lo cierran.
+    """
+    directorio = directorio or DIR_ALMACEN
+    os.makedirs(directorio, exist_ok=True)
+    tabla = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[CLAVE_VERSION] = str(version).encode()
+    tabla = tabla.replace_schema_metadata(metadatos)
+
+    fd, ruta_tmp = tempfile.mkstemp(prefix=f".{nombre}.", suffix=".tmp", dir=directorio)
+    os.close(fd)
+    try:
+        # Sin compresión: es lo que permite mapear los buffers sin copiarlos
+        feather.write_feather(tabla, ruta_tmp, compression="uncompressed")
+        os.replace(ruta_tmp, ruta_tabla(nombre, directorio))
+    except Exception:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+    return version
+
+
+def abrir(nombre, directorio=None):
+    """Mapea la tabla publicada en modo solo lectura. Devuelve (tabla, versión) o (None, None)."""
+    ruta = ruta_tabla(nombre, directorio)
+    if not os.path.exists(ruta):
+        return None, None
+    fuente = pa.memory_map(ruta, "r")
+    tabla = pa.ipc.open_file(fuente).read_all()
+    metadatos = tabla.schema.metadata or {}
+    version = metadatos.get(CLAVE_VERSION, b"").decode() or None
+    return tabla, version
+
+
+def a_pandas(tabla):
+    """Convierte a pandas reutilizando los buffers numéricos del mapa de memoria."""
+    return tabla.to_pandas(split_blocks=True, self_destruct=False)
+
+
+# --- DATASET PARTICIONADO (estación / mes) ---
+PARTICIONES = ds.partitioning(pa.schema([('location_id', pa.int64()), ('mes', pa.string())]), flavor="hive")
+VERSIONES_DATASET = 2  # se conserva la anterior para los procesos que aún la leen
+
+
+def ruta_dataset(nombre, version, directorio=None):
+    return os.path.join(directorio or DIR_ALMACEN, nombre, str(version))
+
+
+def mes_de(fechas):
+    """'AAAA-MM' de cada fecha (clave de partición)."""
+    return np.asarray(fechas, dtype="datetime64[M]").astype(str)
+
+
+def publicar_dataset(df, nombre, version, directorio=None):
+    """Escribe el dataset en una carpeta temporal y la renombra a la de la versión.
+
+    df (DataFrame o pyarrow.Table) debe traer 'location_id' y 'fecha'. Se
+    eliminan las versiones más antiguas que las últimas VERSIONES_DATASET.
+    """
+    destino = ruta_dataset(nombre, version, directorio)
+    if os.path.isdir(destino):
+        return version
+    base = os.path.dirname(destino)
+    os.makedirs(base, exist_ok=True)
+    tabla = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.append_column("mes", pa.array(mes_de(tabla['fecha']), pa.string()))
+
+    ruta_tmp = tempfile.mkdtemp(prefix=".tmp-", dir=base)
+    try:
+        ds.write_dataset(tabla, ruta_tmp, format="parquet", partitioning=PARTICIONES,
+                         existing_data_behavior="overwrite_or_ignore", max_rows_per_group=65536,
+                         file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"))
+        os.replace(ruta_tmp, destino)
+    except Exception:
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+        raise
+
+    versiones = sorted((os.path.join(base, v) for v in os.listdir(base) if not v.startswith(".")),
+                       key=os.path.getmtime, reverse=True)
+    for vieja in versiones[VERSIONES_DATASET:]:
+        shutil.rmtree(vieja, ignore_errors=True)
+    return version
+
+
+def abrir_dataset(nombre, version, directorio=None):
+    """pyarrow.dataset de la versión o None si no está publicada (solo lista archivos)."""
+    ruta = ruta_dataset(nombre, version, directorio)
+    if not os.path.isdir(ruta):
+        return None
+    return ds.dataset(ruta, format="parquet", partitioning=PARTICIONES)
+
+
+def leer_rango(dataset, desde=None, hasta=None, estaciones=None, columnas=None):
+    """Filas entre dos fechas (inclusive) de algunas estaciones, como DataFrame.
+
+    El filtro por 'mes' descarta carpetas completas; el de 'fecha' se evalúa
+    con las estadísticas de cada grupo de filas antes de leerlo.
+    """
+    filtro = None
+
+    def y(condicion):
+        return condicion if filtro is None else filtro & condicion
+
+    if estaciones:
+        filtro = y(ds.field("location_id").isin([int(e) for e in estaciones]))
+    if desde is not None:
+        filtro = y((ds.field("mes") >= str(mes_de([desde])[0])) & (ds.field("fecha") >= desde))
+    if hasta is not None:
+        filtro = y((ds.field("mes") <= str(mes_de([hasta])[0])) & (ds.field("fecha") <= hasta))
+    columnas = columnas or [c for c in dataset.schema.names if c != "mes"]
+    return a_pandas(dataset.to_table(columns=columnas, filter=filtro))
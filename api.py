@@ -0,0 +1,337 @@
+# api.py
+# API HTTP de solo lectura (JSON) para el sistema de turnos del hospital.
+#
+#   python api.py --puerto 8502      (o python cli.py api)
+#
+#   GET /api/version                       versión de los datos publicados
+#   GET /api/niveles?parametro=pm25        última lectura, nivel y consultas por estación
+#   GET /api/resumen?estacion=&parametro=&desde=AAAA-MM-DD&hasta=AAAA-MM-DD
+#   GET /api/turnos?turno=                 recomendación de dotación por turno
+#   GET /api/exportar?formato=csv|parquet&estacion=&parametro=&desde=&hasta=
+#                                          historial filtrado, enviado por partes (chunked)
+#   GET /api/eventos                       Server-Sent Events: un evento "version" con los
+#                                          niveles de PM2.5 cada vez que se publican datos nuevos
+#   GET /metrics                           métricas en formato Prometheus
+#
+# Las respuestas se serializan una sola vez por versión de datos y se sirven
+# desde memoria con ETag; un cliente que envía If-None-Match recibe 304.
+# /api/exportar no pasa por ese caché: se genera por lotes, en un hilo aparte,
+# desde la tabla Arrow mapeada de la misma versión y cada lote se envía apenas
+# está listo.
+# Una versión nueva se prepara en un hilo aparte (run_in_executor): mientras
+# tanto las peticiones se siguen respondiendo con la versión anterior.
+# Las horas (datetimeLocal) se entregan con el desfase de la estación
+# (2025-07-01T08:00:00-04:00), no convertidas a UTC.
+# /api/eventos mantiene la conexión abierta: el evento de cada versión se
+# serializa una vez y se escribe a todos los clientes conectados, que no
+# consultan nada entre versiones (solo reciben un latido cada SEGUNDOS_LATIDO).
+
+import argparse
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+import tornado.ioloop
+import tornado.locks
+import tornado.web
+from tornado.iostream import StreamClosedError
+
+import almacen
+import calibracion
+import exportar
+import metricas
+import motor
+
+logger = logging.getLogger("aircesfam.api")
+
+SEGUNDOS_REVISION = 30  # cada cuánto se revisa si cambiaron los archivos fuente
+MAX_RESPUESTAS = 1000   # respuestas distintas guardadas por versión
+SEGUNDOS_LATIDO = 15    # comentario SSE para que proxies y clientes no cierren la conexión
+
+
+class EstadoDatos:
+    """Datos preparados de la versión vigente y respuestas ya serializadas."""
+
+    def __init__(self, ruta_datos):
+        self.ruta_datos = ruta_datos
+        self.version = None
+        self.df = None
+        self.tabla = None  # tabla Arrow de la misma versión, para /api/exportar
+        self.ultimos = {}
+        self.respuestas = {}
+        self.cambio = tornado.locks.Condition()
+        self.oyentes = 0
+        self._actualizando = False
+
+    def _cargar(self, version):
+        """Prepara (o mapea) la versión en un hilo aparte. Devuelve (df, tabla) o None."""
+        df, errores = motor.obtener_datos(self.ruta_datos, version)
+        for archivo, error in errores:
+            logger.warning("Error al leer %s: %s", archivo, error)
+        if df is None:
+            return None
+        tabla, version_publicada = almacen.abrir("mediciones")
+        if version_publicada != version:  # no se pudo publicar: se exporta desde el DataFrame
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+        return df, tabla
+
+    async def actualizar(self):
+        if self._actualizando:
+            return False
+        version = motor.version_datos(motor.listar_archivos(self.ruta_datos))
+        if version == self.version and self.df is not None:
+            return False
+        self._actualizando = True
+        try:
+            cargados = await tornado.ioloop.IOLoop.current().run_in_executor(None, self._cargar, version)
+        finally:
+            self._actualizando = False
+        if cargados is None:
+            return False
+        # En el hilo del IOLoop: los handlers nunca ven una versión a medio cambiar
+        self.df, self.tabla = cargados
+        self.version = version
+        self.ultimos = {}
+        self.respuestas = {}
+        logger.info("Datos %s cargados (%d filas)", version, len(self.df))
+        self.cambio.notify_all()
+        return True
+
+    def ultimos_valores(self, parametro):
+        if parametro not in self.ultimos:
+            self.ultimos[parametro] = motor.ultimos_valores(self.df, parametro)
+        return self.ultimos[parametro]
+
+    def evento_version(self):
+        """Evento SSE de la versión vigente, serializado una sola vez por versión y calibración."""
+        parametros = calibracion.parametros_demanda()
+        clave = ('evento', self.version, parametros['version'])
+        if clave not in self.respuestas:
+            ultimos = self.ultimos_valores('pm25')
+            niveles = ultimos[['location_id', 'location_name', 'value', 'nivel', 'datetimeLocal']].assign(
+                consultas_esperadas=motor.estimar_demanda_serie(ultimos['value'], parametros))
+            datos = json.dumps({'version': self.version, 'niveles': _registros(niveles)}, ensure_ascii=False)
+            self.respuestas[clave] = f"id: {self.version}\nevent: version\ndata: {datos}\n\n".encode("utf-8")
+        return self.respuestas[clave]
+
+
+def _json(datos):
+    return json.dumps(datos, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _hora_iso(serie):
+    """Fechas con zona como texto ISO 8601 con su desfase (to_json las pasaría a UTC)."""
+    texto = serie.dt.strftime("%Y-%m-%dT%H:%M:%S%z")
+    return texto.str[:-2] + ":" + texto.str[-2:]
+
+
+def _registros(df):
+    df = df.assign(**{c: _hora_iso(df[c]) for c in df.columns if isinstance(df[c].dtype, pd.DatetimeTZDtype)})
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, estado):
+        self.estado = estado
+
+    def compute_etag(self):
+        return getattr(self, "_etag", None)
+
+    def clave_cache(self):
+        argumentos = sorted((k, tuple(v)) for k, v in self.request.query_arguments.items())
+        return (self.request.path, tuple(argumentos), self.demanda['version'])
+
+    def generar(self):
+        """Datos de la respuesta (se serializan a JSON una vez por versión y argumentos)."""
+        raise NotImplementedError
+
+    def get(self):
+        if self.estado.df is None:
+            raise tornado.web.HTTPError(503, reason="Datos no disponibles")
+        # Parámetros de demanda de esta petición: una calibración nueva cambia la clave
+        self.demanda = calibracion.parametros_demanda()
+        clave = self.clave_cache()
+        en_cache = self.estado.respuestas.get(clave)
+        if en_cache is None:
+            cuerpo = _json(self.generar())
+            etag = '"%s-%s"' % (self.estado.version, hashlib.sha1(cuerpo).hexdigest()[:12])
+            en_cache = (cuerpo, etag)
+            if len(self.estado.respuestas) >= MAX_RESPUESTAS:
+                self.estado.respuestas.clear()
+            self.estado.respuestas[clave] = en_cache
+        cuerpo, self._etag = en_cache
+
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.set_header("Cache-Control", "public, max-age=60")
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.write(cuerpo)
+
+
+class VersionHandler(BaseHandler):
+    def generar(self):
+        return {'version': self.estado.version, 'filas': len(self.estado.df),
+                'estaciones': int(self.estado.df['location_name'].nunique())}
+
+
+class NivelesHandler(BaseHandler):
+    def generar(self):
+        parametro = self.get_argument("parametro", "pm25")
+        if parametro not in motor.contaminantes_clave:
+            raise tornado.web.HTTPError(400, reason=f"Parámetro no soportado: {parametro}")
+        ultimos = self.estado.ultimos_valores(parametro)
+        salida = ultimos[['location_id', 'location_name', 'parameter', 'value', 'nivel', 'datetimeLocal',
+                          'latitude', 'longitude']]
+        if parametro == 'pm25':
+            salida = salida.assign(consultas_esperadas=motor.estimar_demanda_serie(ultimos['value'], self.demanda))
+        return {'version': self.estado.version, 'niveles': _registros(salida)}
+
+
+class ResumenHandler(BaseHandler):
+    def generar(self):
+        df = self.estado.df
+        filtro = pd.Series(True, index=df.index)
+        estacion = self.get_argument("estacion", None)
+        parametro = self.get_argument("parametro", None)
+        desde = self.get_argument("desde", None)
+        hasta = self.get_argument("hasta", None)
+        try:
+            if estacion:
+                filtro = filtro & (df['location_name'] == estacion)
+            if parametro:
+                filtro = filtro & (df['parameter'] == parametro)
+            if desde:
+                filtro = filtro & (df['fecha'] >= pd.Timestamp(desde).date())
+            if hasta:
+                filtro = filtro & (df['fecha'] <= pd.Timestamp(hasta).date())
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        resumen = motor.resumen_diario(df[filtro])
+        resumen['fecha'] = resumen['fecha'].astype(str)
+        return {'version': self.estado.version, 'resumen': _registros(resumen)}
+
+
+class TurnosHandler(BaseHandler):
+    def generar(self):
+        establecimiento = self.get_argument("establecimiento", motor.ESTABLECIMIENTO)
+        if establecimiento != motor.ESTABLECIMIENTO:
+            raise tornado.web.HTTPError(404, reason=f"Establecimiento desconocido: {establecimiento}")
+        turno = self.get_argument("turno", None)
+        if turno and turno not in motor.TURNOS:
+            raise tornado.web.HTTPError(400, reason=f"Turno desconocido: {turno}")
+        ultimos = self.estado.ultimos_valores('pm25')
+        recomendaciones = []
+        for t in [turno] if turno else motor.TURNOS:
+            fila, recomendacion = motor.recomendacion_turno(ultimos, t, parametros=self.demanda)
+            recomendaciones.append({**fila, 'Recomendacion': recomendacion})
+        return {'version': self.estado.version, 'turnos': recomendaciones}
+
+
+class ExportarHandler(tornado.web.RequestHandler):
+    def initialize(self, estado):
+        self.estado = estado
+
+    async def get(self):
+        formato = self.get_argument("formato", "csv")
+        if formato not in exportar.FORMATOS:
+            raise tornado.web.HTTPError(400, reason=f"Formato no soportado: {formato}")
+        try:
+            desde = self.get_argument("desde", None)
+            hasta = self.get_argument("hasta", None)
+            filtros = dict(estaciones=self.get_arguments("estacion"), parametros=self.get_arguments("parametro"),
+                           desde=pd.Timestamp(desde).date() if desde else None,
+                           hasta=pd.Timestamp(hasta).date() if hasta else None)
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        # Tabla y versión se toman juntas: el archivo y su nombre son de la misma versión
+        tabla, version = self.estado.tabla, self.estado.version
+        if tabla is None:
+            raise tornado.web.HTTPError(503, reason="Datos no disponibles")
+
+        self.set_header("Content-Type", exportar.FORMATOS[formato])
+        self.set_header("Content-Disposition", f'attachment; filename="aircesfam_{version}.{formato}"')
+        # Cada parte (filtro y CSV/Parquet del lote) se arma en un hilo aparte:
+        # una exportación grande no detiene las demás peticiones del IOLoop
+        partes = exportar.generar(tabla, formato, **filtros)
+        ioloop = tornado.ioloop.IOLoop.current()
+        try:
+            while (parte := await ioloop.run_in_executor(None, next, partes, None)) is not None:
+                if parte:
+                    self.write(parte)
+                    await self.flush()  # sin Content-Length: Tornado lo envía como chunked
+        finally:
+            partes.close()
+
+
+class EventosHandler(tornado.web.RequestHandler):
+    def initialize(self, estado):
+        self.estado = estado
+
+    async def get(self):
+        self.set_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")  # sin buffer en nginx
+        # Un cliente que se reconecta con la versión que ya tiene no la recibe de nuevo
+        version = self.request.headers.get("Last-Event-ID")
+        self.estado.oyentes += 1
+        metricas.registrar_valor("api_eventos_oyentes", self.estado.oyentes)
+        try:
+            while True:
+                if self.estado.df is not None and self.estado.version != version:
+                    version = self.estado.version
+                    self.write(self.estado.evento_version())
+                else:
+                    self.write(": latido\n\n")
+                await self.flush()
+                await self.estado.cambio.wait(timeout=timedelta(seconds=SEGUNDOS_LATIDO))
+        except StreamClosedError:
+            pass
+        finally:
+            self.estado.oyentes -= 1
+            metricas.registrar_valor("api_eventos_oyentes", self.estado.oyentes)
+
+
+class MetricasHandler(tornado.web.RequestHandler):
+    def get(self):
+        metricas.registrar_proceso()
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(metricas.texto_prometheus())
+
+
+def crear_app(estado):
+    return tornado.web.Application([
+        (r"/api/version", VersionHandler, dict(estado=estado)),
+        (r"/api/niveles", NivelesHandler, dict(estado=estado)),
+        (r"/api/resumen", ResumenHandler, dict(estado=estado)),
+        (r"/api/turnos", TurnosHandler, dict(estado=estado)),
+        (r"/api/exportar", ExportarHandler, dict(estado=estado)),
+        (r"/api/eventos", EventosHandler, dict(estado=estado)),
+        (r"/metrics", MetricasHandler),
+    ], log_function=lambda handler: None)  # sin log por petición: con carga es una parte notable del costo
+
+
+def servir(puerto=8502, ruta_datos=motor.RUTA_DATOS):
+    logging.basicConfig(level=logging.INFO)
+    estado = EstadoDatos(ruta_datos)
+    tornado.ioloop.IOLoop.current().run_sync(estado.actualizar)
+    crear_app(estado).listen(puerto)
+    tornado.ioloop.PeriodicCallback(estado.actualizar, SEGUNDOS_REVISION * 1000).start()
+    print(f"✅ API AirCesfam en http://localhost:{puerto}/api/niveles (datos {estado.version})")
+    tornado.ioloop.IOLoop.current().start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API JSON de solo lectura de AirCesfam")
+    parser.add_argument("--puerto", type=int, default=8502)
+    parser.add_argument("--datos", default=motor.RUTA_DATOS)
+    args = parser.parse_args(argv)
+    servir(args.puerto, args.datos)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,31 @@
 # AirCesfam: Sistema de apoyo a la gestión de recursos humanos
 # en Cesfam La Floresta basado en calidad del aire
 
+import time
+inicio_script = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-from datetime import datetime
-import folium
-from folium.plugins import MarkerCluster
-from streamlit_folium import st_folium
+from datetime import datetime, timedelta
 import os
-import glob
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
 
+# gspread, oauth2client, smtplib/email, folium, streamlit_folium y plotly se
+# importan dentro de las funciones que los usan: solo se cargan si se usa la
+# funcionalidad correspondiente.
+import alertas
+import cache_consultas
+import calibracion
+import calidad
+import correlacion
+import metricas
+import motor
+import retencion
+import suscriptores
+import vigilante
+import vistas
+from metricas import medir
+
 # --- CONFIGURACIÓN DE LA PÁGINA ---
 st.set_page_config(
     page_title="AirCesfam - Cesfam La Floresta",
@@ -48,122 +54,129 @@ def get_secret(key):
 
 EMAIL_REMITENTE = get_secret("EMAIL_REMITENTE")
 EMAIL_APP_PASSWORD = get_secret("EMAIL_APP_PASSWORD")
+URL_APP = get_secret("AIRCESFAM_URL")  # para los enlaces de baja en los correos
 
 if not EMAIL_REMITENTE or not EMAIL_APP_PASSWORD:
     st.error("❌ Error: No se encontraron las credenciales de correo. Revisa .env o secrets.toml")
     st.stop()
 
-# --- 2. CARGA DE DATOS (cacheada) ---
-@st.cache_data
-def cargar_datos_unidos(ruta_carpeta):
-    patron = os.path.join(ruta_carpeta, "*.csv")
-    archivos_csv = glob.glob(patron)
-
-    if not archivos_csv:
-        st.error("❌ No se encontraron archivos CSV en la carpeta especificada.")
-        return None
-
-    listado_dataframes = []
-    for archivo in archivos_csv:
-        try:
-            df = pd.read_csv(archivo)
-            listado_dataframes.append(df)
-        except Exception as e:
-            st.warning(f"❌ Error al leer {os.path.basename(archivo)}: {e}")
-
-    if not listado_dataframes:
-        st.error("⚠️ No se pudo cargar ningún archivo correctamente.")
-        return None
-
-    df_unido = pd.concat(listado_dataframes, ignore_index=True)
-    return df_unido
+# --- 2. CARGA DE DATOS ---
+# El primer worker que encuentra los CSV más nuevos que la tabla publicada la
+# prepara y la publica en el almacén; el resto solo mapea el archivo Arrow
+# (ver motor.obtener_datos; calentar.py lo hace antes de levantar el servidor).
+# La versión forma parte de la clave: al cambiar los CSV se mapea la tabla nueva.
+# Se conservan dos versiones (max_entries=2): los fragmentos en vivo pasan a la
+# nueva mientras el script principal sigue en la anterior hasta su próxima
+# ejecución, y ninguno expulsa la versión del otro. Lo mismo vale para las
+# demás cachés por versión de más abajo.
+@st.cache_resource(max_entries=2)
+def cargar_datos_preparados(ruta_carpeta, version):
+    df, errores = motor.obtener_datos(ruta_carpeta, version)
+    for archivo, error in errores:
+        st.warning(f"❌ Error al leer {archivo}: {error}")
+    return df
+
+# --- 3. LIMPIEZA Y PREPARACIÓN / 4. NIVELES DE ALERTA ---
+# (ver motor.preparar_datos y motor.nivel_contaminacion; con AIRCESFAM_MOTOR=arrow,
+# motor_arrow.preparar_tabla)
+
+ruta_carpeta = motor.RUTA_DATOS
+archivos_datos = motor.listar_archivos(ruta_carpeta)
+version_datos = motor.version_datos(archivos_datos)
+if not archivos_datos:
+    st.error("❌ No se encontraron archivos CSV en la carpeta especificada.")
+    st.stop()
 
-# Ruta de datos (ajustar según entorno)
-ruta_carpeta = r"C:\Users\sucor\OneDrive\Escritorio\UDEC_MAGISTER\VI - TRIMESTRE\PROYECTO INTEGRADO\proyecto-aire"
-df = cargar_datos_unidos(ruta_carpeta)
+with medir("carga"):
+    df = cargar_datos_preparados(ruta_carpeta, version_datos)
 
 if df is None:
+    st.error("⚠️ No se pudo cargar ningún archivo correctamente.")
     st.stop()
 
-# --- 3. LIMPIEZA Y PREPARACIÓN ---
-df['datetimeLocal'] = pd.to_datetime(df['datetimeLocal'], errors='coerce')
-df = df.dropna(subset=['datetimeLocal', 'value', 'parameter', 'location_name'])
-df['value'] = pd.to_numeric(df['value'], errors='coerce')
-df = df.dropna(subset=['value'])
-
-# Filtrar contaminantes clave
-contaminantes_clave = ['pm25', 'pm10', 'o3', 'no2']
-df = df[df['parameter'].isin(contaminantes_clave)]
-
-# Extraer fecha y hora
-df['fecha'] = df['datetimeLocal'].dt.date
-df['hora'] = df['datetimeLocal'].dt.hour
-
-# --- 4. NIVELES DE ALERTA ---
-def nivel_contaminacion(valor, parametro):
-    if parametro == 'pm25':
-        if valor <= 12: return 'Bueno', 'green'
-        elif valor <= 35: return 'Moderado', 'yellow'
-        elif valor <= 55: return 'Dañino S. G.', 'orange'
-        elif valor <= 150: return 'Dañino', 'red'
-        elif valor <= 250: return 'Muy Dañino', 'purple'
-        else: return 'Peligroso', 'maroon'
-    elif parametro == 'pm10':
-        if valor <= 54: return 'Bueno', 'green'
-        elif valor <= 154: return 'Moderado', 'yellow'
-        elif valor <= 254: return 'Dañino S. G.', 'orange'
-        elif valor <= 354: return 'Dañino', 'red'
-        else: return 'Peligroso', 'purple'
-    else:
-        return 'Moderado', 'gray'
+# --- MODO EN VIVO ---
+# Un vigilante por proceso (vigilante.py) anuncia cada versión nueva de los
+# datos; la prepara cargar_datos_preparados la primera vez que se pide. Con
+# "En vivo" activado, los fragmentos del resumen, las tendencias y el sello de
+# actualización se reejecutan cada SEGUNDOS_VIVO s: leen la versión anunciada
+# en memoria y solo cargan datos cuando cambió, sin volver a ejecutar el
+# script completo.
+SEGUNDOS_VIVO = 15
 
-df['nivel_alerta'] = df.apply(lambda x: nivel_contaminacion(x['value'], x['parameter']), axis=1)
-df['nivel'] = df['nivel_alerta'].apply(lambda x: x[0])
-df['color'] = df['nivel_alerta'].apply(lambda x: x[1])
+vigilante.compartido(ruta_carpeta).anunciar(version_datos)  # esta ejecución ya tiene la versión más nueva
+en_vivo = st.session_state.get("en_vivo", False)
+intervalo_vivo = SEGUNDOS_VIVO if en_vivo else None
 
-# --- 5. ESTIMACIÓN DE DEMANDA EN CESFAM ---
-def estimar_demanda(pm25_value):
-    base_consultas = 35  # promedio diario Cesfam La Floresta (ajustable)
-    if pm25_value <= 12:
-        factor = 1.0
-    elif pm25_value <= 35:
-        factor = 1.3
-    elif pm25_value <= 55:
-        factor = 1.7
-    elif pm25_value <= 150:
-        factor = 2.2
-    else:
-        factor = 2.8
-    return int(base_consultas * factor)
+def version_vigente():
+    if en_vivo:
+        return vigilante.compartido(ruta_carpeta).version or version_datos
+    return version_datos
 
-# Últimos valores de PM2.5
-df_pm25 = df[df['parameter'] == 'pm25'].sort_values('datetimeLocal')
-ultimos_pm25 = df_pm25.groupby('location_name').last().reset_index()
+def datos_version(version):
+    return df if version == version_datos else cargar_datos_preparados(ruta_carpeta, version)
 
-# --- 6. CONEXIÓN CON GOOGLE SHEETS (SUSCRIPTORES) ---
-def guardar_suscriptor(email):
+# --- 5. ESTIMACIÓN DE DEMANDA EN CESFAM ---
+# (ver motor.estimar_demanda). Si hay una calibración con atenciones reales
+# (python cli.py calibrar atenciones.csv), se usan sus parámetros: se leen una
+# vez por ejecución y su versión entra en las claves de caché que dependen de ellos.
+calibracion_vigente = calibracion.cargar()
+parametros_demanda = calibracion.parametros_demanda()
+
+# Últimos valores de PM2.5 (solo lecturas que pasaron la revisión de calidad),
+# calculados una vez por versión de datos y compartidos entre sesiones
+@st.cache_resource(max_entries=2)
+def ultimos_por_version(version):
+    with medir("ultimos_pm25"):
+        return motor.ultimos_valores(datos_version(version), 'pm25')
+
+ultimos_pm25 = ultimos_por_version(version_datos)
+
+# Alertas con estado (alertas.py): se avanzan una vez por versión de datos,
+# solo con las horas nuevas
+@st.cache_resource(max_entries=2)
+def alertas_por_version(version):
+    with medir("alertas"):
+        activas, _ = alertas.actualizar(datos_version(version))
+    return activas
+
+# --- 6. SUSCRIPTORES (registro local + espejo en Google Sheets) ---
+@st.cache_resource
+def espejo_suscriptores():
+    return suscriptores.SincronizadorHoja()
+
+def guardar_suscriptor(email, estaciones=None):
+    """Devuelve (fila, es_nuevo) o (None, False) si no se pudo registrar."""
     try:
-        scope = [
-            "https://spreadsheets.google.com/feeds",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-        client = gspread.authorize(creds)
-        sheet = client.open("suscriptores_aircesfam").sheet1
-        sheet.append_row([email, datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
-        return True
+        conexion = suscriptores.conectar()
+        try:
+            fila, es_nuevo = suscriptores.suscribir(conexion, email, estaciones)
+        finally:
+            conexion.close()
+        espejo_suscriptores().notificar()
+        return fila, es_nuevo
     except Exception as e:
         st.error(f"❌ Error al guardar suscriptor: {e}")
-        return False
+        return None, False
+
+@st.cache_resource(max_entries=2)
+def grafico_niveles(version):
+    import graficos
 
-def enviar_email_bienvenida(destinatario):
-    remitente = EMAIL_REMITENTE
-    password = EMAIL_APP_PASSWORD
+    ruta = graficos.renderizar(df, [('niveles', None)], version)[('niveles', None)]
+    return graficos.cargar([ruta])
 
-    mensaje = MIMEMultipart("alternative")
-    mensaje["Subject"] = "✅ Bienvenido al Sistema AirCesfam – Cesfam La Floresta"
-    mensaje["From"] = remitente
-    mensaje["To"] = destinatario
+def enviar_email_bienvenida(destinatario, token_baja=None):
+    import correo
+
+    try:
+        imagenes = grafico_niveles(version_datos)
+    except Exception:  # el correo sale igual, sin gráfico
+        imagenes = {}
+    grafico = "".join(f'<p><img src="cid:{cid}" alt="PM2.5 por estación" width="600"></p>' for cid in imagenes)
+
+    enlace_baja = ""
+    if URL_APP and token_baja:
+        enlace_baja = f'<p><small><a href="{URL_APP}?baja={token_baja}">Anular suscripción</a></small></p>'
 
     cuerpo_html = f"""
     <html>
@@ -176,169 +189,373 @@ def enviar_email_bienvenida(destinatario):
             <li>👥 Recomendaciones de asignación de personal por turno</li>
             <li>📥 Reportes semanales para gestión del Cesfam La Floresta</li>
         </ul>
+        {grafico}
         <p>Este sistema apoya la toma de decisiones en la gestión de recursos humanos para mejorar la resolutividad y seguridad del paciente.</p>
         <p>Saludos,<br>
         <strong>Equipo de Gestión - Cesfam La Floresta</strong></p>
         <hr>
         <p><small>¿No solicitaste esto? Puedes ignorar este correo.</small></p>
+        {enlace_baja}
     </body>
     </html>
     """
-    parte_html = MIMEText(cuerpo_html, "html")
-    mensaje.attach(parte_html)
-
+    mensaje = correo.construir_mensaje(EMAIL_REMITENTE, destinatario,
+                                       "✅ Bienvenido al Sistema AirCesfam – Cesfam La Floresta", cuerpo_html,
+                                       imagenes=imagenes)
     try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(remitente, password)
-        server.sendmail(remitente, destinatario, mensaje.as_string())
-        server.quit()
-        return True
+        return not correo.enviar(EMAIL_REMITENTE, EMAIL_APP_PASSWORD, [mensaje])
     except Exception as e:
         st.error(f"❌ Error al enviar correo: {e}")
         return False
 
+# --- BAJA DE SUSCRIPCIÓN (enlace ?baja=<token> de los correos) ---
+if st.query_params.get("baja"):
+    conexion = suscriptores.conectar()
+    try:
+        email_baja = suscriptores.dar_de_baja(conexion, st.query_params["baja"])
+    finally:
+        conexion.close()
+    # Se atiende una sola vez: las siguientes ejecuciones ya no traen el token
+    del st.query_params["baja"]
+    if email_baja:
+        espejo_suscriptores().notificar()
+        st.success(f"✅ {email_baja} ya no recibirá correos de AirCesfam.")
+    else:
+        st.warning("⚠️ El enlace de baja no es válido o ya fue usado.")
+
 # --- 7. INTERFAZ DE USUARIO ---
-tab1, tab2, tab3, tab4 = st.tabs([
-    "📊 Resumen Ejecutivo", 
-    "📈 Tendencias", 
-    "🌍 Mapa de Alerta", 
-    "📋 Gestión de Turnos"
-])
+# Cada vista es una página: solo se ejecuta la que está abierta. Sus partes
+# interactivas son fragmentos, así que cambiar un selectbox vuelve a ejecutar
+# solo ese fragmento y no todo el script (credenciales, carga, mapa, etc.).
+
+@st.cache_resource(max_entries=2)
+def estaciones_por_version(version):
+    """Nombre -> location_id de cada estación, y primera y última fecha con datos."""
+    datos = datos_version(version)
+    estaciones = datos.drop_duplicates('location_name').set_index('location_name')['location_id']
+    primera = min(filter(None, [datos['fecha'].min(), retencion.primera_fecha()]))
+    return {n: int(i) for n, i in estaciones.items()}, primera, datos['fecha'].max()
+
+# Resultados por vista (serie filtrada, figura, mapa) en una caché LRU común a
+# todas las sesiones, con presupuesto de memoria (AIRCESFAM_CACHE_MB)
+@st.cache_resource
+def cache_vistas():
+    return cache_consultas.CacheLRU()
+
+def mapa_estaciones(version):
+    def construir():
+        with medir("mapa_folium"):
+            return vistas.construir_mapa(df, ultimos_pm25, parametros_demanda)
+    # La versión de la calibración va como "parámetros" de la clave: la versión de
+    # datos sigue siendo la misma que la del resto de las vistas
+    return cache_vistas().obtener("mapa", version, construir, parametros=parametros_demanda['version'])
 
 # --- TAB 1: RESUMEN ---
-with tab1:
+@st.fragment(run_every=intervalo_vivo)
+def panel_resumen():
+    version = version_vigente()
+    with medir("render", vista="resumen"):
+        ultimos = ultimos_por_version(version)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Estaciones", len(ultimos))
+        with col2:
+            prom_pm25 = ultimos['value'].mean()
+            st.metric("PM2.5 Promedio", f"{prom_pm25:.1f} µg/m³")
+        with col3:
+            demanda_media = int(motor.estimar_demanda_serie(ultimos['value'], parametros_demanda).mean())
+            st.metric("Consultas Esperadas", f"{demanda_media}/día")
+        if calibracion_vigente:
+            st.caption(f"Demanda calibrada con {calibracion_vigente['dias']} días de atenciones "
+                       f"(exposición de {calibracion_vigente['ventana_horas']} h, versión {calibracion_vigente['version']}).")
+
+        st.markdown("### 🔔 Alertas Activas")
+        activas = alertas_por_version(version)
+        if activas:
+            for alerta in activas:
+                st.error(f"🚨 {alerta['location_name']}: {alerta['parameter'].upper()} {alerta['value']:.1f} µg/m³ – "
+                         f"{alerta['nivel']} (desde {alerta['desde']:%d-%m %H:%M}, máx. {alerta['maximo']:.1f})")
+        else:
+            st.success("✅ No hay alertas activas.")
+
+def vista_resumen():
     st.subheader("📈 Resumen de Calidad del Aire y Demanda Esperada")
+    panel_resumen()
 
-    col1, col2, col3 = st.columns(3)
+# --- TAB 2: TENDENCIAS ---
+# Solo se lee el rango elegido: el dataset particionado por estación y mes
+# (motor.datos_rango) abre los archivos de esos meses y no el historial completo.
+# La parte del rango anterior al periodo crudo se completa con los promedios
+# diarios o mensuales compactados (retencion.serie_agregada).
+DIAS_TENDENCIA = 30
+
+def serie_estacion(version, location_id, desde, hasta):
+    datos = datos_version(version)
+    serie = motor.datos_rango(version, desde, hasta, [location_id])
+    if serie is None:  # almacén sin dataset publicado: se filtra la tabla completa
+        serie = datos[(datos['location_id'] == location_id) & (datos['fecha'] >= desde) & (datos['fecha'] <= hasta)]
+    # Días sin lecturas horarias: promedios compactados (retencion.py), si los hay
+    antigua = retencion.serie_agregada(desde, hasta, [location_id], excluir_fechas=serie['fecha'].unique())
+    if len(antigua):
+        serie = pd.concat([antigua, serie], ignore_index=True)
+    return serie
+
+@st.fragment(run_every=intervalo_vivo)
+def grafico_tendencias():
+    version = version_vigente()
+    estaciones, primera, ultima = estaciones_por_version(version)
+    col1, col2 = st.columns([1, 1])
     with col1:
-        st.metric("Estaciones", len(ultimos_pm25))
+        estacion_sel = st.selectbox("Seleccionar estación", list(estaciones), key="tendencia")
     with col2:
-        prom_pm25 = ultimos_pm25['value'].mean()
-        st.metric("PM2.5 Promedio", f"{prom_pm25:.1f} µg/m³")
-    with col3:
-        demanda_media = int(ultimos_pm25['value'].apply(estimar_demanda).mean())
-        st.metric("Consultas Esperadas", f"{demanda_media}/día")
-
-    st.markdown("### 🔔 Alertas Activas")
-    alertas = ultimos_pm25[ultimos_pm25['nivel'].isin(['Dañino', 'Muy Dañino', 'Peligroso'])]
-    if not alertas.empty:
-        for _, row in alertas.iterrows():
-            st.error(f"🚨 {row['location_name']}: {row['value']:.1f} µg/m³ – {row['nivel']}")
-    else:
-        st.success("✅ No hay alertas activas.")
-
-# --- TAB 2: TENDENCIAS ---
-with tab2:
+        inicio = max(primera, ultima - timedelta(days=DIAS_TENDENCIA - 1))
+        rango = st.date_input("Rango de fechas", value=(inicio, ultima), min_value=primera, max_value=ultima,
+                              format="DD-MM-YYYY", key="rango_tendencia",
+                              on_change=lambda: st.session_state.update(ultima_al_elegir=ultima))
+    if len(rango) != 2:
+        st.info("📅 Elige la fecha final del rango.")
+        return
+    # En vivo, un rango que termina en el último día con datos sigue a los datos nuevos
+    if en_vivo and rango[1] >= st.session_state.get("ultima_al_elegir", rango[1]):
+        rango = (rango[0], ultima)
+    cache = cache_vistas()
+    clave = dict(estacion=estaciones[estacion_sel], rango=tuple(rango))
+    with medir("render", vista="tendencias"):
+        df_filtrado = cache.obtener("tendencias_serie", version,
+                                    lambda: serie_estacion(version, estaciones[estacion_sel], *rango), **clave)
+        if df_filtrado.empty:
+            st.info("Sin mediciones de la estación en el rango elegido.")
+            return
+        with medir("figura_plotly"):
+            fig = cache.obtener("tendencias_figura", version,
+                                lambda: vistas.figura_tendencia(df_filtrado, estacion_sel), **clave)
+        st.plotly_chart(fig, use_container_width=True)
+
+def vista_tendencias():
     st.subheader("Evolución de Contaminantes")
-    estaciones = df['location_name'].unique()
-    estacion_sel = st.selectbox("Seleccionar estación", estaciones, key="tendencia")
-    df_filtrado = df[df['location_name'] == estacion_sel]
-    fig = px.line(df_filtrado, x='datetimeLocal', y='value', color='parameter',
-                  title=f"Contaminantes en {estacion_sel}",
-                  labels={'value': 'Concentración (µg/m³)', 'datetimeLocal': 'Fecha y Hora'})
-    st.plotly_chart(fig, use_container_width=True)
+    grafico_tendencias()
 
 # --- TAB 3: MAPA ---
-with tab3:
-    st.subheader("📍 Mapa de Monitoreo")
-    lat_mean = df['latitude'].mean()
-    lon_mean = df['longitude'].mean()
-    m = folium.Map(location=[lat_mean, lon_mean], zoom_start=8)
-    marker_cluster = MarkerCluster().add_to(m)
-
-    for _, row in ultimos_pm25.iterrows():
-        color_map = {'green': 'green', 'yellow': 'beige', 'orange': 'orange', 'red': 'red', 'purple': 'purple', 'maroon': 'darkred'}
-        folium.Marker(
-            location=[row['latitude'], row['longitude']],
-            popup=f"<b>{row['location_name']}</b><br>PM2.5: {row['value']:.1f} µg/m³<br>Nivel: {row['nivel']}<br>Consultas esperadas: {estimar_demanda(row['value'])}",
-            icon=folium.Icon(color=color_map.get(row['color'], 'gray'))
-        ).add_to(marker_cluster)
-
-    st_folium(m, width=800, height=600)
-
-# --- TAB 4: GESTIÓN DE TURNOS ---
-with tab4:
+def vista_mapa():
+    with medir("render", vista="mapa"):
+        st.subheader("📍 Mapa de Monitoreo")
+        from streamlit_folium import st_folium
+
+        m = mapa_estaciones(version_datos)
+        # returned_objects=[]: mover o hacer zoom en el mapa no provoca reruns
+        st_folium(m, width=800, height=600, returned_objects=[])
+
+# --- TAB 4: CORRELACIONES ---
+# Correlación entre series (estación · parámetro) y con desfase sobre la grilla
+# horaria de la ventana elegida (correlacion.py). Grilla, matrices y figuras
+# quedan en la caché de vistas por ventana, parámetros y versión de datos.
+def grilla_ventana(version, desde, hasta, parametros):
+    datos = motor.datos_rango(version, desde, hasta)
+    if datos is None:
+        datos = datos_version(version)
+        datos = datos[(datos['fecha'] >= desde) & (datos['fecha'] <= hasta)]
+    with medir("grilla_horaria"):
+        return correlacion.grilla_horaria(datos, list(parametros))
+
+@st.fragment
+def analisis_correlaciones():
+    estaciones, primera, ultima = estaciones_por_version(version_datos)
+    col1, col2 = st.columns(2)
+    with col1:
+        inicio = max(primera, ultima - timedelta(days=DIAS_TENDENCIA - 1))
+        rango = st.date_input("Ventana", value=(inicio, ultima), min_value=primera, max_value=ultima,
+                              format="DD-MM-YYYY", key="rango_correlacion")
+    with col2:
+        parametros = st.multiselect("Contaminantes", motor.contaminantes_clave, default=['pm25', 'pm10'],
+                                    key="parametros_correlacion")
+    if len(rango) != 2 or not parametros:
+        st.info("📅 Elige una ventana y al menos un contaminante.")
+        return
+    cache = cache_vistas()
+    clave = dict(rango=tuple(rango), parametros=tuple(sorted(parametros)))
+    with medir("render", vista="correlaciones"):
+        grilla = cache.obtener("correlacion_grilla", version_datos,
+                               lambda: grilla_ventana(version_datos, *rango, clave['parametros']), **clave)
+        if grilla.shape[1] < 2:
+            st.info("Se necesitan al menos dos series con lecturas válidas en la ventana.")
+            return
+        matriz, _ = cache.obtener("correlacion_matriz", version_datos,
+                                  lambda: correlacion.matriz_correlacion(grilla), **clave)
+        fig = cache.obtener("correlacion_figura", version_datos, lambda: vistas.figura_correlacion(matriz), **clave)
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"{grilla.shape[1]} series · {len(grilla):,} horas · cada par usa solo sus horas en común "
+                   f"(mínimo {correlacion.HORAS_MINIMAS}).")
+
+        st.markdown("### ⏱️ Correlación con desfase")
+        series = list(grilla.columns)
+        col1, col2 = st.columns(2)
+        with col1:
+            referencia = st.selectbox("Serie de referencia", series, key="referencia_correlacion")
+        with col2:
+            desfase = st.slider("Desfase máximo (horas)", 1, 72, 24, key="desfase_correlacion")
+        clave_desfase = dict(clave, parametros=(clave['parametros'], referencia, desfase))
+        desfases = cache.obtener("correlacion_desfase", version_datos,
+                                 lambda: correlacion.correlacion_desfase(grilla, referencia, desfase), **clave_desfase)
+        optimos = correlacion.desfase_optimo(desfases.drop(columns=referencia))
+        elegidas = st.multiselect("Series a graficar", [s for s in series if s != referencia],
+                                  default=optimos['serie'].head(3).tolist(), key="series_desfase")
+        if elegidas:
+            st.plotly_chart(vistas.figura_desfase(desfases[elegidas], referencia), use_container_width=True)
+        st.dataframe(optimos.round(3), hide_index=True, use_container_width=True)
+
+def vista_correlaciones():
+    st.subheader("🔗 Correlaciones entre Estaciones")
+    analisis_correlaciones()
+
+# --- TAB 5: GESTIÓN DE TURNOS ---
+@st.fragment
+def recomendacion_turno():
+    turno = st.selectbox("Turno", motor.TURNOS)
+    with medir("render", vista="turnos"):
+        fila, recomendacion = motor.recomendacion_turno(ultimos_pm25, turno, parametros=parametros_demanda)
+
+        st.info(f"""
+        **Nivel de Alerta:** {fila['Nivel']}  
+        **PM2.5:** {fila['PM2.5']:.1f} µg/m³  
+        **Consultas esperadas en el turno:** ~{fila['Consultas Esperadas']}  
+        **Recomendación de dotación:**  
+        - **Total sugerido:** {fila['Total Recomendado']} profesionales ({fila['Adicional']} adicionales)  
+        - {recomendacion}
+        """)
+
+        # Descargar recomendación
+        reporte = pd.DataFrame([fila])
+        csv = reporte.to_csv(index=False).encode('utf-8')
+
+        st.download_button(
+            label="📥 Descargar recomendación (CSV)",
+            data=csv,
+            file_name=f"recomendacion_cesfam_{turno}_{datetime.now().strftime('%H%M')}.csv",
+            mime="text/csv"
+        )
+
+@st.cache_resource(max_entries=2)
+def reporte_semanal(version, version_calibracion):
+    import io
+    import reporte
+
+    establecimiento = reporte.establecimientos_por_defecto(df)[0]
+    desde, hasta = reporte.periodo(df)
+    salida = io.BytesIO()
+    reporte.escribir_reporte(df, establecimiento, desde, hasta, salida, parametros_demanda)
+    return salida.getvalue(), reporte.nombre_archivo(establecimiento, desde, hasta)
+
+@st.cache_resource(max_entries=2)
+def asignacion_semanal(version, version_calibracion):
+    import optimizador
+
+    asignaciones, resumen = optimizador.optimizar_semana(df)
+    por_rol = asignaciones.pivot_table(index=['fecha', 'turno'], columns='rol', values='personas',
+                                       aggfunc='sum', fill_value=0)
+    return por_rol.join(resumen.set_index(['fecha', 'turno'])[['consultas_esperadas', 'capacidad', 'sin_cubrir']]), resumen
+
+def vista_turnos():
     st.subheader("📋 Recomendación de Asignación de Personal – Turno")
-
-    turno = st.selectbox("Turno", ["Mañana (8-16)", "Tarde (16-24)", "Noche (0-8)"])
-    
-    # Simulación: seleccionar estación más cercana al Cesfam
-    ubicacion_cesfam = ultimos_pm25.iloc[0]  # Ajustar por filtro real si se conoce
-    pm25_actual = ubicacion_cesfam['value']
-    nivel = ubicacion_cesfam['nivel']
-    consultas_esperadas = estimar_demanda(pm25_actual)
-
-    dotacion_base = 5  # médico, enfermera, técnico, administrativo, aseo
-    if pm25_actual <= 12:
-        adicional = 0
-        recomendacion = "Dotación base suficiente."
-    elif pm25_actual <= 35:
-        adicional = 1
-        recomendacion = "Agregar 1 profesional (preferentemente enfermería o técnico paramédico)."
-    elif pm25_actual <= 55:
-        adicional = 2
-        recomendacion = "Asignar 2 adicionales. Revisar insumos respiratorios."
-    else:
-        adicional = 3
-        recomendacion = "Activar plan de contingencia: 3 adicionales, revisar oxígeno y medicamentos."
-
-    total = dotacion_base + adicional
-
-    st.info(f"""
-    **Nivel de Alerta:** {nivel}  
-    **PM2.5:** {pm25_actual:.1f} µg/m³  
-    **Consultas esperadas:** ~{consultas_esperadas}  
-    **Recomendación de dotación:**  
-    - **Total sugerido:** {total} profesionales ({adicional} adicionales)  
-    - {recomendacion}
-    """)
-
-    # Descargar recomendación
-    reporte = pd.DataFrame([{
-        'Establecimiento': 'Cesfam La Floresta',
-        'Turno': turno,
-        'PM2.5': pm25_actual,
-        'Nivel': nivel,
-        'Consultas Esperadas': consultas_esperadas,
-        'Dotacion Base': dotacion_base,
-        'Adicional': adicional,
-        'Total Recomendado': total,
-        'Fecha': datetime.now().strftime("%Y-%m-%d %H:%M")
-    }])
-    csv = reporte.to_csv(index=False).encode('utf-8')
-
-    st.download_button(
-        label="📥 Descargar recomendación (CSV)",
-        data=csv,
-        file_name=f"recomendacion_cesfam_{turno}_{datetime.now().strftime('%H%M')}.csv",
-        mime="text/csv"
-    )
+    recomendacion_turno()
+
+    st.markdown("### 🧮 Asignación semanal de personal")
+    st.caption("Reparte la dotación disponible por rol entre los turnos de la última semana según la demanda esperada.")
+    tabla, resumen = asignacion_semanal(version_datos, parametros_demanda['version'])
+    col1, col2 = st.columns(2)
+    col1.metric("Turnos-persona asignados", int(tabla.drop(columns=['consultas_esperadas', 'capacidad', 'sin_cubrir']).sum().sum()))
+    col2.metric("Consultas sin cubrir", int(resumen['sin_cubrir'].sum()))
+    st.dataframe(tabla, use_container_width=True)
+
+    st.markdown("### 🗓️ Reporte semanal de gestión")
+    st.caption("Niveles diarios por estación, episodios, consultas esperadas y dotación sugerida por turno.")
+    if st.button("Preparar reporte semanal (Excel)"):
+        contenido, nombre = reporte_semanal(version_datos, parametros_demanda['version'])
+        st.download_button("📥 Descargar reporte semanal", data=contenido, file_name=nombre,
+                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+pagina = st.navigation([
+    st.Page(vista_resumen, title="Resumen Ejecutivo", icon="📊", url_path="resumen", default=True),
+    st.Page(vista_tendencias, title="Tendencias", icon="📈", url_path="tendencias"),
+    st.Page(vista_mapa, title="Mapa de Alerta", icon="🌍", url_path="mapa"),
+    st.Page(vista_correlaciones, title="Correlaciones", icon="🔗", url_path="correlaciones"),
+    st.Page(vista_turnos, title="Gestión de Turnos", icon="📋", url_path="turnos"),
+], position="top")
+pagina.run()
 
 # --- SIDEBAR: SUSCRIPCIÓN POR CORREO ---
-st.sidebar.header("📬 Suscríbete a AirCesfam")
-st.sidebar.markdown("Recibe alertas semanales y recomendaciones de gestión.")
-
-with st.sidebar.form(key="form_suscripcion"):
-    email = st.text_input("Correo electrónico", placeholder="tu@correo.cl")
-    submit = st.form_submit_button("Suscribirse")
-
-if submit:
-    if not email or "@" not in email or "." not in email:
-        st.sidebar.error("📧 Por favor, ingresa un correo válido.")
-    else:
-        exito_correo = enviar_email_bienvenida(email)
-        exito_guardado = guardar_suscriptor(email)
-        
-        if exito_guardado:
-            if exito_correo:
-                st.sidebar.success(f"✅ ¡Gracias, {email}! Revisa tu bandeja de entrada.")
-            else:
-                st.sidebar.warning(f"✅ Suscrito. Pronto recibirás información.")
+@st.fragment
+def formulario_suscripcion():
+    st.header("📬 Suscríbete a AirCesfam")
+    st.markdown("Recibe alertas semanales y recomendaciones de gestión.")
+
+    ids_estacion = dict(zip(ultimos_pm25['location_name'], ultimos_pm25['location_id']))
+    with st.form(key="form_suscripcion"):
+        email = st.text_input("Correo electrónico", placeholder="tu@correo.cl")
+        nombres = st.multiselect("Estaciones de interés", list(ids_estacion), placeholder="Todas")
+        ubicacion = st.text_input("…o tu ubicación (lat, lon)", placeholder="-36.79, -73.11")
+        submit = st.form_submit_button("Suscribirse")
+
+    if submit:
+        estaciones = [int(ids_estacion[n]) for n in nombres]
+        if ubicacion.strip():
+            try:
+                lat, lon = (float(x) for x in ubicacion.split(","))
+                estaciones += motor.estaciones_cercanas(ultimos_pm25, lat, lon)
+            except ValueError:
+                st.error("📍 Ubicación no válida: usa el formato latitud, longitud.")
+                return
+
+        if not suscriptores.email_valido(email):
+            st.error("📧 Por favor, ingresa un correo válido.")
         else:
-            st.sidebar.error("Hubo un problema al registrar tu suscripción.")
+            fila, es_nuevo = guardar_suscriptor(email, estaciones)
+
+            if fila is None:
+                st.error("Hubo un problema al registrar tu suscripción.")
+            elif not es_nuevo:
+                st.info(f"📬 {email} ya está suscrito." + (" Actualizamos tus estaciones." if estaciones else ""))
+            elif enviar_email_bienvenida(email, fila['token_baja']):
+                st.success(f"✅ ¡Gracias, {email}! Revisa tu bandeja de entrada.")
+            else:
+                st.warning(f"✅ Suscrito. Pronto recibirás información.")
+
+with st.sidebar:
+    formulario_suscripcion()
 
 # --- PIE DE PÁGINA ---
+@st.fragment(run_every=intervalo_vivo)
+def sello_actualizacion():
+    version = version_vigente()
+    ultima_lectura = ultimos_por_version(version)['datetimeLocal'].max()
+    st.write(f"📅 Datos al: {ultima_lectura:%d/%m/%Y %H:%M}")
+    if en_vivo:
+        publicada = datetime.fromtimestamp(vigilante.compartido(ruta_carpeta).publicada)
+        st.caption(f"🔴 En vivo · versión publicada a las {publicada:%H:%M:%S}")
+
 st.sidebar.markdown("---")
-st.sidebar.write(f"📅 Actualizado: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-st.sidebar.caption("Sistema desarrollado para el Cesfam La Floresta – Gestión 2025")
\ No newline at end of file
+st.sidebar.toggle("En vivo", key="en_vivo", help="Actualiza resumen, alertas y tendencias cuando llegan datos nuevos")
+with st.sidebar:
+    sello_actualizacion()
+st.sidebar.caption("Sistema desarrollado para el Cesfam La Floresta – Gestión 2025")
+
+# --- DIAGNÓSTICO (oculto: se activa con ?diagnostico=1 en la URL) ---
+metricas.registrar_tiempo("script", time.perf_counter() - inicio_script)
+metricas.registrar_primera_pintura()
+metricas.registrar_retraso(df)
+metricas.registrar_proceso()
+cache_vistas().registrar_metricas()
+metricas.escribir_prometheus()
+
+if st.query_params.get("diagnostico") == "1":
+    with st.sidebar.expander("🛠️ Diagnóstico", expanded=True):
+        st.caption(f"Versión de datos: {version_datos} · {len(df):,} filas")
+        st.markdown("**Tiempos por etapa**")
+        st.dataframe(metricas.tabla_tiempos().round(2), hide_index=True)
+        estado_cache = cache_vistas().estado()
+        st.caption(f"Caché de vistas: {estado_cache['aciertos']:,} aciertos, {estado_cache['fallos']:,} fallos, "
+                   f"{estado_cache['expulsiones']:,} expulsiones · {estado_cache['entradas']} entradas, "
+                   f"{estado_cache['bytes'] / 2**20:.1f} de {estado_cache['presupuesto_bytes'] / 2**20:.0f} MB")
+        st.markdown("**Métricas**")
+        st.dataframe(metricas.tabla_valores(), hide_index=True)
+        st.markdown("**Calidad de datos**")
+        st.dataframe(calidad.resumen_calidad(df))
\ No newline at end of file
@@ -0,0 +1,149 @@
+# backtest.py
+# Backtest de las reglas de dotación y demanda sobre todo el historial.
+#
+# Cada turno de cada estación (promedio de PM2.5 de sus horas válidas) es una
+# observación. Una regla de dotación son tres umbrales (t1 < t2 < t3 → +1/+2/+3
+# profesionales sobre la dotación base); se compara con el personal requerido
+# por la demanda observada (si se entrega un archivo) o estimada para el turno
+# (motor.estimar_demanda_turno_serie), y se puntúa en horas-profesional de déficit y de exceso.
+# Las reglas se evalúan como matrices (reglas x turnos) con numpy, por bloques
+# para acotar la memoria, y los bloques se reparten entre procesos.
+#
+# Con demanda observada también se barren los multiplicadores de
+# estimar_demanda (error absoluto medio de las consultas estimadas por turno).
+#
+#   python cli.py backtest --paso 5 --procesos 4 [--demanda consultas.csv]
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import motor
+from metricas import medir
+
+HORAS_TURNO = 8
+CONSULTAS_POR_PROFESIONAL = 9   # consultas por profesional y turno
+COSTO_DEFICIT = 3.0             # una hora-profesional faltante pesa más que una sobrante
+COSTO_EXCESO = 1.0
+REGLAS_POR_BLOQUE = 256
+# Sin --procesos, solo se reparte entre procesos si hay al menos estas celdas
+# (reglas x turnos): por debajo, levantar el pool cuesta más que evaluar en serie
+MINIMO_CELDAS_POOL = 200_000_000
+
+
+def turnos_historicos(df):
+    """PM2.5 promedio por estación, fecha y turno (una fila por turno observado)."""
+    datos = df[df['dato_valido'] & (df['parameter'] == 'pm25')]
+    datos = datos.assign(turno=motor.turno_de_hora(datos['hora'].to_numpy()))
+    return (datos.groupby(['location_name', 'fecha', 'turno'], sort=True)['value']
+            .mean().reset_index(name='pm25'))
+
+
+def leer_demanda(ruta):
+    """CSV con fecha, consultas y opcionalmente turno (sin turno, las consultas son del día)."""
+    demanda = pd.read_csv(ruta)
+    demanda['fecha'] = pd.to_datetime(demanda['fecha']).dt.date
+    return demanda
+
+
+def unir_demanda(turnos, demanda):
+    """Consultas observadas de cada turno; las diarias se reparten por igual entre los turnos."""
+    claves = ['fecha', 'turno'] if 'turno' in demanda.columns else ['fecha']
+    demanda = demanda.groupby(claves, as_index=False)['consultas'].sum()
+    if 'turno' not in claves:
+        demanda['consultas'] = demanda['consultas'] / len(motor.TURNOS)
+    return turnos.merge(demanda, on=claves, how='inner')
+
+
+def grilla_umbrales(paso=5, minimo=5, maximo=150):
+    valores = np.arange(minimo, maximo + 1, paso, dtype=float)
+    return np.array(list(itertools.combinations(valores, 3)))
+
+
+def grilla_factores(paso=0.1, maximo=3.0):
+    """Multiplicadores crecientes (f0 = 1.0 fijo) para los cortes de motor.CORTES_DEMANDA."""
+    valores = np.round(np.arange(1.0, maximo + 1e-9, paso), 2)
+    return np.array([(1.0, *c) for c in itertools.combinations_with_replacement(valores, 4)])
+
+
+# --- EVALUACIÓN VECTORIZADA ---
+def _puntuar_umbrales(umbrales, pm25, requerido, dotacion_base, costo_deficit, costo_exceso):
+    """Horas-profesional de déficit y exceso por regla (filas de umbrales)."""
+    adicional = (pm25[None, :] > umbrales[:, 0:1]).astype(np.int8)
+    adicional += pm25[None, :] > umbrales[:, 1:2]
+    adicional += pm25[None, :] > umbrales[:, 2:3]
+    diferencia = (dotacion_base + adicional) - requerido[None, :]
+    deficit = np.clip(-diferencia, 0, None).sum(axis=1) * HORAS_TURNO
+    exceso = np.clip(diferencia, 0, None).sum(axis=1) * HORAS_TURNO
+    cubiertos = (diferencia >= 0).mean(axis=1)
+    return np.column_stack([deficit, exceso, costo_deficit * deficit + costo_exceso * exceso, cubiertos])
+
+
+def _puntuar_factores(factores, pm25, consultas, base):
+    """Error absoluto medio por juego de multiplicadores.
+
+    Dentro de un tramo de PM2.5 la estimación es una sola cifra, así que la suma
+    de |estimada - observada| sale de las consultas ordenadas y sus sumas
+    acumuladas, sin recorrer los turnos por cada regla.
+    """
+    tramo = np.searchsorted(motor.CORTES_DEMANDA, pm25, side='left')
+    total = np.zeros(len(factores))
+    for k in range(factores.shape[1]):
+        observadas = np.sort(consultas[tramo == k])
+        if not len(observadas):
+            continue
+        acumulado = np.concatenate([[0.0], np.cumsum(observadas)])
+        estimada = np.ceil(np.floor(base * factores[:, k]) / len(motor.TURNOS))  # como estimar_demanda_turno_serie
+        bajo = np.searchsorted(observadas, estimada)
+        total += (estimada * bajo - acumulado[bajo]) + (acumulado[-1] - acumulado[bajo]) - estimada * (len(observadas) - bajo)
+    return (total / len(consultas))[:, None]
+
+
+def _en_bloques(funcion, reglas, argumentos, procesos):
+    bloques = [reglas[i:i + REGLAS_POR_BLOQUE] for i in range(0, len(reglas), REGLAS_POR_BLOQUE)]
+    if procesos is None and len(reglas) * len(argumentos[0]) < MINIMO_CELDAS_POOL:
+        procesos = 1
+    if procesos == 1 or len(bloques) == 1:
+        return np.vstack([funcion(b, *argumentos) for b in bloques])
+    n = len(bloques)
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return np.vstack(list(pool.map(funcion, bloques, *[[a] * n for a in argumentos])))
+
+
+def personal_requerido(consultas, capacidad=CONSULTAS_POR_PROFESIONAL):
+    return np.ceil(np.asarray(consultas, dtype=float) / capacidad).astype(np.int16)
+
+
+def evaluar_umbrales(turnos, umbrales, dotacion_base=motor.DOTACION_BASE, capacidad=CONSULTAS_POR_PROFESIONAL,
+                     costo_deficit=COSTO_DEFICIT, costo_exceso=COSTO_EXCESO, procesos=None,
+                     parametros=motor.PARAMETROS_DEMANDA_INICIALES):
+    """Tabla de reglas (t1, t2, t3) con su puntaje, de mejor a peor.
+
+    consultas (observadas o, sin ellas, estimadas con `parametros`) son por turno.
+    """
+    pm25 = turnos['pm25'].to_numpy()
+    consultas = turnos['consultas'] if 'consultas' in turnos else motor.estimar_demanda_turno_serie(pm25, parametros)
+    requerido = personal_requerido(consultas, capacidad)
+    with medir("backtest_umbrales"):
+        puntajes = _en_bloques(_puntuar_umbrales, umbrales,
+                               (pm25, requerido, dotacion_base, costo_deficit, costo_exceso), procesos)
+    resultado = pd.DataFrame(umbrales, columns=['t1', 't2', 't3'])
+    resultado[['horas_deficit', 'horas_exceso', 'costo', 'turnos_cubiertos']] = puntajes
+    return resultado.sort_values('costo').reset_index(drop=True)
+
+
+def evaluar_factores(turnos, factores, base=motor.CONSULTAS_BASE_INICIAL, procesos=None):
+    """Error absoluto medio de las consultas estimadas por cada juego de multiplicadores."""
+    pm25 = turnos['pm25'].to_numpy()
+    with medir("backtest_factores"):
+        errores = _en_bloques(_puntuar_factores, factores, (pm25, turnos['consultas'].to_numpy(dtype=float), base),
+                              procesos)
+    resultado = pd.DataFrame(factores, columns=[f"f{i}" for i in range(factores.shape[1])])
+    resultado['error_medio'] = errores[:, 0]
+    return resultado.sort_values('error_medio').reset_index(drop=True)
+
+
+def regla_actual(parametros=motor.PARAMETROS_DEMANDA_INICIALES):
+    return np.array([motor.CORTES_DOTACION], dtype=float), np.array([parametros['factores']])
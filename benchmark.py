@@ -0,0 +1,247 @@
+# benchmark.py
+# Benchmark del pipeline completo sobre datos sintéticos (generador_sintetico.py).
+#
+# Uso:
+#   python benchmark.py --filas 1e3 1e4 1e5 1e6 --salida resultados_benchmark.json
+#   python benchmark.py --filas 1e5 --comparar resultados_anteriores.json
+#   python benchmark.py --filas 1e5 1e6 --motor pandas arrow --memoria
+#
+# Para cada tamaño se generan los archivos, se mide cada etapa (mejor tiempo de
+# --repeticiones) y se guarda un JSON comparable entre versiones. Con
+# --comparar se informa la razón contra un resultado anterior y se marcan las
+# etapas que empeoraron más que --tolerancia. Con --motor pandas arrow se miden
+# ambos motores de preparación (motor.py y motor_arrow.py) sobre los mismos
+# archivos y se informa la razón de tiempos y de memoria pico entre ellos.
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import calidad
+import deduplicacion
+import generador_sintetico
+import metricas
+import motor
+import motor_arrow
+from vistas import construir_mapa, figura_tendencia
+
+HORAS_POR_ANIO = 24 * 365
+
+
+def dimensiones(filas, parametros):
+    """Estaciones y horas para aproximar el número de filas pedido (hasta un año por estación)."""
+    horas = max(1, min(HORAS_POR_ANIO, math.ceil(filas / len(parametros))))
+    estaciones = max(1, math.ceil(filas / (len(parametros) * horas)))
+    return estaciones, horas
+
+
+def _medir(funcion, repeticiones):
+    mejor, resultado = math.inf, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+
+def _etapas_pandas(archivos, repeticiones):
+    etapas = {}
+    etapas['carga'], (df, _) = _medir(lambda: motor.cargar_archivos(archivos), repeticiones)
+    etapas['limpieza'], df = _medir(lambda: motor.limpiar(df.copy()), repeticiones)
+    etapas['deduplicacion'], (df, _) = _medir(lambda: deduplicacion.deduplicar(df), repeticiones)
+    df = df[df['parameter'].isin(motor.contaminantes_clave)].copy()
+    etapas['calidad'], df = _medir(lambda: calidad.revisar_calidad(df), repeticiones)
+    df['fecha'] = df['datetimeLocal'].dt.date
+    df['hora'] = df['datetimeLocal'].dt.hour
+    etapas['clasificacion'], df = _medir(lambda: motor.clasificar(df.copy()), repeticiones)
+    etapas['ultimos'], ultimos = _medir(lambda: motor.ultimos_valores(df, 'pm25'), repeticiones)
+    etapas['resumen_diario'], _ = _medir(lambda: motor.resumen_diario(df), repeticiones)
+
+    estacion = df['location_name'].iloc[0]
+    etapas['grafico'], _ = _medir(
+        lambda: figura_tendencia(df[df['location_name'] == estacion], estacion).to_json(), repeticiones)
+    etapas['mapa'], _ = _medir(lambda: construir_mapa(df, ultimos).get_root().render(), repeticiones)
+    return etapas, len(df)
+
+
+def _etapas_arrow(archivos, repeticiones):
+    # La carga ya filtra contaminantes y valores nulos e interpreta la hora:
+    # conviene comparar el total más que carga y limpieza por separado
+    etapas = {}
+    etapas['carga'], (tabla, _) = _medir(lambda: motor_arrow.cargar_archivos(archivos), repeticiones)
+    etapas['limpieza'], tabla = _medir(lambda: motor_arrow.limpiar(tabla), repeticiones)
+    etapas['deduplicacion'], (tabla, _) = _medir(lambda: motor_arrow.deduplicar(tabla), repeticiones)
+    etapas['calidad'], tabla = _medir(lambda: motor_arrow.revisar_calidad(tabla), repeticiones)
+    tabla = motor_arrow.agregar_fecha_hora(tabla)
+    etapas['clasificacion'], tabla = _medir(lambda: motor_arrow.clasificar(tabla), repeticiones)
+    etapas['ultimos'], ultimos = _medir(lambda: motor_arrow.ultimos_valores(tabla, 'pm25'), repeticiones)
+    etapas['resumen_diario'], _ = _medir(lambda: motor_arrow.resumen_diario(tabla), repeticiones)
+
+    # Plotly recibe la tabla filtrada tal cual (la lee con narwhals), sin DataFrame intermedio
+    estacion = tabla['location_name'][0].as_py()
+    etapas['grafico'], _ = _medir(
+        lambda: figura_tendencia(tabla.filter(pc.field('location_name') == estacion), estacion).to_json(), repeticiones)
+    coordenadas = tabla.select(['latitude', 'longitude']).to_pandas()
+    etapas['mapa'], _ = _medir(lambda: construir_mapa(coordenadas, ultimos).get_root().render(), repeticiones)
+    return etapas, tabla.num_rows
+
+
+MOTORES = {'pandas': _etapas_pandas, 'arrow': _etapas_arrow}
+
+
+def medir_motor(nombre, archivos, repeticiones, medir_memoria=False):
+    """Tiempos por etapa de un motor. Devuelve (etapas, filas, memoria pico, RSS pico).
+
+    La memoria pico suma lo que registra tracemalloc (Python y numpy) y el
+    máximo del pool de memoria de Arrow, que tracemalloc no ve (tablas Arrow y
+    columnas de texto de pandas). Ambos son por proceso: main() mide cada motor
+    en un proceso nuevo.
+    """
+    if medir_memoria:
+        tracemalloc.start()
+    etapas, filas = MOTORES[nombre](archivos, repeticiones)
+    if not medir_memoria:
+        return etapas, filas, None, None
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return etapas, filas, pico + pa.default_memory_pool().max_memory(), metricas.memoria_maxima()
+
+
+def ejecutar(filas, parametros, formato, repeticiones, directorio, medir_memoria=False, motores=("pandas",)):
+    """Genera los archivos una vez y mide cada motor sobre ellos. Devuelve un resultado por motor."""
+    estaciones, horas = dimensiones(filas, parametros)
+    archivos = generador_sintetico.generar(directorio, estaciones, horas, parametros, formato=formato)
+    resultados = []
+    for nombre in motores:
+        if medir_memoria:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as proceso:
+                medicion = proceso.submit(medir_motor, nombre, archivos, repeticiones, True).result()
+        else:
+            medicion = medir_motor(nombre, archivos, repeticiones)
+        etapas, filas_preparadas, pico, rss = medicion
+        resultados.append({
+            'filas_pedidas': int(filas),
+            'motor': nombre,
+            'filas': int(filas_preparadas),
+            'estaciones': estaciones,
+            'horas': horas,
+            'formato': formato,
+            'etapas': {k: round(v, 6) for k, v in etapas.items()},
+            'total': round(sum(etapas.values()), 6),
+            'memoria_pico_bytes': pico,
+            'rss_pico_bytes': rss,
+        })
+    return resultados
+
+
+def version_codigo():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(actual, anterior, tolerancia):
+    """Imprime la razón actual/anterior por etapa; devuelve True si alguna empeoró."""
+    previos = {(r['filas_pedidas'], r.get('motor', "pandas")): r for r in anterior.get('resultados', [])}
+    hubo_regresion = False
+    for resultado in actual['resultados']:
+        previo = previos.get((resultado['filas_pedidas'], resultado['motor']))
+        if not previo:
+            continue
+        print(f"\n{resultado['filas_pedidas']:,} filas, motor {resultado['motor']} (vs {anterior.get('version')})")
+        for etapa, segundos in resultado['etapas'].items():
+            antes = previo['etapas'].get(etapa)
+            if not antes:
+                continue
+            razon = segundos / antes
+            marca = "⚠️ " if razon > 1 + tolerancia else "  "
+            hubo_regresion |= razon > 1 + tolerancia
+            print(f"{marca}{etapa:<16} {antes:10.4f}s -> {segundos:10.4f}s  x{razon:.2f}")
+    return hubo_regresion
+
+
+def comparar_motores(resultados):
+    """Imprime, por tamaño, cada etapa del motor Arrow contra el motor pandas."""
+    por_motor = {(r['filas_pedidas'], r['motor']): r for r in resultados}
+    for (filas, nombre), arrow in por_motor.items():
+        base = por_motor.get((filas, "pandas"))
+        if nombre != "arrow" or not base:
+            continue
+        print(f"\n{filas:,} filas: pandas -> arrow")
+        for etapa, segundos in [*arrow['etapas'].items(), ('total', arrow['total'])]:
+            antes = base['total'] if etapa == 'total' else base['etapas'][etapa]
+            print(f"  {etapa:<16} {antes:10.4f}s -> {segundos:10.4f}s  x{segundos / antes:.2f}")
+        if base['memoria_pico_bytes'] and arrow['memoria_pico_bytes']:
+            print(f"  {'memoria pico':<16} {base['memoria_pico_bytes'] / 2**20:9.1f}MB -> "
+                  f"{arrow['memoria_pico_bytes'] / 2**20:9.1f}MB  x{arrow['memoria_pico_bytes'] / base['memoria_pico_bytes']:.2f}")
+        if base['rss_pico_bytes'] and arrow['rss_pico_bytes']:
+            print(f"  {'RSS pico':<16} {base['rss_pico_bytes'] / 2**20:9.1f}MB -> "
+                  f"{arrow['rss_pico_bytes'] / 2**20:9.1f}MB  x{arrow['rss_pico_bytes'] / base['rss_pico_bytes']:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline AirCesfam sobre datos sintéticos")
+    parser.add_argument("--filas", nargs="+", type=float, default=[1e3, 1e4, 1e5],
+                        help="Tamaños a medir (10^3 a 10^8 filas)")
+    parser.add_argument("--parametros", nargs="+", default=list(motor.contaminantes_clave))
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--motor", nargs="+", choices=list(MOTORES), default=["pandas"],
+                        help="Motores a medir sobre los mismos archivos (pandas, arrow o ambos)")
+    parser.add_argument("--memoria", action="store_true",
+                        help="Medir memoria pico (tracemalloc y pool de Arrow) en un proceso nuevo por motor; "
+                             "agrega sobrecosto a los tiempos")
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    resultados = []
+    for filas in args.filas:
+        with tempfile.TemporaryDirectory(prefix="aircesfam_bench_") as directorio:
+            medidos = ejecutar(int(filas), args.parametros, args.formato, args.repeticiones, directorio, args.memoria,
+                               args.motor)
+        resultados.extend(medidos)
+        for resultado in medidos:
+            print(f"{resultado['filas']:>12,} filas  {resultado['motor']:<6}  total {resultado['total']:.3f}s  "
+                  + "  ".join(f"{k}={v:.3f}" for k, v in resultado['etapas'].items()))
+    comparar_motores(resultados)
+
+    salida = {
+        'version': version_codigo(),
+        'fecha': datetime.now().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'maquina': platform.machine(),
+        'resultados': resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(salida, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if comparar(salida, anterior, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# cache_consultas.py
+# Caché de resultados de las vistas (series filtradas, figuras, mapa) con un
+# presupuesto de memoria común y expulsión del menos usado (LRU).
+#
+# La clave es (versión de datos, vista, estación, parámetros, rango): volver a
+# una estación ya vista no repite la lectura ni la figura. Se conservan las
+# VERSIONES_VIGENTES versiones usadas más recientemente: los fragmentos en
+# vivo ya usan la versión nueva mientras el script principal sigue en la
+# anterior hasta su próxima ejecución, y ninguna de las dos expulsa a la otra.
+# Al aparecer una versión más se descarta la que lleva más tiempo sin usarse.
+# Los aciertos, fallos y expulsiones se publican en metricas.py.
+
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import metricas
+
+PRESUPUESTO_BYTES = int(float(os.getenv("AIRCESFAM_CACHE_MB", "256")) * 1024 * 1024)
+VERSIONES_VIGENTES = 2
+# Propiedades de una traza que guardan los datos; el resto (estilo, layout) se
+# cuenta con un monto fijo por traza
+DATOS_TRAZA = ('x', 'y', 'z', 'lat', 'lon', 'text', 'hovertext', 'customdata', 'labels', 'values')
+BYTES_TRAZA = 2048
+
+
+def _tamano_figura(figura):
+    """Bytes aproximados de una figura de plotly: sus arreglos de datos, sin serializarla."""
+    total = 0
+    for traza in figura.data:
+        total += BYTES_TRAZA
+        for nombre in DATOS_TRAZA:
+            valor = traza[nombre] if nombre in traza else None
+            if isinstance(valor, np.ndarray):
+                total += valor.size * 64 if valor.dtype == object else valor.nbytes
+            elif isinstance(valor, (list, tuple)):
+                total += len(valor) * 64
+    return total
+
+
+def tamano(valor):
+    """Bytes aproximados que ocupa un resultado."""
+    if hasattr(valor, "to_plotly_json"):  # figura de plotly, sin importar plotly aquí
+        return _tamano_figura(valor)
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """Resultados por clave con límite total de bytes; seguro entre hilos (sesiones)."""
+
+    def __init__(self, presupuesto_bytes=PRESUPUESTO_BYTES):
+        self.presupuesto = presupuesto_bytes
+        self.entradas = OrderedDict()  # (versión, vista, ...) -> (valor, bytes)
+        self.bytes = 0
+        self.versiones = OrderedDict()  # versión -> claves guardadas, de la menos a la más usada
+        self.contadores = {'aciertos': 0, 'fallos': 0, 'expulsiones': 0, 'invalidaciones': 0}
+        self._lock = threading.Lock()
+
+    def _quitar(self, clave):
+        _, n = self.entradas.pop(clave)
+        self.versiones[clave[0]].discard(clave)
+        self.bytes -= n
+
+    def _usar_version(self, version):
+        """Marca la versión como la más usada; si es nueva, descarta la menos usada sobre el límite."""
+        if version in self.versiones:
+            self.versiones.move_to_end(version)
+            return
+        self.versiones[version] = set()
+        while len(self.versiones) > VERSIONES_VIGENTES:
+            antigua = next(iter(self.versiones))
+            for clave in list(self.versiones[antigua]):
+                self._quitar(clave)
+                self.contadores['invalidaciones'] += 1
+            del self.versiones[antigua]
+
+    def obtener(self, vista, version, calcular, estacion=None, parametros=None, rango=None):
+        """Valor de la clave; si no está, se calcula con calcular() y se guarda."""
+        clave = (version, vista, estacion, parametros, rango)
+        with self._lock:
+            self._usar_version(version)
+            if clave in self.entradas:
+                self.entradas.move_to_end(clave)
+                self.contadores['aciertos'] += 1
+                return self.entradas[clave][0]
+            self.contadores['fallos'] += 1
+
+        # Se calcula fuera del lock: dos sesiones con la misma clave pueden
+        # calcularla a la vez, pero una consulta lenta no bloquea a las demás
+        valor = calcular()
+        n = tamano(valor)
+        with self._lock:
+            if clave in self.entradas or version not in self.versiones or n > self.presupuesto:
+                return valor
+            self.entradas[clave] = (valor, n)
+            self.versiones[version].add(clave)
+            self.bytes += n
+            while self.bytes > self.presupuesto:
+                self._quitar(next(iter(self.entradas)))
+                self.contadores['expulsiones'] += 1
+        return valor
+
+    def estado(self):
+        with self._lock:
+            return {**self.contadores, 'entradas': len(self.entradas), 'versiones': len(self.versiones),
+                    'bytes': self.bytes,
+                    'presupuesto_bytes': self.presupuesto}
+
+    def registrar_metricas(self):
+        for nombre, valor in self.estado().items():
+            metricas.registrar_valor("cache_consultas", valor, tipo=nombre)
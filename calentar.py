@@ -0,0 +1,40 @@
+# calentar.py
+# Prepara y publica los datos en el almacén compartido antes de levantar el
+# servidor, para que el primer visitante no pague la carga de los CSV:
+#
+#   python calentar.py && streamlit run app.py
+#
+# Si los datos ya están publicados y al día, solo verifica la versión.
+
+import sys
+import time
+
+inicio = time.perf_counter()
+
+import metricas
+import motor
+
+
+def main():
+    archivos = motor.listar_archivos(motor.RUTA_DATOS)
+    if not archivos:
+        print(f"❌ No se encontraron archivos de datos en {motor.RUTA_DATOS}")
+        return 1
+
+    version = motor.version_datos(archivos)
+    df, errores = motor.obtener_datos(motor.RUTA_DATOS, version)
+    for archivo, error in errores:
+        print(f"❌ Error al leer {archivo}: {error}")
+    if df is None:
+        print("⚠️ No se pudo cargar ningún archivo correctamente.")
+        return 1
+
+    segundos = time.perf_counter() - inicio
+    metricas.registrar_tiempo("calentamiento", segundos)
+    metricas.escribir_prometheus()
+    print(f"✅ Datos {version} listos: {len(df):,} filas en {segundos:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# calibracion.py
+# Ajuste de la base de consultas y los multiplicadores de estimar_demanda con
+# registros reales de atenciones (urgencias / SAPU) de cada establecimiento.
+#
+# 1. Los registros (CSV o Excel, millones de filas) se leen por bloques y solo
+#    se conserva el conteo diario por establecimiento.
+# 2. La exposición es el PM2.5 promedio de las estaciones de referencia en las
+#    24, 48 y 72 horas previas a cada día (ventanas móviles por tiempo) y se
+#    une a los conteos con merge_asof.
+# 3. Para cada ventana se ajusta base x factor por tramo de PM2.5 (promedio de
+#    consultas del tramo) y se conserva la de menor error.
+#
+# El resultado se guarda en almacen/calibracion/<versión>.json (la versión
+# depende del archivo de atenciones y de los datos de calidad del aire) y
+# almacen/calibracion.json reúne los parámetros vigentes de cada establecimiento
+# (una calibración nueva reemplaza solo los establecimientos que ajustó).
+# parametros_demanda es la única lectura para el dashboard, la API, la CLI y
+# los reportes, que pasan los parámetros a motor.estimar_demanda.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import almacen
+import motor
+from metricas import medir
+
+RUTA_VIGENTE = os.path.join(almacen.DIR_ALMACEN, "calibracion.json")
+DIR_VERSIONES = os.path.join(almacen.DIR_ALMACEN, "calibracion")
+VENTANAS_HORAS = [24, 48, 72]
+FILAS_POR_BLOQUE = 500_000
+DIAS_MINIMOS = 30
+
+
+# --- 1. REGISTROS DE ATENCIONES ---
+def _bloques_excel(ruta, columnas):
+    from openpyxl import load_workbook
+
+    libro = load_workbook(ruta, read_only=True)
+    filas = libro.active.iter_rows(values_only=True)
+    encabezado = [str(c).strip() if c is not None else "" for c in next(filas)]
+    indices = [encabezado.index(c) for c in columnas]
+    bloque = []
+    for fila in filas:
+        bloque.append([fila[i] for i in indices])
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            yield pd.DataFrame(bloque, columns=columnas)
+            bloque = []
+    if bloque:
+        yield pd.DataFrame(bloque, columns=columnas)
+    libro.close()
+
+
+def visitas_diarias(ruta, columna_fecha="fecha_hora", columna_establecimiento=None,
+                    establecimiento=motor.ESTABLECIMIENTO, formato_fecha=None):
+    """Atenciones por establecimiento y día, leyendo el archivo por bloques.
+
+    Sin columna de establecimiento, todas se asignan a `establecimiento`.
+    formato_fecha: formato strftime si no es ISO (p. ej. "%d-%m-%Y %H:%M").
+    """
+    columnas = [columna_fecha] + ([columna_establecimiento] if columna_establecimiento else [])
+    if ruta.lower().endswith((".xlsx", ".xlsm")):
+        bloques = _bloques_excel(ruta, columnas)
+    else:
+        bloques = pd.read_csv(ruta, usecols=columnas, chunksize=FILAS_POR_BLOQUE)
+
+    conteos = []
+    with medir("calibracion_lectura"):
+        for bloque in bloques:
+            # normalize() en vez de .dt.date: el conteo se hace sobre datetime64, no sobre objetos
+            fecha = pd.to_datetime(bloque[columna_fecha], errors='coerce', format=formato_fecha).dt.normalize()
+            lugar = bloque[columna_establecimiento] if columna_establecimiento else establecimiento
+            conteos.append(pd.DataFrame({'establecimiento': lugar, 'fecha': fecha})
+                           .dropna().value_counts())
+    if not conteos:
+        return pd.DataFrame(columns=['establecimiento', 'fecha', 'visitas'])
+    total = pd.concat(conteos).groupby(level=[0, 1]).sum().rename('visitas').reset_index()
+    total['fecha'] = total['fecha'].dt.date
+    return total
+
+
+# --- 2. EXPOSICIÓN Y UNIÓN ---
+def exposicion(df, estaciones, ventanas=VENTANAS_HORAS):
+    """PM2.5 horario promedio de las estaciones y sus medias móviles de N horas."""
+    datos = df[df['dato_valido'] & (df['parameter'] == 'pm25') & df['location_id'].isin(estaciones)]
+    horario = datos.groupby('datetimeLocal')['value'].mean().sort_index()
+    return pd.DataFrame({f"pm25_{h}h": horario.rolling(f"{h}h", min_periods=h // 2).mean() for h in ventanas})
+
+
+def unir_exposicion(visitas, expo, zona=motor.ZONA_HORARIA):
+    """Cada día con la exposición de las horas anteriores a su medianoche (merge_asof)."""
+    visitas = visitas.assign(momento=pd.to_datetime(visitas['fecha']).dt.tz_localize(zona, nonexistent='shift_forward',
+                                                                                         ambiguous=False))
+    visitas['momento'] = visitas['momento'].dt.as_unit('ns')
+    visitas = visitas.sort_values('momento')
+    expo = expo.reset_index().rename(columns={'datetimeLocal': 'momento'})
+    expo['momento'] = expo['momento'].dt.tz_convert(zona).dt.as_unit('ns')
+    return pd.merge_asof(visitas, expo, on='momento', direction='backward',
+                         tolerance=pd.Timedelta(hours=3)).dropna()
+
+
+# --- 3. AJUSTE ---
+def ajustar(pm25, visitas):
+    """Base y factores por tramo de CORTES_DEMANDA. Devuelve (base, factores, error medio)."""
+    tramo = np.searchsorted(motor.CORTES_DEMANDA, pm25, side='left')
+    iniciales = motor.FACTORES_DEMANDA_INICIALES
+    medias = pd.Series(visitas).groupby(tramo).mean()
+    base = float(medias.get(0, np.nan))
+    if not base > 0:
+        # Sin días limpios (o sin atenciones en ellos): la base sale del primer
+        # tramo con atenciones y su multiplicador inicial
+        positivas = medias[medias > 0]
+        if positivas.empty:
+            return 0.0, list(iniciales), float(np.abs(visitas).mean())
+        primero = positivas.index.min()
+        base = float(medias[primero] / iniciales[primero])
+    factores = [float(medias[k] / base) if k in medias.index else iniciales[k] for k in range(len(iniciales))]
+    factores = list(np.maximum.accumulate(factores))  # más contaminación no reduce la demanda
+    estimadas = base * np.asarray(factores)[tramo]
+    return round(base, 2), [round(float(f), 3) for f in factores], float(np.abs(estimadas - visitas).mean())
+
+
+def version_calibracion(ruta_visitas, version_datos):
+    texto = f"{almacen.version_fuentes([ruta_visitas])}|{version_datos}|{VENTANAS_HORAS}"
+    return hashlib.sha256(texto.encode()).hexdigest()[:16]
+
+
+def calibrar(df, ruta_visitas, version_datos, establecimientos=None, forzar=False, **opciones_visitas):
+    """Parámetros por establecimiento; si la versión ya existe, se usa la guardada.
+
+    Si ningún establecimiento tiene días suficientes devuelve {} sin guardar ni
+    publicar nada: la calibración vigente sigue como estaba.
+    """
+    version = version_calibracion(ruta_visitas, version_datos)
+    ruta_version = os.path.join(DIR_VERSIONES, f"{version}.json")
+    if os.path.exists(ruta_version) and not forzar:
+        with open(ruta_version, encoding="utf-8") as f:
+            resultado = json.load(f)
+        _publicar(resultado)
+        return resultado
+
+    import reporte  # reporte usa parametros_demanda: se importa aquí para no formar un ciclo
+
+    establecimientos = establecimientos or reporte.establecimientos_por_defecto(df)
+    visitas = visitas_diarias(ruta_visitas, **opciones_visitas)
+    resultado = {}
+    with medir("calibracion_ajuste"):
+        for e in establecimientos:
+            propias = visitas[visitas['establecimiento'] == e['nombre']]
+            if propias.empty:
+                continue
+            unidas = unir_exposicion(propias, exposicion(df, e['estaciones']))
+            if len(unidas) < DIAS_MINIMOS:
+                continue
+            ajustes = {h: ajustar(unidas[f"pm25_{h}h"].to_numpy(), unidas['visitas'].to_numpy(dtype=float))
+                       for h in VENTANAS_HORAS}
+            ventana = min(ajustes, key=lambda h: ajustes[h][2])
+            base, factores, error = ajustes[ventana]
+            resultado[e['nombre']] = {'base': base, 'factores': factores, 'ventana_horas': ventana,
+                                      'error_medio': round(error, 2), 'dias': len(unidas), 'version': version}
+
+    if not resultado:
+        return resultado
+    os.makedirs(DIR_VERSIONES, exist_ok=True)
+    with open(ruta_version, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    _publicar(resultado)
+    return resultado
+
+
+def _vigentes():
+    if not os.path.exists(RUTA_VIGENTE):
+        return {}
+    with open(RUTA_VIGENTE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _publicar(resultado):
+    """Reemplaza en la calibración vigente los establecimientos de resultado; el resto se conserva."""
+    vigentes = {**_vigentes(), **resultado}
+    ruta_tmp = RUTA_VIGENTE + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(vigentes, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_tmp, RUTA_VIGENTE)
+
+
+def cargar(establecimiento=motor.ESTABLECIMIENTO):
+    """Parámetros vigentes del establecimiento o None si no se ha calibrado."""
+    return _vigentes().get(establecimiento)
+
+
+def parametros_demanda(establecimiento=motor.ESTABLECIMIENTO):
+    """Parámetros de motor.estimar_demanda para el establecimiento: los calibrados
+    o, sin calibración vigente, motor.PARAMETROS_DEMANDA_INICIALES.
+
+    'version' es la versión de la calibración (None sin calibrar) y va en las
+    claves de caché de lo que dependa de la demanda.
+    """
+    vigente = cargar(establecimiento)
+    if not vigente:
+        return motor.PARAMETROS_DEMANDA_INICIALES
+    return {'base': vigente['base'], 'factores': tuple(vigente['factores']), 'version': vigente.get('version')}
@@ -0,0 +1,100 @@
+# calidad.py
+# Revisión de calidad de las mediciones al momento de la carga.
+# Las filas sospechosas no se eliminan: se marcan con columnas flag_* para que
+# el dashboard y las alertas puedan ignorarlas, y quedan guardadas en el almacén.
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Parámetros de la revisión (series horarias)
+VENTANA_MEDIANA = 25        # horas, centrada
+UMBRAL_MAD = 6.0            # desviaciones robustas para considerar un pico
+SALTO_MINIMO = 20.0         # µg/m³: diferencias menores nunca son pico
+HORAS_PLANO = 24            # lecturas idénticas seguidas => sensor pegado
+HORAS_BRECHA = 3            # hueco entre lecturas consecutivas
+
+COLUMNAS_SERIE = ['location_id', 'parameter']
+COLUMNAS_FLAG = ['flag_negativo', 'flag_pico', 'flag_plano', 'flag_brecha']
+FILAS_POR_BLOQUE = 1 << 17  # ventanas que se copian a la vez en la mediana móvil
+
+
+def mediana_movil(valores, inicio_serie, ventana=VENTANA_MEDIANA):
+    """Mediana móvil centrada de cada serie (mínimo ventana // 2 datos), sin cruzar series.
+
+    Igual que groupby().rolling(ventana, center=True, min_periods=ventana // 2).median(),
+    en una sola pasada: las series se separan con ventana // 2 NaN y las
+    ventanas se leen como vistas del arreglo (sliding_window_view). Las
+    ventanas completas usan np.partition; solo las de los bordes, np.sort.
+    """
+    n = len(valores)
+    mitad = ventana // 2
+    serie = np.cumsum(inicio_serie) - 1
+    posicion = np.arange(n) + mitad * (serie + 1)
+    relleno = np.full(n + mitad * (serie[-1] + 2), np.nan)
+    relleno[posicion] = valores
+    vistas = sliding_window_view(relleno, ventana)  # fila i: relleno[i:i + ventana]
+    datos = np.r_[0, np.cumsum(~np.isnan(relleno))]
+    datos = datos[ventana:] - datos[:-ventana]      # lecturas en cada ventana
+
+    mediana = np.full(len(vistas), np.nan)
+    for inicio in range(0, len(vistas), FILAS_POR_BLOQUE):
+        filas = slice(inicio, inicio + FILAS_POR_BLOQUE)
+        mediana[filas] = np.partition(vistas[filas], mitad, axis=1)[:, mitad]
+    bordes = np.flatnonzero((datos < ventana) & (datos >= mitad))
+    for inicio in range(0, len(bordes), FILAS_POR_BLOQUE):
+        filas = bordes[inicio:inicio + FILAS_POR_BLOQUE]
+        ordenadas = np.sort(vistas[filas], axis=1)  # NaN al final
+        k = datos[filas]
+        fila = np.arange(len(filas))
+        mediana[filas] = (ordenadas[fila, (k - 1) // 2] + ordenadas[fila, k // 2]) / 2
+    mediana[datos < mitad] = np.nan
+    return mediana[posicion - mitad]
+
+
+def revisar_calidad(df, columna_tiempo='datetimeLocal'):
+    """Agrega las columnas flag_* y dato_valido. Devuelve el DataFrame ordenado por serie y hora."""
+    df = df.sort_values(COLUMNAS_SERIE + [columna_tiempo], kind='stable').reset_index(drop=True)
+    if df.empty:
+        for col in COLUMNAS_FLAG + ['dato_valido']:
+            df[col] = pd.Series(dtype=bool)
+        return df
+
+    valores = df['value'].astype(float)
+    # Comparación columna a columna (sin pasar el texto a arreglos object)
+    inicio_serie = np.logical_or.reduce([df[c].ne(df[c].shift()).to_numpy(dtype=bool) for c in COLUMNAS_SERIE])
+
+    # Negativos
+    df['flag_negativo'] = valores < 0
+
+    # Picos: distancia a la mediana móvil en unidades de MAD (escala normal)
+    mediana = pd.Series(mediana_movil(valores.to_numpy(), inicio_serie), index=valores.index)
+    desvio = (valores - mediana).abs()
+    mad = pd.Series(mediana_movil(desvio.to_numpy(), inicio_serie), index=valores.index)
+    escala = (1.4826 * mad).clip(lower=1.0)
+    # Un pico es aislado: también se separa de las lecturas vecinas de su serie
+    fin_serie = np.r_[inicio_serie[1:], True]
+    anterior = valores.shift(1).mask(inicio_serie)
+    siguiente = valores.shift(-1).mask(fin_serie)
+    aislado = ((valores - anterior).abs().fillna(np.inf) > SALTO_MINIMO) & ((valores - siguiente).abs().fillna(np.inf) > SALTO_MINIMO)
+    df['flag_pico'] = ((desvio > UMBRAL_MAD * escala) & (desvio > SALTO_MINIMO) & aislado).fillna(False).to_numpy()
+
+    # Línea plana: largo de cada racha de valores idénticos dentro de la serie
+    cambio = inicio_serie | np.r_[True, valores.to_numpy()[1:] != valores.to_numpy()[:-1]]
+    racha = np.cumsum(cambio)
+    largo_racha = np.bincount(racha)[racha]
+    df['flag_plano'] = largo_racha >= HORAS_PLANO
+
+    # Brechas: hueco con la lectura anterior de la misma serie
+    salto = df[columna_tiempo].diff()
+    df['flag_brecha'] = ~inicio_serie & (salto > pd.Timedelta(hours=HORAS_BRECHA)).to_numpy()
+
+    df['dato_valido'] = ~(df['flag_negativo'] | df['flag_pico'] | df['flag_plano'])
+    return df
+
+
+def resumen_calidad(df):
+    """Cantidad de filas marcadas por estación y tipo de flag."""
+    if not set(COLUMNAS_FLAG).issubset(df.columns):
+        return pd.DataFrame()
+    return df.groupby('location_name')[COLUMNAS_FLAG].sum().astype(int)
@@ -0,0 +1,60 @@
+# carga_api.py
+# Prueba de carga local de api.py.
+#
+#   python api.py &                     # en otra terminal
+#   python carga_api.py --url http://localhost:8502/api/niveles --segundos 10 --concurrencia 50
+#
+# Con --etag el cliente reenvía el ETag recibido (If-None-Match), como lo haría
+# un sistema de turnos que consulta periódicamente.
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+
+async def trabajador(cliente, url, fin, latencias, estados, usar_etag):
+    etag = None
+    while time.perf_counter() < fin:
+        cabeceras = {"If-None-Match": etag} if usar_etag and etag else {}
+        inicio = time.perf_counter()
+        respuesta = await cliente.fetch(HTTPRequest(url, headers=cabeceras), raise_error=False)
+        latencias.append(time.perf_counter() - inicio)
+        estados[respuesta.code] = estados.get(respuesta.code, 0) + 1
+        etag = respuesta.headers.get("Etag", etag)
+
+
+async def probar(url, segundos, concurrencia, usar_etag):
+    AsyncHTTPClient.configure(None, max_clients=concurrencia)
+    cliente = AsyncHTTPClient()
+    latencias, estados = [], {}
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+    await asyncio.gather(*(trabajador(cliente, url, fin, latencias, estados, usar_etag)
+                           for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    return latencias, estados, duracion
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API AirCesfam")
+    parser.add_argument("--url", default="http://localhost:8502/api/niveles")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--etag", action="store_true", help="Enviar If-None-Match con el último ETag")
+    args = parser.parse_args(argv)
+
+    latencias, estados, duracion = asyncio.run(probar(args.url, args.segundos, args.concurrencia, args.etag))
+    if not latencias:
+        print("❌ No se completó ninguna petición")
+        return
+    ms = np.array(latencias) * 1000
+    print(f"Peticiones: {len(ms):,} en {duracion:.1f}s -> {len(ms) / duracion:,.0f} req/s")
+    print(f"Latencia ms: p50={np.percentile(ms, 50):.1f} p95={np.percentile(ms, 95):.1f} p99={np.percentile(ms, 99):.1f}")
+    print("Códigos: " + ", ".join(f"{codigo}={n:,}" for codigo, n in sorted(estados.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+# cli.py
+# Línea de comandos de AirCesfam: ejecuta el pipeline de motor.py sin
+# Streamlit, para tareas programadas, reportes por lotes y pruebas.
+#
+# Uso:
+#   python cli.py preparar                  # carga, prepara y publica en el almacén
+#   python cli.py ultimos --parametro pm10  # última lectura por estación
+#   python cli.py turnos --formato json     # recomendación de dotación por turno
+#   python cli.py resumen --salida diario.csv
+#   python cli.py api --puerto 8502         # API JSON de solo lectura (api.py)
+#   python cli.py suscriptores importar suscriptores.csv
+#   python cli.py alertas --enviar          # avanza las alertas y avisa a los afectados
+#   python cli.py reporte --establecimientos cesfams.json --procesos 4
+#   python cli.py backtest --paso 5 --procesos 4
+#   python cli.py optimizar --red red.json --salida asignacion.csv
+#   python cli.py calibrar atenciones.csv --columna-fecha fecha_hora
+#   python cli.py exportar --formato parquet --parametro pm25 --desde 2024-01-01 --salida pm25.parquet
+#   python cli.py retencion --dias-crudos 365  # pasa lo anterior de los archivos importados al almacén
+#   python cli.py importar /ruta/openaq-archivo --region=-37.2,-36.4,-73.4,-72.6 --hilos 8
+
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+import motor
+
+
+def _datos(args):
+    df, errores = motor.obtener_datos(args.datos)
+    for archivo, error in errores:
+        print(f"❌ Error al leer {archivo}: {error}", file=sys.stderr)
+    if df is None:
+        sys.exit("⚠️ No se pudo cargar ningún archivo correctamente.")
+    return df
+
+
+def _escribir(df, args):
+    if args.formato == "json":
+        texto = df.to_json(orient="records", force_ascii=False, date_format="iso", indent=2)
+    else:
+        texto = df.to_csv(index=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        sys.stdout.write(texto)
+
+
+def cmd_preparar(args):
+    df = _datos(args)
+    print(f"✅ {len(df):,} filas preparadas, {df['location_name'].nunique()} estaciones")
+
+
+def cmd_ultimos(args):
+    ultimos = motor.ultimos_valores(_datos(args), args.parametro)
+    columnas = ['location_name', 'parameter', 'value', 'nivel', 'datetimeLocal']
+    if args.parametro == 'pm25':
+        import calibracion
+
+        ultimos['consultas_esperadas'] = motor.estimar_demanda_serie(ultimos['value'], calibracion.parametros_demanda())
+        columnas.append('consultas_esperadas')
+    _escribir(ultimos[columnas], args)
+
+
+def cmd_turnos(args):
+    import calibracion
+
+    ultimos = motor.ultimos_valores(_datos(args), 'pm25')
+    turnos = [args.turno] if args.turno else motor.TURNOS
+    parametros = calibracion.parametros_demanda()
+    filas = []
+    for turno in turnos:
+        fila, recomendacion = motor.recomendacion_turno(ultimos, turno, parametros=parametros)
+        filas.append({**fila, 'Recomendacion': recomendacion})
+    _escribir(pd.DataFrame(filas), args)
+
+
+def cmd_resumen(args):
+    import retencion
+
+    _escribir(retencion.resumen_diario(_datos(args)), args)
+
+
+def cmd_api(args):
+    import api
+
+    api.servir(args.puerto, args.datos)
+
+
+def cmd_suscriptores(args):
+    import suscriptores
+
+    conexion = suscriptores.conectar()
+    try:
+        if args.accion == "importar":
+            importados, omitidos = suscriptores.importar_csv(conexion, args.archivo)
+            print(f"✅ {importados:,} importados, {omitidos:,} omitidos (repetidos o inválidos)")
+        elif args.accion == "exportar":
+            n = suscriptores.exportar_csv(conexion, args.archivo, solo_activos=not args.todos)
+            print(f"✅ {n:,} suscriptores exportados a {args.archivo}")
+        elif args.accion == "baja":
+            email = suscriptores.dar_de_baja(conexion, args.archivo)
+            print(f"✅ Baja de {email}" if email else "⚠️ Token no válido o ya usado")
+        elif args.accion == "sincronizar":
+            total = 0
+            while n := suscriptores.sincronizar_hoja(conexion):
+                total += n
+            print(f"✅ {total:,} cambios enviados a la hoja {suscriptores.HOJA_ESPEJO}")
+        else:
+            print(f"{suscriptores.contar(conexion):,} suscriptores activos")
+    finally:
+        conexion.close()
+
+
+def _correo_alerta(eventos, token_baja, url_app, graficos_estacion):
+    filas = "".join(
+        f"<li>{'🚨 Inicio' if e['tipo'] == 'inicio' else '✅ Fin'} de alerta en <b>{e['location_name']}</b>: "
+        f"{e['parameter'].upper()} {e['valor']:.1f} µg/m³ (máx. {e['maximo']:.1f}, {e['nivel']}) – {e['hora'][:16]}</li>"
+        for e in eventos)
+    imagenes = "".join(f'<p><img src="cid:{cid}" alt="Tendencia" width="600"></p>' for cid in graficos_estacion)
+    enlace_baja = f'<p><small><a href="{url_app}?baja={token_baja}">Anular suscripción</a></small></p>' if url_app else ""
+    return f"""
+    <html>
+    <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+        <h2>AirCesfam – Cambios en las alertas de calidad del aire</h2>
+        <ul>{filas}</ul>
+        {imagenes}
+        <p>Saludos,<br><strong>Equipo de Gestión - {motor.ESTABLECIMIENTO}</strong></p>
+        <hr>
+        {enlace_baja}
+    </body>
+    </html>
+    """
+
+
+def cmd_alertas(args):
+    import alertas
+
+    df = _datos(args)
+    activas, transiciones = alertas.actualizar(df)
+    for t in transiciones:
+        print(f"{'🚨' if t['tipo'] == 'inicio' else '✅'} {t['tipo']:<6} {t['location_name']} {t['parameter']} "
+              f"{t['valor']:.1f} ({t['hora'][:16]})")
+    print(f"{len(activas)} alertas activas")
+    if not args.enviar:
+        return
+
+    import correo
+    import graficos
+    import suscriptores
+
+    eventos, posicion = alertas.eventos_sin_enviar()
+    if not eventos:
+        print("Sin transiciones pendientes de envío.")
+        return
+    remitente, password = correo.credenciales()
+    if not remitente or not password:
+        sys.exit("❌ Faltan EMAIL_REMITENTE / EMAIL_APP_PASSWORD para enviar correos.")
+
+    # Solo se recorren los suscriptores de las estaciones con transiciones
+    conexion = suscriptores.conectar()
+    try:
+        afectados = suscriptores.afectados(conexion, {e['location_id'] for e in eventos})
+    finally:
+        conexion.close()
+
+    # Una imagen de tendencia por estación, dibujada una vez y adjunta a todos sus correos
+    con_alerta = sorted({e['location_id'] for e in eventos})
+    rutas = graficos.renderizar(df, [('tendencia', loc) for loc in con_alerta], motor.version_datos(motor.listar_archivos(args.datos)))
+    imagenes = graficos.cargar(rutas.values())
+    mensajes = []
+    for fila, estaciones in afectados.values():
+        propios = [e for e in eventos if e['location_id'] in estaciones]
+        cids = [graficos.cid(rutas[('tendencia', loc)]) for loc in sorted({e['location_id'] for e in propios})]
+        html = _correo_alerta(propios, fila['token_baja'], os.getenv("AIRCESFAM_URL"), cids)
+        mensajes.append(correo.construir_mensaje(remitente, fila['email'], "⚠️ AirCesfam – Alerta de calidad del aire", html,
+                                                 imagenes={c: imagenes[c] for c in cids}))
+    fallidos = correo.enviar(remitente, password, mensajes) if mensajes else []
+    alertas.marcar_enviados(posicion)
+    print(f"✅ {len(eventos)} transiciones, {len(mensajes) - len(fallidos)} correos enviados"
+          + (f", {len(fallidos)} rechazados" if fallidos else ""))
+
+
+def cmd_reporte(args):
+    import reporte
+
+    establecimientos = reporte.leer_establecimientos(args.establecimientos) if args.establecimientos else None
+    try:
+        rutas = reporte.generar_reportes(args.datos, establecimientos, args.desde, args.hasta,
+                                         directorio=args.directorio, procesos=args.procesos)
+    except ValueError as e:
+        sys.exit(f"⚠️ {e}")
+    for ruta in rutas:
+        print(f"✅ {ruta}")
+
+
+def cmd_exportar(args):
+    import exportar
+
+    _datos(args)  # asegura que la tabla esté publicada y al día
+    filtros = dict(estaciones=args.estacion, parametros=args.parametro,
+                   desde=pd.Timestamp(args.desde).date() if args.desde else None,
+                   hasta=pd.Timestamp(args.hasta).date() if args.hasta else None)
+    tabla = exportar.tabla_publicada()
+    if tabla is None:
+        sys.exit("⚠️ No hay una tabla de mediciones publicada en el almacén para exportar.")
+    partes = exportar.generar(tabla, args.formato, **filtros)
+    if args.salida:
+        total = 0
+        with open(args.salida, "wb") as f:
+            for parte in partes:
+                total += f.write(parte)
+        print(f"✅ {total:,} bytes escritos en {args.salida}")
+    elif args.formato == "parquet":
+        sys.exit("⚠️ Indica --salida para exportar en Parquet.")
+    else:
+        for parte in partes:
+            sys.stdout.buffer.write(parte)
+
+
+def cmd_backtest(args):
+    import backtest
+    import calibracion
+
+    turnos = backtest.turnos_historicos(_datos(args))
+    if args.demanda:
+        turnos = backtest.unir_demanda(turnos, backtest.leer_demanda(args.demanda))
+    parametros = calibracion.parametros_demanda()
+    umbrales_actuales, factores_actuales = backtest.regla_actual(parametros)
+    opciones = dict(capacidad=args.capacidad, costo_deficit=args.costo_deficit, costo_exceso=args.costo_exceso,
+                    parametros=parametros)
+
+    grilla = backtest.grilla_umbrales(args.paso, maximo=args.maximo)
+    resultado = backtest.evaluar_umbrales(turnos, grilla, procesos=args.procesos, **opciones)
+    actual = backtest.evaluar_umbrales(turnos, umbrales_actuales, procesos=1, **opciones)
+    print(f"{len(turnos):,} turnos, {len(grilla):,} reglas de dotación evaluadas")
+    print("Regla actual:\n" + actual.to_string(index=False))
+    print("Mejores reglas:\n" + resultado.head(args.top).to_string(index=False))
+
+    if args.demanda:
+        factores = backtest.grilla_factores()
+        errores = backtest.evaluar_factores(turnos, factores, parametros['base'], procesos=args.procesos)
+        print(f"\n{len(factores):,} juegos de multiplicadores de demanda evaluados")
+        print("Actuales:\n" + backtest.evaluar_factores(turnos, factores_actuales, parametros['base'],
+                                                        procesos=1).to_string(index=False))
+        print("Mejores:\n" + errores.head(args.top).to_string(index=False))
+    if args.salida:
+        resultado.to_csv(args.salida, index=False)
+
+
+def cmd_optimizar(args):
+    import optimizador
+
+    red = optimizador.leer_red(args.red) if args.red else None
+    try:
+        asignaciones, resumen = optimizador.optimizar_semana(_datos(args), red, args.desde, args.hasta)
+    except ValueError as e:
+        sys.exit(f"⚠️ {e}")
+    print(f"✅ {int(asignaciones['personas'].sum()):,} turnos-persona en {len(resumen):,} turnos; "
+          f"{int(resumen['sin_cubrir'].sum()):,} consultas sin cubrir", file=sys.stderr)
+    faltan = resumen[resumen['roles_faltantes'] != ""]
+    if len(faltan):
+        print(f"⚠️ {len(faltan)} turnos sin el mínimo de algún rol", file=sys.stderr)
+    _escribir(asignaciones, args)
+
+
+def cmd_calibrar(args):
+    import calibracion
+    import reporte
+
+    df = _datos(args)
+    establecimientos = reporte.leer_establecimientos(args.establecimientos) if args.establecimientos else None
+    resultado = calibracion.calibrar(
+        df, args.atenciones, motor.version_datos(motor.listar_archivos(args.datos)), establecimientos,
+        forzar=args.forzar, columna_fecha=args.columna_fecha, columna_establecimiento=args.columna_establecimiento,
+        formato_fecha=args.formato_fecha)
+    if not resultado:
+        sys.exit(f"⚠️ Ningún establecimiento tiene al menos {calibracion.DIAS_MINIMOS} días de atenciones con datos de PM2.5.")
+    for nombre, p in resultado.items():
+        print(f"✅ {nombre}: base {p['base']}, factores {p['factores']}, ventana {p['ventana_horas']} h, "
+              f"error medio {p['error_medio']} ({p['dias']} días, versión {p['version']})")
+
+
+def cmd_importar(args):
+    import importador
+
+    region = importador.leer_region(args.region) if args.region else None
+    archivos, filas, agregadas, errores = importador.importar(args.origen, args.datos, region, args.parametro,
+                                                             args.hilos)
+    for archivo, error in errores:
+        print(f"❌ Error al leer {archivo}: {error}", file=sys.stderr)
+    if not archivos:
+        sys.exit(f"⚠️ No hay archivos .csv.gz, .csv ni .parquet en {args.origen}.")
+    print(f"✅ {agregadas:,} mediciones nuevas o corregidas ({filas:,} leídas) desde {archivos:,} archivos a {args.datos}")
+
+
+def cmd_retencion(args):
+    import retencion
+
+    dias_crudos = args.dias_crudos or retencion.DIAS_CRUDOS
+    if not dias_crudos:
+        sys.exit("⚠️ Sin política de retención: indica --dias-crudos o AIRCESFAM_DIAS_CRUDOS.")
+    dias_horarios = retencion.DIAS_HORARIOS if args.dias_horarios is None else args.dias_horarios
+    dias_diarios = retencion.DIAS_DIARIOS if args.dias_diarios is None else args.dias_diarios
+    resumen = retencion.compactar(args.datos, dias_crudos, dias_horarios, dias_diarios, simular=args.simular)
+    if resumen is None:
+        sys.exit("⚠️ No se compactó: otra compactación en curso o sin archivos del importador en --datos.")
+    accion = "se quitarían" if args.simular else "quitadas"
+    print(f"✅ Periodo crudo desde {resumen['corte_crudo']} (horario desde {resumen['corte_horario']}, "
+          f"diario desde {resumen['corte_diario']}): "
+          f"{resumen['filas_compactadas']:,} lecturas agregadas, {resumen['filas_quitadas']:,} filas {accion} "
+          f"de {resumen['archivos']} archivos")
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="AirCesfam sin interfaz: pipeline de calidad del aire y dotación")
+    parser.add_argument("--datos", default=motor.RUTA_DATOS, help="Carpeta con los CSV de OpenAQ")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    def con_salida(p):
+        p.add_argument("--formato", choices=["csv", "json"], default="csv")
+        p.add_argument("--salida", help="Archivo de salida (por defecto, la consola)")
+        return p
+
+    sub.add_parser("preparar", help="Carga, prepara y publica los datos en el almacén").set_defaults(func=cmd_preparar)
+
+    p = con_salida(sub.add_parser("ultimos", help="Última lectura válida por estación"))
+    p.add_argument("--parametro", default="pm25", choices=motor.contaminantes_clave)
+    p.set_defaults(func=cmd_ultimos)
+
+    p = con_salida(sub.add_parser("turnos", help="Recomendación de dotación por turno"))
+    p.add_argument("--turno", choices=motor.TURNOS)
+    p.set_defaults(func=cmd_turnos)
+
+    con_salida(sub.add_parser("resumen", help="Promedio y máximo diario por estación y parámetro")).set_defaults(func=cmd_resumen)
+
+    p = sub.add_parser("api", help="API HTTP JSON de solo lectura")
+    p.add_argument("--puerto", type=int, default=8502)
+    p.set_defaults(func=cmd_api)
+
+    p = sub.add_parser("suscriptores", help="Registro local de suscriptores")
+    p.add_argument("accion", choices=["contar", "importar", "exportar", "baja", "sincronizar"])
+    p.add_argument("archivo", nargs="?", help="CSV a importar/exportar, o token en 'baja'")
+    p.add_argument("--todos", action="store_true", help="Exportar también las bajas")
+    p.set_defaults(func=cmd_suscriptores)
+
+    p = sub.add_parser("alertas", help="Evalúa las alertas (solo horas nuevas) y muestra las transiciones")
+    p.add_argument("--enviar", action="store_true", help="Enviar las transiciones pendientes a los suscriptores afectados")
+    p.set_defaults(func=cmd_alertas)
+
+    p = sub.add_parser("reporte", help="Reporte semanal de gestión en Excel, uno por establecimiento")
+    p.add_argument("--establecimientos", help="JSON con nombre, estaciones (location_id) y dotacion_base de cada uno")
+    p.add_argument("--desde", help="AAAA-MM-DD (por defecto, 7 días antes de --hasta)")
+    p.add_argument("--hasta", help="AAAA-MM-DD (por defecto, el último día con datos)")
+    p.add_argument("--directorio", default="reportes")
+    p.add_argument("--procesos", type=int, help="Procesos en paralelo (por defecto, uno por CPU)")
+    p.set_defaults(func=cmd_reporte)
+
+    p = sub.add_parser("backtest", help="Evalúa reglas de dotación (y de demanda) sobre todo el historial")
+    p.add_argument("--paso", type=float, default=5, help="Paso de la grilla de umbrales (µg/m³)")
+    p.add_argument("--maximo", type=float, default=150, help="Umbral máximo de la grilla")
+    p.add_argument("--demanda", help="CSV de consultas observadas (fecha, consultas[, turno])")
+    p.add_argument("--capacidad", type=float, default=9, help="Consultas por profesional y turno")
+    p.add_argument("--costo-deficit", type=float, default=3.0)
+    p.add_argument("--costo-exceso", type=float, default=1.0)
+    p.add_argument("--procesos", type=int)
+    p.add_argument("--top", type=int, default=10)
+    p.add_argument("--salida", help="CSV con todas las reglas de dotación evaluadas")
+    p.set_defaults(func=cmd_backtest)
+
+    p = con_salida(sub.add_parser("optimizar", help="Asignación de personal por establecimiento y turno"))
+    p.add_argument("--red", help="JSON con establecimientos, roles y grupos de personal")
+    p.add_argument("--desde", help="AAAA-MM-DD (por defecto, 7 días antes de --hasta)")
+    p.add_argument("--hasta", help="AAAA-MM-DD (por defecto, el último día con datos)")
+    p.set_defaults(func=cmd_optimizar)
+
+    p = sub.add_parser("calibrar", help="Ajusta la demanda con registros reales de atenciones (CSV o Excel)")
+    p.add_argument("atenciones", help="Archivo con una fila por atención")
+    p.add_argument("--columna-fecha", default="fecha_hora")
+    p.add_argument("--columna-establecimiento", help="Si falta, todas las atenciones son del Cesfam La Floresta")
+    p.add_argument("--formato-fecha", help='Formato si no es ISO, p. ej. "%%d-%%m-%%Y %%H:%%M"')
+    p.add_argument("--establecimientos", help="JSON de establecimientos (como en 'reporte')")
+    p.add_argument("--forzar", action="store_true", help="Recalcular aunque exista la misma versión")
+    p.set_defaults(func=cmd_calibrar)
+
+    p = sub.add_parser("exportar", help="Historial filtrado en CSV o Parquet, escrito por lotes")
+    p.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    p.add_argument("--estacion", action="append", help="Nombre o location_id (se puede repetir)")
+    p.add_argument("--parametro", action="append", choices=motor.contaminantes_clave)
+    p.add_argument("--desde", help="AAAA-MM-DD")
+    p.add_argument("--hasta", help="AAAA-MM-DD")
+    p.add_argument("--salida", help="Archivo de salida (CSV: por defecto, la consola)")
+    p.set_defaults(func=cmd_exportar)
+
+    p = sub.add_parser("importar", help="Importa archivos históricos de OpenAQ (CSV con gzip o Parquet) a --datos")
+    p.add_argument("origen", help="Carpeta con los archivos (se recorre con subcarpetas)")
+    p.add_argument("--region", help="lat_min,lat_max,lon_min,lon_max (por defecto, AIRCESFAM_REGION o sin filtro)")
+    p.add_argument("--parametro", action="append", choices=motor.contaminantes_clave,
+                   help="Por defecto, todos los contaminantes clave")
+    p.add_argument("--hilos", type=int, help="Archivos leídos en paralelo")
+    p.set_defaults(func=cmd_importar)
+
+    p = sub.add_parser("retencion", help="Pasa a los niveles horario, diario y mensual del almacén las lecturas anteriores al periodo crudo y las quita de los archivos del importador")
+    p.add_argument("--dias-crudos", type=int, help="Días de lecturas horarias a conservar (por defecto, AIRCESFAM_DIAS_CRUDOS)")
+    p.add_argument("--dias-horarios", type=int, help="Días del nivel horario antes del periodo crudo (por defecto, 90)")
+    p.add_argument("--dias-diarios", type=int, help="Días del nivel diario antes del nivel horario (por defecto, 3 años)")
+    p.add_argument("--simular", action="store_true", help="Solo informar, sin escribir niveles ni tocar los archivos")
+    p.set_defaults(func=cmd_retencion)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
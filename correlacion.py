@@ -0,0 +1,112 @@
+# correlacion.py
+# Correlación entre estaciones y contaminantes, y correlación con desfase
+# (¿el PM10 de Bocatoma se adelanta al de la estación junto al Cesfam?).
+#
+# Las lecturas válidas de la ventana se ordenan en una grilla horaria común
+# (horas x series, una serie por estación y parámetro, NaN donde no hay dato).
+# - La matriz de correlación usa, para cada par, solo las horas en que ambas
+#   series tienen dato; se calcula para todos los pares a la vez con productos
+#   de matrices sobre los valores y sus máscaras.
+# - La correlación con desfase de una serie de referencia contra todas las
+#   demás se obtiene con FFT (sumas de productos y conteos de horas comunes
+#   para todos los desfases de una vez).
+
+import numpy as np
+import pandas as pd
+
+HORAS_MINIMAS = 24  # horas en común bajo las cuales no se informa la correlación
+
+
+def grilla_horaria(df, parametros=None):
+    """DataFrame horas x series con el promedio horario de las lecturas válidas.
+
+    El índice es la hora UTC (sin cambios de hora de verano) y las columnas
+    "estación · parámetro".
+    """
+    datos = df[df['dato_valido']]
+    if parametros:
+        datos = datos[datos['parameter'].isin(parametros)]
+    if datos.empty:
+        return pd.DataFrame()
+    hora = datos['datetimeLocal'].dt.tz_convert("UTC").dt.tz_localize(None)
+    horas = hora.to_numpy().astype("datetime64[h]").astype(np.int64)
+    inicio = horas.min()
+    fila = horas - inicio
+    series = (datos['location_name'].astype(str) + " · " + datos['parameter'].astype(str)).to_numpy()
+    nombres, columna = np.unique(series, return_inverse=True)
+
+    suma = np.zeros((fila.max() + 1, len(nombres)))
+    cuenta = np.zeros_like(suma)
+    np.add.at(suma, (fila, columna), datos['value'].to_numpy(dtype=float))
+    np.add.at(cuenta, (fila, columna), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valores = suma / cuenta
+    indice = pd.to_datetime((inicio + np.arange(len(valores))).astype("datetime64[h]")).tz_localize("UTC")
+    return pd.DataFrame(valores, index=indice, columns=nombres)
+
+
+def _mascara(grilla):
+    valores = grilla.to_numpy(dtype=float)
+    presente = ~np.isnan(valores)
+    return np.where(presente, valores, 0.0), presente.astype(float)
+
+
+def matriz_correlacion(grilla, horas_minimas=HORAS_MINIMAS):
+    """Pearson de cada par de series con sus horas en común. Devuelve (r, horas en común)."""
+    x, m = _mascara(grilla)
+    n = m.T @ m                       # horas en común de cada par
+    sx = x.T @ m                      # suma de i en las horas en que j tiene dato
+    sxx = (x * x).T @ m
+    sxy = x.T @ x                     # x es 0 donde falta: solo suman las horas comunes
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covarianza = n * sxy - sx * sx.T
+        varianza = (n * sxx - sx ** 2) * (n * sxx - sx ** 2).T
+        r = covarianza / np.sqrt(varianza)
+    r[n < horas_minimas] = np.nan
+    columnas = grilla.columns
+    return (pd.DataFrame(np.clip(r, -1, 1), index=columnas, columns=columnas),
+            pd.DataFrame(n.astype(int), index=columnas, columns=columnas))
+
+
+def correlacion_desfase(grilla, referencia, desfase_maximo=24, horas_minimas=HORAS_MINIMAS):
+    """Correlación de `referencia` en t con cada serie en t + k, para k en [-desfase_maximo, desfase_maximo].
+
+    Un máximo en k > 0 indica que la referencia se adelanta k horas a la otra
+    serie. Cada serie se estandariza con sus propias horas con dato y la suma de
+    productos de cada desfase se divide por las horas en común de ese desfase.
+    Devuelve un DataFrame desfases x series.
+    """
+    x, m = _mascara(grilla)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        n = m.sum(axis=0)
+        media = x.sum(axis=0) / n
+        desviacion = np.sqrt(((x - media) ** 2 * m).sum(axis=0) / n)
+        z = np.where(m > 0, (x - media) / desviacion, 0.0)
+    z = np.nan_to_num(z)
+    i = grilla.columns.get_loc(referencia)
+
+    horas = len(grilla)
+    largo = 1 << int(np.ceil(np.log2(2 * horas)))  # sin solapamiento circular
+    fz, fm = np.fft.rfft(z, largo, axis=0), np.fft.rfft(m, largo, axis=0)
+    # sum_t a(t) b(t + k) = irfft(conj(A) * B)[k]
+    productos = np.fft.irfft(np.conj(fz[:, i:i + 1]) * fz, largo, axis=0)
+    comunes = np.rint(np.fft.irfft(np.conj(fm[:, i:i + 1]) * fm, largo, axis=0))
+
+    desfases = np.arange(-desfase_maximo, desfase_maximo + 1)
+    productos, comunes = productos[desfases % largo], comunes[desfases % largo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = productos / comunes
+    r[comunes < horas_minimas] = np.nan
+    return pd.DataFrame(np.clip(r, -1, 1), index=pd.Index(desfases, name='desfase_horas'), columns=grilla.columns)
+
+
+def desfase_optimo(correlaciones):
+    """Por serie: desfase con la mayor correlación absoluta, su r y la r sin desfase."""
+    validas = correlaciones.dropna(axis=1, how='all')
+    mejor = validas.abs().idxmax()
+    return pd.DataFrame({
+        'serie': validas.columns,
+        'desfase_horas': mejor.to_numpy(),
+        'r': [validas.at[k, c] for c, k in mejor.items()],
+        'r_sin_desfase': validas.loc[0].to_numpy() if 0 in validas.index else np.nan,
+    }).sort_values('r', key=np.abs, ascending=False, ignore_index=True)
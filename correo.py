@@ -0,0 +1,54 @@
+# correo.py
+# Envío de correos por SMTP (Gmail) sin dependencia de Streamlit.
+# Se abre una sola conexión por tanda: las alertas se envían a todos los
+# suscriptores afectados sin reconectar por cada destinatario. Las imágenes
+# (graficos.py) van como adjuntos inline referenciados por Content-ID.
+
+import os
+import smtplib
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SERVIDOR_SMTP = ("smtp.gmail.com", 587)
+
+
+def credenciales():
+    """(remitente, contraseña de aplicación) desde el entorno o .env."""
+    if os.path.exists(".env"):
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    return os.getenv("EMAIL_REMITENTE"), os.getenv("EMAIL_APP_PASSWORD")
+
+
+def construir_mensaje(remitente, destinatario, asunto, cuerpo_html, imagenes=None):
+    """imagenes: {cid: bytes PNG}, referenciadas en el HTML como src="cid:<cid>"."""
+    mensaje = MIMEMultipart("related" if imagenes else "alternative")
+    mensaje["Subject"] = asunto
+    mensaje["From"] = remitente
+    mensaje["To"] = destinatario
+    mensaje.attach(MIMEText(cuerpo_html, "html"))
+    for cid, contenido in (imagenes or {}).items():
+        imagen = MIMEImage(contenido, "png")
+        imagen.add_header("Content-ID", f"<{cid}>")
+        imagen.add_header("Content-Disposition", "inline", filename=f"{cid}.png")
+        mensaje.attach(imagen)
+    return mensaje
+
+
+def enviar(remitente, password, mensajes):
+    """Envía los mensajes por una sola conexión. Devuelve la lista de destinatarios que fallaron."""
+    fallidos = []
+    server = smtplib.SMTP(*SERVIDOR_SMTP)
+    try:
+        server.starttls()
+        server.login(remitente, password)
+        for mensaje in mensajes:
+            try:
+                server.sendmail(remitente, mensaje["To"], mensaje.as_string())
+            except smtplib.SMTPRecipientsRefused:
+                fallidos.append(mensaje["To"])
+    finally:
+        server.quit()
+    return fallidos
@@ -0,0 +1,161 @@
+# deduplicacion.py
+# Eliminación de mediciones repetidas (location_id, parameter, datetimeUtc).
+# Las exportaciones de OpenAQ descargadas de nuevo y los archivos de estaciones
+# que se traslapan repiten filas; aquí se detectan con claves hash de 64 bits.
+#
+# Una carga completa (motor.preparar_datos) usa un índice nuevo cada vez: ve
+# todos los archivos, así que no hay nada que recordar entre cargas. La
+# importación incremental (importador.py) guarda un índice por estación junto
+# a su archivo y lo vuelve a leer en la siguiente importación, de modo que solo
+# las filas nuevas o corregidas obligan a reescribir el archivo.
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_CLAVE = ['location_id', 'parameter', 'datetimeUtc']
+NOMBRES_CONTADORES = ['recibidas', 'nuevas', 'duplicadas', 'corregidas']
+FRACCION_FUSION = 0.125  # el tramo de claves recientes se fusiona al superar esta fracción del principal
+MINIMO_FUSION = 65536
+
+
+def claves_hash(df):
+    """Clave de 64 bits por fila a partir de las columnas de COLUMNAS_CLAVE."""
+    return pd.util.hash_pandas_object(df[COLUMNAS_CLAVE], index=False).to_numpy(np.uint64)
+
+
+def huellas_valor(df):
+    return pd.util.hash_pandas_object(df['value'], index=False).to_numpy(np.uint64)
+
+
+def _fusionar(claves, huellas, claves_nuevas, huellas_nuevas):
+    """Inserta claves ordenadas en un arreglo ordenado sin volver a ordenarlo (mezcla lineal)."""
+    pos = np.searchsorted(claves, claves_nuevas)
+    return np.insert(claves, pos, claves_nuevas), np.insert(huellas, pos, huellas_nuevas)
+
+
+class IndiceClaves:
+    """Índice de claves ya ingresadas, con la huella del último valor de cada una.
+
+    Regla de última escritura: si llega una clave conocida con otro valor, la
+    fila se acepta como corrección y reemplaza a la anterior; si el valor es el
+    mismo, se rechaza como duplicado.
+
+    Las claves viven en dos arreglos ordenados: el principal y un tramo de
+    claves recientes. Cada lote solo ordena sus propias claves y las mezcla en
+    el tramo reciente; el tramo se mezcla con el principal cuando crece más
+    que FRACCION_FUSION de él, así que el costo por lote no depende del total.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.claves = np.empty(0, dtype=np.uint64)
+        self.huellas = np.empty(0, dtype=np.uint64)
+        self.claves_recientes = np.empty(0, dtype=np.uint64)
+        self.huellas_recientes = np.empty(0, dtype=np.uint64)
+        self.contadores = dict.fromkeys(NOMBRES_CONTADORES, 0)
+        self.fuente = None  # huella del archivo que describe el índice (ver importador.py)
+        if ruta and os.path.exists(ruta):
+            with np.load(ruta) as datos:
+                self.claves = datos['claves']
+                self.huellas = datos['huellas']
+                self.contadores = dict(zip(NOMBRES_CONTADORES, datos['contadores'].tolist()))
+                if 'fuente' in datos:
+                    self.fuente = str(datos['fuente'])
+
+    def __len__(self):
+        return len(self.claves) + len(self.claves_recientes)
+
+    @staticmethod
+    def _buscar(claves, huellas, claves_lote, huellas_lote):
+        """(posición, existe, mismo valor) de cada clave del lote en un arreglo ordenado."""
+        if not len(claves):
+            vacio = np.zeros(len(claves_lote), dtype=bool)
+            return np.zeros(len(claves_lote), dtype=np.intp), vacio, vacio
+        pos = np.minimum(np.searchsorted(claves, claves_lote), len(claves) - 1)
+        existe = claves[pos] == claves_lote
+        return pos, existe, existe & (huellas[pos] == huellas_lote)
+
+    def registrar(self, df):
+        """Devuelve las filas de df a cargar (nuevas o correcciones) y actualiza el índice."""
+        if df.empty:
+            return df
+        claves = claves_hash(df)
+        huellas = huellas_valor(df)
+
+        # 1) Dentro del lote gana la última aparición de cada clave
+        orden = np.argsort(claves, kind='stable')
+        claves_ord = claves[orden]
+        huellas_ord = huellas[orden]
+        es_ultima = np.r_[claves_ord[1:] != claves_ord[:-1], True]
+        grupo = np.cumsum(np.r_[True, claves_ord[1:] != claves_ord[:-1]]) - 1
+        huella_final = huellas_ord[es_ultima][grupo]
+        descartadas = ~es_ultima
+        duplicadas = int((descartadas & (huellas_ord == huella_final)).sum())
+        corregidas = int((descartadas & (huellas_ord != huella_final)).sum())
+
+        claves_lote = claves_ord[es_ultima]
+        huellas_lote = huellas_ord[es_ultima]
+        filas_lote = orden[es_ultima]
+
+        # 2) Contra las claves ya registradas (principal y recientes)
+        pos, existe, igual = self._buscar(self.claves, self.huellas, claves_lote, huellas_lote)
+        pos_r, existe_r, igual_r = self._buscar(self.claves_recientes, self.huellas_recientes,
+                                                claves_lote, huellas_lote)
+        correccion = existe & ~igual
+        correccion_r = existe_r & ~igual_r
+        nueva = ~(existe | existe_r)
+
+        duplicadas += int((igual | igual_r).sum())
+        corregidas += int((correccion | correccion_r).sum())
+        if correccion.any():
+            self.huellas[pos[correccion]] = huellas_lote[correccion]
+        if correccion_r.any():
+            self.huellas_recientes[pos_r[correccion_r]] = huellas_lote[correccion_r]
+        if nueva.any():
+            self.claves_recientes, self.huellas_recientes = _fusionar(
+                self.claves_recientes, self.huellas_recientes, claves_lote[nueva], huellas_lote[nueva])
+            if len(self.claves_recientes) > max(MINIMO_FUSION, FRACCION_FUSION * len(self.claves)):
+                self.compactar()
+
+        self.contadores['recibidas'] += len(df)
+        self.contadores['nuevas'] += int(nueva.sum())
+        self.contadores['duplicadas'] += duplicadas
+        self.contadores['corregidas'] += corregidas
+
+        aceptadas = np.sort(filas_lote[nueva | correccion | correccion_r])
+        return df.iloc[aceptadas]
+
+    def compactar(self):
+        """Mezcla las claves recientes en el arreglo principal."""
+        if len(self.claves_recientes):
+            self.claves, self.huellas = _fusionar(self.claves, self.huellas,
+                                                  self.claves_recientes, self.huellas_recientes)
+            self.claves_recientes = np.empty(0, dtype=np.uint64)
+            self.huellas_recientes = np.empty(0, dtype=np.uint64)
+
+    def guardar(self, ruta=None):
+        self.compactar()
+        ruta = ruta or self.ruta
+        directorio = os.path.dirname(ruta) or "."
+        os.makedirs(directorio, exist_ok=True)
+        extra = {} if self.fuente is None else {'fuente': np.array(self.fuente)}
+        fd, ruta_tmp = tempfile.mkstemp(suffix=".tmp", dir=directorio)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, claves=self.claves, huellas=self.huellas,
+                     contadores=np.array([self.contadores[k] for k in NOMBRES_CONTADORES], dtype=np.int64),
+                     **extra)
+        os.replace(ruta_tmp, ruta)
+
+
+def deduplicar(df):
+    """Deduplicación de una carga completa con un índice nuevo. Devuelve (df, contadores).
+
+    Las filas deben venir en orden de llegada (archivos más antiguos primero)
+    para que las correcciones más recientes ganen.
+    """
+    indice = IndiceClaves()
+    df = indice.registrar(df)
+    return df, indice.contadores
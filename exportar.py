@@ -0,0 +1,124 @@
+# exportar.py
+# Exportación del historial completo con filtros de estación, parámetro y
+# rango de fechas. Se recorre la tabla Arrow del almacén (mapeada en memoria)
+# por lotes y cada lote filtrado se entrega como bytes CSV o Parquet desde un
+# generador: ni la API ni la CLI arman el archivo completo en memoria, aunque
+# el extracto abarque varios años.
+
+import io
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import almacen
+
+COLUMNAS_EXPORTACION = ['location_id', 'location_name', 'parameter', 'value', 'unit', 'datetimeUtc',
+                        'datetimeLocal', 'latitude', 'longitude', 'dato_valido', 'nivel']
+FILAS_POR_LOTE = 65536
+FORMATOS = {'csv': "text/csv; charset=utf-8", 'parquet': "application/vnd.apache.parquet"}
+
+
+def tabla_publicada():
+    """Tabla de mediciones del almacén (mapa de memoria) o None si aún no se publica."""
+    tabla, _ = almacen.abrir("mediciones")
+    return tabla
+
+
+def _filtro(lote, estaciones=None, parametros=None, desde=None, hasta=None):
+    mascara = None
+
+    def y(condicion):
+        return condicion if mascara is None else pc.and_(mascara, condicion)
+
+    if estaciones:
+        nombres = [e for e in estaciones if not str(e).isdigit()]
+        ids = [int(e) for e in estaciones if str(e).isdigit()]
+        # Conjuntos del mismo tipo que la columna: según la versión de pandas el
+        # texto se publica como string o large_string
+        tipo_nombre, tipo_id = lote.schema.field('location_name').type, lote.schema.field('location_id').type
+        condicion = pc.or_(pc.is_in(lote['location_name'], pa.array(nombres, tipo_nombre)),
+                           pc.is_in(lote['location_id'], pa.array(ids, tipo_id)))
+        mascara = y(condicion)
+    if parametros:
+        mascara = y(pc.is_in(lote['parameter'], pa.array(list(parametros), lote.schema.field('parameter').type)))
+    if desde is not None:
+        mascara = y(pc.greater_equal(lote['fecha'], pa.scalar(desde, pa.date32())))
+    if hasta is not None:
+        mascara = y(pc.less_equal(lote['fecha'], pa.scalar(hasta, pa.date32())))
+    return mascara
+
+
+def lotes(tabla, estaciones=None, parametros=None, desde=None, hasta=None, filas_por_lote=FILAS_POR_LOTE):
+    """RecordBatch filtrados, uno a la vez (los cortes de la tabla no copian datos)."""
+    columnas = [c for c in COLUMNAS_EXPORTACION if c in tabla.column_names]
+    for lote in tabla.to_batches(max_chunksize=filas_por_lote):
+        mascara = _filtro(lote, estaciones, parametros, desde, hasta)
+        if mascara is not None:
+            lote = lote.filter(mascara)
+        if lote.num_rows:
+            yield lote.select(columnas)
+
+
+def _esquema(tabla):
+    columnas = [c for c in COLUMNAS_EXPORTACION if c in tabla.column_names]
+    return pa.schema([tabla.schema.field(c) for c in columnas])
+
+
+def generar_csv(tabla, **filtros):
+    """Bytes CSV por lote; el encabezado va solo en el primero."""
+    encabezado = True
+    for lote in lotes(tabla, **filtros):
+        salida = io.BytesIO()
+        pa_csv.write_csv(lote, salida, pa_csv.WriteOptions(include_header=encabezado))
+        encabezado = False
+        yield salida.getvalue()
+    if encabezado:  # sin filas: igual se entrega el encabezado
+        salida = io.BytesIO()
+        pa_csv.write_csv(_esquema(tabla).empty_table(), salida)
+        yield salida.getvalue()
+
+
+class _Salida:
+    """Destino de escritura que entrega lo escrito y lo descarta, pero mantiene la
+    posición total: el pie del Parquet guarda offsets absolutos."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def extraer(self):
+        datos, self.partes = b"".join(self.partes), []
+        return datos
+
+
+def generar_parquet(tabla, **filtros):
+    """Bytes Parquet: un grupo de filas por lote, entregado apenas se escribe."""
+    salida = _Salida()
+    with pq.ParquetWriter(pa.PythonFile(salida, mode="w"), _esquema(tabla), compression="zstd") as escritor:
+        for lote in lotes(tabla, **filtros):
+            escritor.write_batch(lote)
+            yield salida.extraer()
+    yield salida.extraer()  # pie del archivo (metadatos)
+
+
+def generar(tabla, formato="csv", **filtros):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    return generar_parquet(tabla, **filtros) if formato == "parquet" else generar_csv(tabla, **filtros)
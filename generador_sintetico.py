@@ -0,0 +1,139 @@
+# generador_sintetico.py
+# Genera mediciones sintéticas con el mismo esquema de los CSV de OpenAQ
+# (openaq_location_<id>_measurments.csv) para probar el pipeline a escala.
+#
+# Uso:
+#   python generador_sintetico.py --estaciones 50 --horas 8760 --parametros pm25 pm10 o3 no2 --salida datos_sinteticos
+#
+# Las series tienen ciclo diario (peaks de mañana y noche en material
+# particulado, de tarde en ozono), estacionalidad invernal, ruido correlacionado
+# y episodios. datetimeLocal se calcula con la zona America/Santiago, por lo que
+# incluye los cambios de horario (-04:00 / -03:00).
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+ZONA_HORARIA = "America/Santiago"
+COLUMNAS_OPENAQ = ['location_id', 'location_name', 'parameter', 'value', 'unit', 'datetimeUtc',
+                   'datetimeLocal', 'timezone', 'latitude', 'longitude', 'country_iso', 'isMobile',
+                   'isMonitor', 'owner_name', 'provider']
+
+# parametro: (unidad, nivel base, amplitud diaria, horas peak locales, decimales)
+PARAMETROS = {
+    'pm25': ("µg/m³", 18.0, 0.6, (8, 21), 0),
+    'pm10': ("µg/m³", 35.0, 0.5, (8, 21), 0),
+    'o3': ("µg/m³", 30.0, 0.8, (15,), 0),
+    'no2': ("µg/m³", 15.0, 0.6, (8, 20), 1),
+    'so2': ("µg/m³", 10.0, 0.3, (11,), 2),
+    'co': ("ppm", 0.6, 0.5, (8, 21), 2),
+}
+
+# Centro aproximado de las estaciones reales del repositorio (Talcahuano - Hualpén)
+LAT_CENTRO, LON_CENTRO = -36.786, -73.117
+
+
+def _ciclo_diario(hora_local, peaks):
+    """Suma de campanas gaussianas (circulares) centradas en las horas peak."""
+    ciclo = np.zeros(len(hora_local))
+    for peak in peaks:
+        distancia = np.minimum(np.abs(hora_local - peak), 24 - np.abs(hora_local - peak))
+        ciclo += np.exp(-0.5 * (distancia / 2.5) ** 2)
+    return ciclo
+
+
+def _ruido_correlacionado(rng, n, horas_memoria=12):
+    blanco = rng.standard_normal(n + horas_memoria)
+    nucleo = np.ones(horas_memoria) / np.sqrt(horas_memoria)
+    return np.convolve(blanco, nucleo, mode='valid')[:n]
+
+
+def generar_estacion(location_id, horas, parametros, inicio="2024-01-01", rng=None,
+                     nombre=None, lat=None, lon=None):
+    """DataFrame con horas x parámetros mediciones de una estación."""
+    rng = rng or np.random.default_rng(location_id)
+    nombre = nombre or f"Estación {location_id}"
+    lat = LAT_CENTRO + rng.normal(0, 0.05) if lat is None else lat
+    lon = LON_CENTRO + rng.normal(0, 0.05) if lon is None else lon
+
+    tiempos_utc = pd.date_range(pd.Timestamp(inicio, tz="UTC"), periods=horas, freq="h")
+    tiempos_local = tiempos_utc.tz_convert(ZONA_HORARIA)
+    hora_local = tiempos_local.hour.to_numpy()
+    dia_anio = tiempos_local.dayofyear.to_numpy()
+    # Invierno austral (junio-julio) con más contaminación
+    estacionalidad = 1 + 0.6 * np.cos(2 * np.pi * (dia_anio - 190) / 365.25)
+
+    utc_txt = tiempos_utc.strftime("%Y-%m-%dT%H:%M:%SZ")
+    local_txt = pd.Index(tiempos_local.strftime("%Y-%m-%dT%H:%M:%S%z"))
+    local_txt = local_txt.str[:-2] + ":" + local_txt.str[-2:]
+    factor_estacion = rng.uniform(0.7, 1.4)
+
+    bloques = []
+    for parametro in parametros:
+        unidad, base, amplitud, peaks, decimales = PARAMETROS[parametro]
+        valor = base * factor_estacion * estacionalidad * (1 + amplitud * _ciclo_diario(hora_local, peaks))
+        valor *= np.exp(0.25 * _ruido_correlacionado(rng, horas))
+        # Episodios: algunas horas por mes con concentraciones 2-4 veces mayores
+        episodios = rng.random(horas) < 1 / 500
+        if episodios.any():
+            multiplicador = np.convolve(episodios * rng.uniform(1, 3, horas), np.hanning(18), mode='same')
+            valor *= 1 + multiplicador
+        bloques.append(pd.DataFrame({
+            'location_id': location_id,
+            'location_name': nombre,
+            'parameter': parametro,
+            'value': np.round(np.clip(valor, 0, None), decimales) if decimales else np.rint(np.clip(valor, 0, None)).astype(int),
+            'unit': unidad,
+            'datetimeUtc': utc_txt,
+            'datetimeLocal': local_txt,
+            'timezone': ZONA_HORARIA,
+            'latitude': round(lat, 6),
+            'longitude': round(lon, 6),
+            'country_iso': None,
+            'isMobile': None,
+            'isMonitor': None,
+            'owner_name': "Unknown Governmental Organization",
+            'provider': "Chile - SINCA",
+        }))
+    return pd.concat(bloques, ignore_index=True)[COLUMNAS_OPENAQ]
+
+
+def generar(directorio, estaciones, horas, parametros=('pm25', 'pm10', 'o3', 'no2'),
+            formato="csv", inicio="2024-01-01", semilla=0, id_inicial=10000):
+    """Escribe un archivo por estación y devuelve la lista de rutas generadas."""
+    os.makedirs(directorio, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+    rutas = []
+    for i in range(estaciones):
+        location_id = id_inicial + i
+        df = generar_estacion(location_id, horas, parametros, inicio=inicio, rng=rng)
+        ruta = os.path.join(directorio, f"openaq_location_{location_id}_measurments.{formato}")
+        if formato == "parquet":
+            df.to_parquet(ruta, index=False)
+        else:
+            df.to_csv(ruta, index=False)
+        rutas.append(ruta)
+    return rutas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de mediciones sintéticas con esquema OpenAQ")
+    parser.add_argument("--estaciones", type=int, default=10)
+    parser.add_argument("--horas", type=int, default=24 * 30)
+    parser.add_argument("--parametros", nargs="+", default=['pm25', 'pm10', 'o3', 'no2'], choices=sorted(PARAMETROS))
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--inicio", default="2024-01-01", help="Primera hora (UTC)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", default="datos_sinteticos")
+    args = parser.parse_args(argv)
+
+    rutas = generar(args.salida, args.estaciones, args.horas, args.parametros,
+                    formato=args.formato, inicio=args.inicio, semilla=args.semilla)
+    filas = args.estaciones * args.horas * len(args.parametros)
+    print(f"✅ {len(rutas)} archivos, {filas:,} filas en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# graficos.py
+# Imágenes estáticas (PNG, matplotlib) para correos y reportes.
+# Cada gráfico se dibuja una sola vez por (tipo, estación, periodo, versión de
+# datos): el nombre del archivo es el hash de esa clave, así que un correo a
+# cientos de suscriptores reutiliza la misma imagen. Los que faltan se dibujan
+# en paralelo en un pool de procesos; el caché (almacen/graficos) se recorta
+# por tamaño eliminando primero los menos usados.
+#
+# En el HTML se referencian como <img src="cid:CLAVE"> y se adjuntan con
+# correo.construir_mensaje(..., imagenes=graficos.cargar(rutas)).
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import almacen
+import motor
+from metricas import medir
+
+DIR_GRAFICOS = os.path.join(almacen.DIR_ALMACEN, "graficos")
+LIMITE_BYTES = int(os.getenv("AIRCESFAM_LIMITE_GRAFICOS", 50 * 1024 * 1024))
+DIAS_TENDENCIA = 7
+PARAMETROS_TENDENCIA = ['pm25', 'pm10']
+
+
+def clave(tipo, location_id, desde, hasta, version):
+    texto = f"{tipo}|{location_id}|{desde}|{hasta}|{version}"
+    return hashlib.sha256(texto.encode()).hexdigest()[:24]
+
+
+def ruta_grafico(clave_grafico, directorio=None):
+    return os.path.join(directorio or DIR_GRAFICOS, f"{clave_grafico}.png")
+
+
+def periodo_reciente(df, dias=DIAS_TENDENCIA):
+    """(desde, hasta) de los últimos días con datos."""
+    hasta = df['datetimeLocal'].max()
+    return hasta - pd.Timedelta(days=dias), hasta
+
+
+# --- DATOS MÍNIMOS PARA CADA GRÁFICO (lo que viaja al proceso que dibuja) ---
+def _datos_tendencia(df, location_id, desde, hasta):
+    filas = df[(df['location_id'] == location_id) & df['dato_valido']
+               & df['parameter'].isin(PARAMETROS_TENDENCIA)
+               & (df['datetimeLocal'] >= desde) & (df['datetimeLocal'] <= hasta)]
+    nombre = filas['location_name'].iloc[0] if len(filas) else str(location_id)
+    series = {parametro: (g['datetimeLocal'].dt.tz_localize(None).to_numpy(), g['value'].to_numpy())
+              for parametro, g in filas.sort_values('datetimeLocal').groupby('parameter')}
+    return {'titulo': f"{nombre}: últimos {(hasta - desde).days} días", 'series': series}
+
+
+def _datos_niveles(df):
+    ultimos = motor.ultimos_valores(df, 'pm25').sort_values('value')
+    return {'titulo': "PM2.5 actual por estación", 'nombres': ultimos['location_name'].tolist(),
+            'valores': ultimos['value'].to_numpy(), 'colores': ultimos['color'].tolist()}
+
+
+def _dibujar(tipo, datos, ruta):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 2.8), dpi=100)
+    if tipo == "tendencia":
+        for parametro, (tiempos, valores) in datos['series'].items():
+            ax.plot(tiempos, valores, linewidth=1.2, label=parametro.upper())
+        ax.axhline(55, color="red", linestyle="--", linewidth=0.8, label="Dañino (PM2.5)")
+        ax.legend(fontsize=7, loc="upper left")
+        fig.autofmt_xdate()
+    else:
+        ax.barh(datos['nombres'], datos['valores'], color=datos['colores'])
+        for i, valor in enumerate(datos['valores']):
+            ax.text(valor, i, f" {valor:.0f}", va="center", fontsize=8)
+    ax.set_title(datos['titulo'], fontsize=10)
+    ax.set_xlabel("µg/m³" if tipo == "niveles" else "")
+    fig.tight_layout()
+
+    fd, ruta_tmp = tempfile.mkstemp(suffix=".png.tmp", dir=os.path.dirname(ruta))
+    os.close(fd)
+    fig.savefig(ruta_tmp, format="png")
+    plt.close(fig)
+    os.replace(ruta_tmp, ruta)
+    return ruta
+
+
+def renderizar(df, pedidos, version, desde=None, hasta=None, procesos=None, directorio=None):
+    """Rutas de los gráficos pedidos, dibujando solo los que no están en caché.
+
+    pedidos: lista de ('tendencia', location_id) o ('niveles', None).
+    Devuelve {(tipo, location_id): ruta}.
+    """
+    directorio = directorio or DIR_GRAFICOS
+    os.makedirs(directorio, exist_ok=True)
+    if desde is None or hasta is None:
+        desde, hasta = periodo_reciente(df)
+
+    rutas, faltantes = {}, []
+    for tipo, location_id in dict.fromkeys(pedidos):
+        ruta = ruta_grafico(clave(tipo, location_id, desde, hasta, version), directorio)
+        rutas[(tipo, location_id)] = ruta
+        if os.path.exists(ruta):
+            os.utime(ruta)  # marca de uso para la expulsión
+        else:
+            datos = _datos_niveles(df) if tipo == "niveles" else _datos_tendencia(df, location_id, desde, hasta)
+            faltantes.append((tipo, datos, ruta))
+
+    with medir("graficos"):
+        if len(faltantes) == 1 or procesos == 1:
+            for tipo, datos, ruta in faltantes:
+                _dibujar(tipo, datos, ruta)
+        elif faltantes:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                list(pool.map(_dibujar, *zip(*faltantes)))
+    if faltantes:
+        expulsar(directorio)
+    return rutas
+
+
+def expulsar(directorio=None, limite=LIMITE_BYTES):
+    """Elimina los gráficos usados hace más tiempo hasta quedar bajo el límite."""
+    directorio = directorio or DIR_GRAFICOS
+    archivos = []
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(".png"):
+            st_archivo = os.stat(os.path.join(directorio, nombre))
+            archivos.append((st_archivo.st_mtime, st_archivo.st_size, nombre))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, nombre in sorted(archivos):
+        if total <= limite:
+            break
+        os.remove(os.path.join(directorio, nombre))
+        total -= tamano
+
+
+def cargar(rutas):
+    """{cid: bytes} para adjuntar; se lee cada imagen una vez por tanda de correos."""
+    imagenes = {}
+    for ruta in rutas:
+        with open(ruta, "rb") as f:
+            imagenes[cid(ruta)] = f.read()
+    return imagenes
+
+
+def cid(ruta):
+    return os.path.basename(ruta)[:-4]
@@ -0,0 +1,243 @@
+# importador.py
+# Importación masiva de archivos históricos de OpenAQ (un CSV comprimido con
+# gzip por estación y día, como en el archivo público de OpenAQ, o Parquet).
+#
+#   python cli.py importar /ruta/openaq-archivo --region=-37.2,-36.4,-73.4,-72.6
+#
+# Cada archivo se descomprime y se lee por lotes con pyarrow, descartando
+# mientras lee los parámetros que no están en contaminantes_clave y las
+# estaciones fuera de la región (lat_min, lat_max, lon_min, lon_max). Los
+# archivos se procesan en paralelo (pyarrow libera el GIL al descomprimir y
+# parsear) y las filas de cada estación se escriben por tandas a medida que
+# se leen, en un Parquet por estación (openaq_location_<id>_archivo.parquet)
+# que motor.py lee como cualquier otra descarga.
+#
+# Junto a cada Parquet se guarda el índice de claves de sus filas
+# (deduplicacion.IndiceClaves, openaq_location_<id>_archivo.indice.npz). Al
+# volver a importar, las filas ya guardadas con el mismo valor se descartan
+# contra el índice sin leer el Parquet, y una estación sin filas nuevas ni
+# corregidas no se reescribe.
+#
+# Estos Parquet son los únicos archivos de la carpeta de datos que se pueden
+# reescribir (retencion.py los recorta); las demás descargas no se tocan.
+
+import glob
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import deduplicacion
+import motor
+from metricas import medir
+
+REGION = os.getenv("AIRCESFAM_REGION")  # "lat_min,lat_max,lon_min,lon_max"
+PATRONES = ["**/*.csv.gz", "**/*.csv", "**/*.parquet"]
+# Nombres del archivo de OpenAQ -> nombres de las descargas por estación
+RENOMBRAR = {'location': 'location_name', 'datetime': 'datetimeLocal', 'lat': 'latitude',
+             'lon': 'longitude', 'units': 'unit'}
+COLUMNAS = ['location_id', 'location_name', 'parameter', 'value', 'unit', 'datetimeUtc', 'datetimeLocal',
+            'latitude', 'longitude']
+CLAVE = ['location_id', 'parameter', 'datetimeUtc']
+TIPOS_TEXTO = {c: pa.string() for c in ['datetime', 'datetimeLocal', 'datetimeUtc', 'location', 'location_name']}
+# Memoria de la importación: filas de una estación que se juntan antes de
+# escribirla, filas pendientes entre todas y archivos leídos por adelantado por hilo
+FILAS_POR_ESTACION = 1_000_000
+FILAS_EN_MEMORIA = 5_000_000
+LECTURAS_POR_HILO = 2
+
+
+def leer_region(texto):
+    if not texto:
+        return None
+    lat_min, lat_max, lon_min, lon_max = (float(x) for x in texto.split(","))
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def listar_fuentes(directorio):
+    archivos = set()
+    for patron in PATRONES:
+        archivos.update(glob.glob(os.path.join(directorio, patron), recursive=True))
+    return sorted(archivos)
+
+
+def _filtrar(lote, parametros, region):
+    mascara = pc.is_in(lote['parameter'], pa.array(parametros, lote.schema.field('parameter').type))
+    if region is not None:
+        lat_min, lat_max, lon_min, lon_max = region
+        lat, lon = lote['latitude'], lote['longitude']
+        mascara = pc.and_(mascara, pc.and_(pc.and_(pc.greater_equal(lat, lat_min), pc.less_equal(lat, lat_max)),
+                                           pc.and_(pc.greater_equal(lon, lon_min), pc.less_equal(lon, lon_max))))
+    return lote.filter(mascara)
+
+
+def _lotes(ruta):
+    if ruta.endswith(".parquet"):
+        yield from pq.ParquetFile(ruta).iter_batches()
+        return
+    entrada = pa.input_stream(ruta, compression="gzip" if ruta.endswith(".gz") else None)
+    yield from pa_csv.open_csv(entrada, convert_options=pa_csv.ConvertOptions(column_types=TIPOS_TEXTO))
+
+
+def leer_fuente(ruta, parametros=tuple(motor.contaminantes_clave), region=None):
+    """Filas de un archivo que pasan los filtros, con las columnas de COLUMNAS."""
+    partes = []
+    for lote in _lotes(ruta):
+        lote = lote.rename_columns([RENOMBRAR.get(c, c) for c in lote.schema.names])
+        lote = _filtrar(lote, list(parametros), region)
+        if lote.num_rows:
+            partes.append(lote)
+    if not partes:
+        return None
+    df = pa.Table.from_batches(partes).to_pandas()
+    if 'datetimeUtc' not in df.columns:
+        utc = pd.to_datetime(df['datetimeLocal'], utc=True, format='ISO8601')
+        df['datetimeUtc'] = utc.dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    for columna in COLUMNAS:
+        if columna not in df.columns:
+            df[columna] = None
+    # Tipos fijos: las claves hash del índice dependen del tipo de cada columna
+    df['location_id'] = df['location_id'].astype('int64')
+    df['value'] = df['value'].astype(float)
+    return df[COLUMNAS]
+
+
+SUFIJO_DESTINO = "_archivo.parquet"
+
+
+def ruta_destino(directorio_datos, location_id):
+    return os.path.join(directorio_datos, f"openaq_location_{location_id}{SUFIJO_DESTINO}")
+
+
+def archivos_importados(directorio_datos):
+    """Archivos por estación escritos por el importador."""
+    return sorted(glob.glob(os.path.join(directorio_datos, f"openaq_location_*{SUFIJO_DESTINO}")))
+
+
+def ruta_indice(ruta):
+    return ruta.removesuffix(".parquet") + ".indice.npz"
+
+
+def _huella(ruta):
+    st_archivo = os.stat(ruta)
+    return f"{st_archivo.st_size}-{st_archivo.st_mtime_ns}"
+
+
+def indice_estacion(ruta):
+    """Índice de claves del archivo de una estación. Si falta o no corresponde al
+    archivo actual (se editó o se borró a mano), se reconstruye desde el archivo."""
+    indice = deduplicacion.IndiceClaves(ruta_indice(ruta))
+    huella = _huella(ruta) if os.path.exists(ruta) else None
+    if indice.fuente != huella:
+        indice = deduplicacion.IndiceClaves()
+        if huella:
+            indice.registrar(pd.read_parquet(ruta, columns=CLAVE + ['value']))
+    return indice
+
+
+def guardar_estacion(df, directorio_datos):
+    """Agrega al archivo de la estación las filas nuevas o corregidas y lo reemplaza
+    de forma atómica. Devuelve (ruta, filas agregadas o corregidas)."""
+    ruta = ruta_destino(directorio_datos, int(df['location_id'].iloc[0]))
+    indice = indice_estacion(ruta)
+    df = indice.registrar(df)
+    if df.empty:
+        return ruta, 0
+    todo = pd.concat([pd.read_parquet(ruta), df], ignore_index=True) if os.path.exists(ruta) else df
+    todo = todo.drop_duplicates(CLAVE, keep='last').sort_values(['parameter', 'datetimeUtc'])
+    ruta_tmp = ruta + ".tmp"
+    todo.to_parquet(ruta_tmp, index=False)
+    os.replace(ruta_tmp, ruta)
+    indice.fuente = _huella(ruta)
+    indice.guardar(ruta_indice(ruta))
+    return ruta, len(df)
+
+
+def reemplazar_estacion(ruta, df):
+    """Reescribe el archivo de una estación solo con las filas de df (o lo borra si
+    queda vacío), conservando su fecha de modificación.
+
+    El índice conserva las claves quitadas: si se vuelve a importar el mismo
+    archivo de OpenAQ, esas filas se descartan como duplicadas.
+    """
+    indice = indice_estacion(ruta)
+    info = os.stat(ruta)
+    if df.empty:
+        os.remove(ruta)
+        indice.fuente = None
+    else:
+        ruta_tmp = ruta + ".tmp"
+        df.to_parquet(ruta_tmp, index=False)
+        os.replace(ruta_tmp, ruta)
+        os.utime(ruta, ns=(info.st_atime_ns, info.st_mtime_ns))
+        indice.fuente = _huella(ruta)
+    indice.guardar(ruta_indice(ruta))
+
+
+def importar(directorio_fuente, directorio_datos, region=None, parametros=None, hilos=None):
+    """Importa todos los archivos de directorio_fuente.
+
+    Las filas de cada estación se juntan mientras se leen los archivos y se
+    escriben al pasar de FILAS_POR_ESTACION (o la estación con más filas, si
+    entre todas pasan de FILAS_EN_MEMORIA); lo pendiente se escribe al final.
+    Solo se leen por adelantado unos pocos archivos por hilo.
+
+    Devuelve (archivos leídos, filas leídas, filas nuevas o corregidas, errores).
+    """
+    region = region if region is not None else leer_region(REGION)
+    parametros = tuple(parametros or motor.contaminantes_clave)
+    fuentes = listar_fuentes(directorio_fuente)
+    os.makedirs(directorio_datos, exist_ok=True)
+    pendientes = {}  # location_id -> [partes sin escribir, filas]
+    errores, filas, agregadas, en_memoria = [], 0, 0, 0
+
+    def leer(ruta):
+        try:
+            return ruta, leer_fuente(ruta, parametros, region), None
+        except Exception as e:
+            return ruta, None, str(e)
+
+    def escribir(location_id):
+        nonlocal agregadas, en_memoria
+        partes, n = pendientes.pop(location_id)
+        en_memoria -= n
+        with medir("importacion_escritura"):
+            agregadas += guardar_estacion(pd.concat(partes, ignore_index=True), directorio_datos)[1]
+
+    with medir("importacion"), ThreadPoolExecutor(max_workers=hilos) as pool:
+        # Ventana acotada de lecturas en curso, consumidas en el orden de las
+        # fuentes: ante filas repetidas gana el archivo posterior
+        restantes = iter(fuentes)
+        ventana = LECTURAS_POR_HILO * (hilos or os.cpu_count() or 1)
+        en_curso = deque(pool.submit(leer, ruta) for ruta in itertools.islice(restantes, ventana))
+        while en_curso:
+            ruta, df, error = en_curso.popleft().result()
+            siguiente = next(restantes, None)
+            if siguiente is not None:
+                en_curso.append(pool.submit(leer, siguiente))
+            if error:
+                errores.append((os.path.basename(ruta), error))
+                continue
+            if df is None:
+                continue
+            filas += len(df)
+            for location_id, grupo in df.groupby('location_id', sort=False):
+                pendiente = pendientes.setdefault(location_id, [[], 0])
+                pendiente[0].append(grupo)
+                pendiente[1] += len(grupo)
+                en_memoria += len(grupo)
+                if pendiente[1] >= FILAS_POR_ESTACION:
+                    escribir(location_id)
+            del df
+            while en_memoria > FILAS_EN_MEMORIA:
+                escribir(max(pendientes, key=lambda k: pendientes[k][1]))
+
+        for location_id in list(pendientes):
+            escribir(location_id)
+    return len(fuentes), filas, agregadas, errores
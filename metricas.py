@@ -0,0 +1,206 @@
+# metricas.py
+# Instrumentación del pipeline de AirCesfam: tiempos por etapa, filas, memoria
+# y retraso de los datos por estación. Cada medición se escribe como una línea
+# JSON en almacen/metricas.jsonl (rota al llegar a MAX_BYTES_LOG, con
+# COPIAS_LOG copias) y el estado acumulado se exporta en formato de texto de
+# Prometheus (almacen/metricas.prom).
+
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import almacen
+
+RUTA_LOG = os.path.join(almacen.DIR_ALMACEN, "metricas.jsonl")
+RUTA_PROMETHEUS = os.path.join(almacen.DIR_ALMACEN, "metricas.prom")
+PREFIJO = "aircesfam"
+MAX_BYTES_LOG = int(float(os.getenv("AIRCESFAM_METRICAS_MB", "10")) * 1024 * 1024)
+COPIAS_LOG = 3
+
+_lock = threading.Lock()
+_tiempos = {}     # (etapa, etiquetas) -> {'ultimo', 'suma', 'cuenta'}
+_valores = {}     # (nombre, etiquetas) -> valor
+_logger = None
+_primera_pintura = None
+
+
+def _inicio_proceso():
+    """Hora (epoch) de inicio del proceso; en Linux se lee de /proc."""
+    try:
+        with open("/proc/self/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/stat") as f:
+            arranque = next(int(linea.split()[1]) for linea in f if linea.startswith("btime"))
+        return arranque + int(campos[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, StopIteration, ValueError, IndexError, AttributeError):
+        return time.time()
+
+
+INICIO_PROCESO = _inicio_proceso()
+
+
+def _log():
+    global _logger
+    if _logger is None:
+        _logger = logging.getLogger("aircesfam.metricas")
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        try:
+            os.makedirs(os.path.dirname(RUTA_LOG), exist_ok=True)
+            manejador = logging.handlers.RotatingFileHandler(RUTA_LOG, maxBytes=MAX_BYTES_LOG,
+                                                             backupCount=COPIAS_LOG, encoding="utf-8")
+        except OSError:
+            manejador = logging.StreamHandler(sys.stderr)
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(manejador)
+    return _logger
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((etiquetas or {}).items()))
+
+
+@contextmanager
+def medir(etapa, **etiquetas):
+    """Mide la duración de un bloque. Uso: with medir("carga"): ..."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tiempo(etapa, time.perf_counter() - inicio, **etiquetas)
+
+
+def registrar_tiempo(etapa, segundos, **etiquetas):
+    clave = (etapa, _etiquetas(etiquetas))
+    with _lock:
+        acumulado = _tiempos.setdefault(clave, {'ultimo': 0.0, 'suma': 0.0, 'cuenta': 0})
+        acumulado['ultimo'] = segundos
+        acumulado['suma'] += segundos
+        acumulado['cuenta'] += 1
+    _log().info(json.dumps({"ts": time.time(), "tipo": "tiempo", "etapa": etapa,
+                            "segundos": round(segundos, 6), "etiquetas": etiquetas}, ensure_ascii=False))
+
+
+def registrar_valor(nombre, valor, **etiquetas):
+    with _lock:
+        _valores[(nombre, _etiquetas(etiquetas))] = float(valor)
+    # Las etiquetas van aparte: una etiqueta "tipo" no pisa el tipo del registro
+    _log().info(json.dumps({"ts": time.time(), "tipo": "valor", "nombre": nombre,
+                            "valor": float(valor), "etiquetas": etiquetas}, ensure_ascii=False))
+
+
+def registrar_dataframe(etapa, df):
+    """Filas y memoria (bytes, profunda) de un DataFrame al final de una etapa."""
+    registrar_valor("filas", len(df), etapa=etapa)
+    registrar_valor("memoria_dataframe_bytes", df.memory_usage(deep=True).sum(), etapa=etapa)
+
+
+def memoria_maxima():
+    """Memoria residente máxima del proceso en bytes, o None si la plataforma no la informa."""
+    try:
+        import resource  # solo Unix
+    except ImportError:
+        return None
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def registrar_proceso():
+    maxrss = memoria_maxima()
+    if maxrss is not None:
+        registrar_valor("memoria_proceso_max_bytes", maxrss)
+
+
+def registrar_primera_pintura():
+    """Segundos entre el inicio del proceso y la primera ejecución completa del script.
+    Solo se registra una vez por proceso."""
+    global _primera_pintura
+    if _primera_pintura is None:
+        _primera_pintura = time.time() - INICIO_PROCESO
+        registrar_valor("arranque_primera_pintura_segundos", _primera_pintura)
+    return _primera_pintura
+
+
+def registrar_retraso(df, columna_tiempo='datetimeLocal', ahora=None):
+    """Retraso (segundos) entre ahora y la última medición de cada estación."""
+    if df.empty:
+        return pd.Series(dtype=float)
+    ahora = ahora or pd.Timestamp.now(tz="UTC")
+    ultima = df[columna_tiempo].groupby(df['location_name']).max()
+    retraso = (ahora - ultima).dt.total_seconds()
+    for estacion, segundos in retraso.items():
+        registrar_valor("retraso_datos_segundos", segundos, estacion=estacion)
+    return retraso
+
+
+def tabla_tiempos():
+    with _lock:
+        filas = [{'etapa': etapa, **dict(etiquetas), 'ultimo_ms': v['ultimo'] * 1000,
+                  'promedio_ms': v['suma'] / v['cuenta'] * 1000, 'ejecuciones': v['cuenta']}
+                 for (etapa, etiquetas), v in _tiempos.items()]
+    return pd.DataFrame(filas)
+
+
+def tabla_valores():
+    with _lock:
+        filas = [{'nombre': nombre, 'etiquetas': ", ".join(f"{k}={v}" for k, v in etiquetas), 'valor': valor}
+                 for (nombre, etiquetas), valor in _valores.items()]
+    return pd.DataFrame(filas)
+
+
+def _formato_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    partes = []
+    for k, v in etiquetas:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{k}="{v}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def texto_prometheus():
+    """Estado actual en el formato de texto de exposición de Prometheus."""
+    lineas = []
+    with _lock:
+        tiempos = list(_tiempos.items())
+        valores = list(_valores.items())
+
+    nombre = f"{PREFIJO}_etapa_segundos"
+    lineas.append(f"# HELP {nombre} Duración de las etapas del pipeline y del render de cada vista.")
+    lineas.append(f"# TYPE {nombre} summary")
+    for (etapa, etiquetas), v in tiempos:
+        etq = _formato_etiquetas((("etapa", etapa),) + etiquetas)
+        lineas.append(f"{nombre}_sum{etq} {v['suma']:.6f}")
+        lineas.append(f"{nombre}_count{etq} {v['cuenta']}")
+    lineas.append(f"# TYPE {nombre}_ultimo gauge")
+    for (etapa, etiquetas), v in tiempos:
+        lineas.append(f"{nombre}_ultimo{_formato_etiquetas((('etapa', etapa),) + etiquetas)} {v['ultimo']:.6f}")
+
+    vistos = set()
+    for (nombre_valor, etiquetas), valor in sorted(valores):
+        metrica = f"{PREFIJO}_{nombre_valor}"
+        if metrica not in vistos:
+            lineas.append(f"# TYPE {metrica} gauge")
+            vistos.add(metrica)
+        lineas.append(f"{metrica}{_formato_etiquetas(etiquetas)} {valor:g}")
+    return "\n".join(lineas) + "\n"
+
+
+def escribir_prometheus(ruta=RUTA_PROMETHEUS):
+    """Escribe el archivo de métricas (reemplazo atómico) para el textfile collector."""
+    try:
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(ruta_tmp, "w", encoding="utf-8") as f:
+            f.write(texto_prometheus())
+        os.replace(ruta_tmp, ruta)
+    except OSError:
+        pass
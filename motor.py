@@ -0,0 +1,352 @@
+# motor.py
+# Etapas del pipeline de AirCesfam sin dependencia de Streamlit:
+# carga -> limpieza -> clasificación -> últimos valores -> demanda -> dotación.
+# Cada etapa recibe y devuelve DataFrames con las columnas de COLUMNAS_*.
+# app.py es solo la vista sobre estas funciones; cli.py, el benchmark y las
+# tareas programadas las llaman directamente.
+
+import bisect
+import glob
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import almacen
+import calidad
+import deduplicacion
+import metricas
+from metricas import medir
+
+logger = logging.getLogger("aircesfam.motor")
+
+contaminantes_clave = ['pm25', 'pm10', 'o3', 'no2']
+# Ruta de datos (ajustar según entorno)
+RUTA_DATOS = os.getenv("AIRCESFAM_DATOS", r"C:\Users\sucor\OneDrive\Escritorio\UDEC_MAGISTER\VI - TRIMESTRE\PROYECTO INTEGRADO\proyecto-aire")
+ZONA_HORARIA = "America/Santiago"
+# Cambiar al modificar la preparación: invalida las tablas ya publicadas
+VERSION_PREPARACION = 2
+# "pandas" (por defecto) o "arrow": preparación con pyarrow.compute (motor_arrow.py)
+MOTOR = os.getenv("AIRCESFAM_MOTOR", "pandas")
+
+# Columnas mínimas de los archivos de OpenAQ y columnas que agrega la preparación
+COLUMNAS_ENTRADA = ['location_id', 'location_name', 'parameter', 'value', 'datetimeUtc', 'datetimeLocal',
+                    'latitude', 'longitude']
+COLUMNAS_PREPARADAS = COLUMNAS_ENTRADA + calidad.COLUMNAS_FLAG + ['dato_valido', 'fecha', 'hora', 'nivel', 'color']
+
+ESTABLECIMIENTO = "Cesfam La Floresta"
+TURNOS = ["Mañana (8-16)", "Tarde (16-24)", "Noche (0-8)"]
+DOTACION_BASE = 5  # médico, enfermera, técnico, administrativo, aseo
+
+
+def turno_de_hora(hora):
+    """Turno de TURNOS para una hora local (0-23) o un arreglo de horas."""
+    return np.array([TURNOS[2], TURNOS[0], TURNOS[1]])[np.asarray(hora) // 8]
+
+
+def validar_columnas(df, columnas, etapa):
+    faltantes = [c for c in columnas if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"{etapa}: faltan columnas {', '.join(faltantes)}")
+
+
+# --- CARGA ---
+def listar_archivos(ruta_carpeta):
+    """Archivos de mediciones de la carpeta, más antiguos primero
+    (ante filas repetidas gana la descarga más reciente)."""
+    archivos = glob.glob(os.path.join(ruta_carpeta, "*.csv")) + glob.glob(os.path.join(ruta_carpeta, "*.parquet"))
+    return sorted(archivos, key=os.path.getmtime)
+
+
+def version_datos(archivos):
+    if not archivos:
+        return None
+    # La tabla del motor Arrow solo trae las columnas que se usan: otra versión
+    motor = "a" if MOTOR == "arrow" else ""
+    return f"p{VERSION_PREPARACION}{motor}-{almacen.version_fuentes(archivos)}"
+
+
+def leer_archivo(archivo):
+    if archivo.endswith(".parquet"):
+        return pd.read_parquet(archivo)
+    return pd.read_csv(archivo)
+
+
+def cargar_archivos(archivos):
+    """Lee y une los archivos. Devuelve (DataFrame o None, lista de errores por archivo)."""
+    listado_dataframes = []
+    errores = []
+    for archivo in archivos:
+        try:
+            listado_dataframes.append(leer_archivo(archivo))
+        except Exception as e:
+            errores.append((os.path.basename(archivo), str(e)))
+            logger.warning("Error al leer %s: %s", archivo, e)
+
+    if not listado_dataframes:
+        return None, errores
+    return pd.concat(listado_dataframes, ignore_index=True), errores
+
+
+# --- LIMPIEZA Y PREPARACIÓN ---
+def convertir_hora_local(df):
+    """datetimeLocal como fecha con zona horaria de la estación.
+
+    Los archivos de OpenAQ traen el desfase de cada lectura (-04:00 en invierno,
+    -03:00 en horario de verano), así que se interpreta en UTC y se convierte a
+    la zona horaria más frecuente del conjunto.
+    """
+    zona = ZONA_HORARIA
+    if 'timezone' in df.columns and df['timezone'].notna().any():
+        zona = df['timezone'].mode().iloc[0]
+    return pd.to_datetime(df['datetimeLocal'], errors='coerce', utc=True, format='ISO8601').dt.tz_convert(zona)
+
+
+def limpiar(df):
+    validar_columnas(df, COLUMNAS_ENTRADA, "limpieza")
+    df['datetimeLocal'] = convertir_hora_local(df)
+    df = df.dropna(subset=['datetimeLocal', 'value', 'parameter', 'location_name'])
+    df['value'] = pd.to_numeric(df['value'], errors='coerce')
+    return df.dropna(subset=['value'])
+
+
+# Por parámetro: límites superiores (inclusive) de cada nivel y (nivel, color);
+# el último nivel no tiene límite. Los demás parámetros quedan en NIVEL_OTROS.
+NIVELES = {
+    'pm25': ([12, 35, 55, 150, 250],
+             [('Bueno', 'green'), ('Moderado', 'yellow'), ('Dañino S. G.', 'orange'), ('Dañino', 'red'),
+              ('Muy Dañino', 'purple'), ('Peligroso', 'maroon')]),
+    'pm10': ([54, 154, 254, 354],
+             [('Bueno', 'green'), ('Moderado', 'yellow'), ('Dañino S. G.', 'orange'), ('Dañino', 'red'),
+              ('Peligroso', 'purple')]),
+}
+NIVEL_OTROS = ('Moderado', 'gray')
+
+
+def nivel_contaminacion(valor, parametro):
+    if parametro not in NIVELES:
+        return NIVEL_OTROS
+    cortes, niveles = NIVELES[parametro]
+    return niveles[bisect.bisect_left(cortes, valor)]
+
+
+def clasificar(df):
+    """Columnas nivel y color como nivel_contaminacion, con np.searchsorted por parámetro."""
+    etiquetas = [NIVEL_OTROS] + [e for _, niveles in NIVELES.values() for e in niveles]
+    codigos = np.zeros(len(df), dtype=np.intp)  # 0: NIVEL_OTROS
+    valores = df['value'].to_numpy(dtype=float)
+    primero = 1
+    for parametro, (cortes, niveles) in NIVELES.items():
+        filas = (df['parameter'] == parametro).to_numpy(dtype=bool)
+        codigos[filas] = primero + np.searchsorted(cortes, valores[filas], side='left')
+        primero += len(niveles)
+    for i, columna in enumerate(['nivel', 'color']):
+        df[columna] = pd.Series(np.array([e[i] for e in etiquetas], dtype=object)[codigos], index=df.index)
+    return df
+
+
+def preparar_datos(df):
+    with medir("limpieza"):
+        df = limpiar(df)
+
+    # Descartar mediciones repetidas (location_id, parameter, datetimeUtc)
+    with medir("deduplicacion"):
+        df, contadores = deduplicacion.deduplicar(df)
+    for nombre, valor in contadores.items():
+        metricas.registrar_valor("deduplicacion_filas", valor, tipo=nombre)
+
+    # Filtrar contaminantes clave
+    df = df[df['parameter'].isin(contaminantes_clave)].copy()
+
+    # Marcar negativos, picos aislados, sensores pegados y brechas (no se eliminan)
+    with medir("calidad"):
+        df = calidad.revisar_calidad(df)
+
+    # Extraer fecha y hora
+    df['fecha'] = df['datetimeLocal'].dt.date
+    df['hora'] = df['datetimeLocal'].dt.hour
+
+    with medir("clasificacion"):
+        df = clasificar(df)
+    metricas.registrar_dataframe("preparacion", df)
+    return df
+
+
+# --- DATOS PREPARADOS COMPARTIDOS ---
+def obtener_datos(ruta_carpeta, version=None):
+    """Tabla preparada: se mapea desde el almacén si está al día con los archivos
+    fuente; si no, se carga, se prepara y se publica para los demás procesos.
+
+    Devuelve (DataFrame o None, lista de errores por archivo).
+    """
+    if version is None:
+        version = version_datos(listar_archivos(ruta_carpeta))
+    tabla, version_publicada = almacen.abrir("mediciones")
+    if tabla is not None and (version is None or version == version_publicada):
+        df = almacen.a_pandas(tabla)
+        if almacen.abrir_dataset("mediciones", version_publicada) is None:
+            _publicar_dataset(df, version_publicada)
+        return df, []
+
+    if MOTOR == "arrow":
+        return _obtener_datos_arrow(ruta_carpeta, version)
+
+    with medir("carga_csv"):
+        df, errores = cargar_archivos(listar_archivos(ruta_carpeta))
+    if df is None:
+        return None, errores
+    metricas.registrar_dataframe("carga_csv", df)
+    df = preparar_datos(df)
+    try:
+        with medir("publicacion"):
+            almacen.publicar(df, "mediciones", version)
+    except OSError as e:
+        logger.warning("No se pudo publicar el almacén compartido: %s", e)
+    _publicar_dataset(df, version)
+    return df, errores
+
+
+def _obtener_datos_arrow(ruta_carpeta, version):
+    """obtener_datos con el motor Arrow: la tabla preparada se publica tal cual
+    y el DataFrame se arma desde el mapa de memoria del almacén."""
+    import motor_arrow
+
+    with medir("carga_csv"):
+        tabla, errores = motor_arrow.cargar_archivos(listar_archivos(ruta_carpeta))
+    if tabla is None:
+        return None, errores
+    tabla = motor_arrow.preparar_tabla(tabla)
+    try:
+        with medir("publicacion"):
+            almacen.publicar(tabla, "mediciones", version)
+        tabla, _ = almacen.abrir("mediciones")
+    except OSError as e:
+        logger.warning("No se pudo publicar el almacén compartido: %s", e)
+    _publicar_dataset(tabla, version)
+    df = almacen.a_pandas(tabla)
+    metricas.registrar_dataframe("preparacion", df)
+    return df, errores
+
+
+def _publicar_dataset(df, version):
+    try:
+        with medir("publicacion_dataset"):
+            almacen.publicar_dataset(df, "mediciones", version)
+    except OSError as e:
+        logger.warning("No se pudo publicar el dataset particionado: %s", e)
+
+
+def datos_rango(version, desde=None, hasta=None, estaciones=None):
+    """Mediciones preparadas entre dos fechas (location_id en estaciones), leídas
+    del dataset particionado: solo se abren los meses y estaciones pedidos.
+
+    Devuelve None si la versión no tiene dataset publicado.
+    """
+    dataset = almacen.abrir_dataset("mediciones", version)
+    if dataset is None:
+        return None
+    with medir("lectura_rango"):
+        df = almacen.leer_rango(dataset, desde, hasta, estaciones)
+    return df.sort_values('datetimeLocal', ignore_index=True)
+
+
+# --- CONSULTAS SOBRE LOS DATOS PREPARADOS ---
+def ultimos_valores(df, parametro='pm25'):
+    """Última lectura válida de cada estación para un parámetro."""
+    validar_columnas(df, COLUMNAS_PREPARADAS, "últimos valores")
+    df_param = df[(df['parameter'] == parametro) & df['dato_valido']].sort_values('datetimeLocal')
+    return df_param.groupby('location_name').last().reset_index()
+
+
+def estaciones_cercanas(estaciones, lat, lon, n=2):
+    """location_id de las n estaciones más cercanas a (lat, lon), por distancia haversine."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(estaciones['latitude'].to_numpy()), np.radians(estaciones['longitude'].to_numpy())
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    orden = np.argsort(a)[:n]
+    return [int(i) for i in estaciones['location_id'].to_numpy()[orden]]
+
+
+def resumen_diario(df):
+    """Promedio, máximo y cantidad de lecturas por estación, parámetro y día."""
+    return (df[df['dato_valido']]
+            .groupby(['location_name', 'parameter', 'fecha'])['value']
+            .agg(promedio='mean', maximo='max', lecturas='count')
+            .reset_index())
+
+
+# --- ESTIMACIÓN DE DEMANDA EN CESFAM ---
+# Valores iniciales; calibracion.parametros_demanda entrega los ajustados con
+# registros reales de atenciones y cada consumidor los pasa como `parametros`.
+CONSULTAS_BASE_INICIAL = 35  # promedio diario Cesfam La Floresta (ajustable)
+CORTES_DEMANDA = [12, 35, 55, 150]
+FACTORES_DEMANDA_INICIALES = (1.0, 1.3, 1.7, 2.2, 2.8)
+PARAMETROS_DEMANDA_INICIALES = {'base': CONSULTAS_BASE_INICIAL, 'factores': FACTORES_DEMANDA_INICIALES,
+                                'version': None}
+CORTES_DOTACION = [12, 35, 55]
+ADICIONALES_DOTACION = [0, 1, 2, 3]
+
+
+def estimar_demanda(pm25_value, parametros=PARAMETROS_DEMANDA_INICIALES):
+    """Consultas esperadas en el día completo (no por turno) según el PM2.5."""
+    factor = parametros['factores'][bisect.bisect_left(CORTES_DEMANDA, pm25_value)]
+    return int(parametros['base'] * factor)
+
+
+def estimar_demanda_serie(pm25, parametros=PARAMETROS_DEMANDA_INICIALES):
+    """estimar_demanda para un arreglo completo (mismos cortes, sin apply): consultas por día."""
+    factores = np.asarray(parametros['factores'])[np.searchsorted(CORTES_DEMANDA, np.asarray(pm25), side='left')]
+    return (parametros['base'] * factores).astype(int)
+
+
+def estimar_demanda_turno_serie(pm25, parametros=PARAMETROS_DEMANDA_INICIALES):
+    """Consultas esperadas en un turno: la demanda diaria repartida entre los TURNOS (hacia arriba)."""
+    return np.ceil(estimar_demanda_serie(pm25, parametros) / len(TURNOS)).astype(int)
+
+
+# --- DOTACIÓN POR TURNO ---
+def recomendar_dotacion(pm25_value):
+    """Personal adicional sugerido según PM2.5. Devuelve (adicionales, texto de recomendación)."""
+    if pm25_value <= 12:
+        return 0, "Dotación base suficiente."
+    elif pm25_value <= 35:
+        return 1, "Agregar 1 profesional (preferentemente enfermería o técnico paramédico)."
+    elif pm25_value <= 55:
+        return 2, "Asignar 2 adicionales. Revisar insumos respiratorios."
+    else:
+        return 3, "Activar plan de contingencia: 3 adicionales, revisar oxígeno y medicamentos."
+
+
+def dotacion_adicional_serie(pm25):
+    """Personal adicional de recomendar_dotacion para un arreglo completo."""
+    return np.asarray(ADICIONALES_DOTACION)[np.searchsorted(CORTES_DOTACION, np.asarray(pm25), side='left')]
+
+
+def estacion_referencia(ultimos_pm25):
+    # Simulación: seleccionar estación más cercana al Cesfam
+    return ultimos_pm25.iloc[0]  # Ajustar por filtro real si se conoce
+
+
+def recomendacion_turno(ultimos_pm25, turno, establecimiento=ESTABLECIMIENTO, dotacion_base=DOTACION_BASE,
+                        fecha=None, parametros=PARAMETROS_DEMANDA_INICIALES):
+    """Fila del reporte de Gestión de Turnos y texto de la recomendación.
+
+    'Consultas Esperadas' son las del turno (estimar_demanda_turno_serie), no las del día.
+    """
+    ubicacion_cesfam = estacion_referencia(ultimos_pm25)
+    pm25_actual = ubicacion_cesfam['value']
+    adicional, recomendacion = recomendar_dotacion(pm25_actual)
+    fila = {
+        'Establecimiento': establecimiento,
+        'Turno': turno,
+        'PM2.5': pm25_actual,
+        'Nivel': ubicacion_cesfam['nivel'],
+        'Consultas Esperadas': int(estimar_demanda_turno_serie(pm25_actual, parametros)),
+        'Dotacion Base': dotacion_base,
+        'Adicional': adicional,
+        'Total Recomendado': dotacion_base + adicional,
+        'Fecha': (fecha or datetime.now()).strftime("%Y-%m-%d %H:%M")
+    }
+    return fila, recomendacion
@@ -0,0 +1,203 @@
+# motor_arrow.py
+# Preparación de las mediciones con pyarrow (AIRCESFAM_MOTOR=arrow): mismas
+# etapas y mismas filas que motor.preparar_datos, sin columnas object de
+# pandas ni apply fila a fila.
+#
+# - Cada archivo se lee con pyarrow.dataset y solo con las columnas que se
+#   usan. El filtro de contaminantes clave y valores nulos se evalúa durante
+#   la lectura y la hora local se interpreta en la misma proyección.
+# - La deduplicación ordena las claves (sort_indices, estable) y conserva la
+#   última aparición de cada una, como deduplicacion.IndiceClaves en una carga
+#   completa. Los contadores cuentan solo los contaminantes clave.
+# - La revisión de calidad reutiliza calidad.revisar_calidad sobre un
+#   DataFrame de cuatro columnas y agrega las flags a la tabla.
+# - La clasificación busca cada valor en los cortes de motor.NIVELES con
+#   np.searchsorted.
+# motor.obtener_datos publica la tabla resultante sin pasarla por pandas; el
+# DataFrame de la app se arma después desde el mapa de memoria del almacén.
+
+import logging
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+
+import calidad
+import deduplicacion
+import metricas
+import motor
+from metricas import medir
+
+logger = logging.getLogger("aircesfam.motor_arrow")
+
+COLUMNAS_OPCIONALES = ['unit', 'timezone']  # se conservan si vienen en los archivos
+FORMATO_HORA = "%Y-%m-%dT%H:%M:%S%z"        # 2025-07-01T08:00:00-04:00
+TIPOS = {'location_id': pa.int64(), 'location_name': pa.string(), 'parameter': pa.string(),
+         'value': pa.float64(), 'datetimeUtc': pa.string(), 'latitude': pa.float64(), 'longitude': pa.float64()}
+
+
+# --- CARGA ---
+def _formato(archivo):
+    if archivo.endswith(".parquet"):
+        return ds.ParquetFileFormat()
+    tipos = {**TIPOS, 'datetimeLocal': pa.string()}
+    return ds.CsvFileFormat(convert_options=pa_csv.ConvertOptions(column_types=tipos))
+
+
+def _hora_utc(campo, tipo):
+    if pa.types.is_timestamp(tipo):
+        return campo.cast(pa.timestamp("us", tz=tipo.tz or "UTC"))
+    return pc.strptime(campo, format=FORMATO_HORA, unit="us", error_is_null=True)
+
+
+def leer_archivo(archivo):
+    """Mediciones de contaminantes clave con valor, como Table (datetimeLocal en UTC)."""
+    dataset = ds.dataset(archivo, format=_formato(archivo))
+    esquema = dataset.schema
+    faltantes = [c for c in motor.COLUMNAS_ENTRADA if c not in esquema.names]
+    if faltantes:
+        raise ValueError(f"carga: faltan columnas {', '.join(faltantes)}")
+
+    columnas = {c: ds.field(c).cast(t) for c, t in TIPOS.items()}
+    columnas['datetimeLocal'] = _hora_utc(ds.field('datetimeLocal'), esquema.field('datetimeLocal').type)
+    columnas.update({c: ds.field(c).cast(pa.string()) for c in COLUMNAS_OPCIONALES if c in esquema.names})
+    filtro = (ds.field('parameter').isin(motor.contaminantes_clave) & ds.field('location_name').is_valid()
+              & ds.field('value').is_valid() & ~pc.is_nan(ds.field('value')))
+    return dataset.to_table(columns=columnas, filter=filtro)
+
+
+def cargar_archivos(archivos):
+    """Lee y une los archivos. Devuelve (Table o None, lista de errores por archivo)."""
+    tablas = []
+    errores = []
+    for archivo in archivos:
+        try:
+            tablas.append(leer_archivo(archivo))
+        except Exception as e:
+            errores.append((os.path.basename(archivo), str(e)))
+            logger.warning("Error al leer %s: %s", archivo, e)
+
+    if not tablas:
+        return None, errores
+    return pa.concat_tables(tablas, promote_options="permissive"), errores
+
+
+# --- LIMPIEZA Y PREPARACIÓN ---
+def limpiar(tabla):
+    """datetimeLocal en la zona horaria más frecuente del conjunto; descarta horas ilegibles."""
+    zona = motor.ZONA_HORARIA
+    if 'timezone' in tabla.column_names:
+        conteo = pc.value_counts(tabla['timezone'].drop_null())
+        if len(conteo):
+            # Ante un empate, la primera en orden alfabético (como Series.mode)
+            mas_frecuentes = conteo.field('values').filter(pc.equal(conteo.field('counts'), pc.max(conteo.field('counts'))))
+            zona = pc.min(mas_frecuentes).as_py()
+    indice = tabla.column_names.index('datetimeLocal')
+    tabla = tabla.set_column(indice, 'datetimeLocal', tabla['datetimeLocal'].cast(pa.timestamp("us", tz=zona)))
+    return tabla.filter(pc.field('datetimeLocal').is_valid())
+
+
+def deduplicar(tabla):
+    """Última aparición de cada (location_id, parameter, datetimeUtc). Devuelve (Table, contadores)."""
+    claves = deduplicacion.COLUMNAS_CLAVE
+    n = tabla.num_rows
+    if n == 0:
+        return tabla, dict.fromkeys(deduplicacion.NOMBRES_CONTADORES, 0)
+
+    orden = pc.sort_indices(tabla.select(claves), sort_keys=[(c, "ascending") for c in claves])
+    ordenada = tabla.select(claves + ['value']).take(orden)
+    cambio = np.zeros(n - 1, dtype=bool)
+    for c in claves:
+        columna = ordenada[c]
+        cambio |= pc.fill_null(pc.not_equal(columna.slice(1), columna.slice(0, n - 1)), True).to_numpy()
+    es_ultima = np.r_[cambio, True]
+    grupo = np.cumsum(np.r_[True, cambio]) - 1
+
+    valores = ordenada['value'].to_numpy()
+    descartadas = ~es_ultima
+    duplicadas = int((descartadas & (valores == valores[es_ultima][grupo])).sum())
+    contadores = {'recibidas': n, 'nuevas': int(es_ultima.sum()), 'duplicadas': duplicadas,
+                  'corregidas': int(descartadas.sum()) - duplicadas}
+    return tabla.take(np.sort(orden.to_numpy()[es_ultima])), contadores
+
+
+def revisar_calidad(tabla):
+    """Agrega las columnas flag_* y dato_valido. Devuelve la tabla ordenada por serie y hora."""
+    orden = [(c, "ascending") for c in calidad.COLUMNAS_SERIE + ['datetimeLocal']]
+    tabla = tabla.take(pc.sort_indices(tabla, sort_keys=orden))
+    # Ya ordenado: revisar_calidad conserva el orden de las filas
+    flags = calidad.revisar_calidad(tabla.select(calidad.COLUMNAS_SERIE + ['value', 'datetimeLocal']).to_pandas())
+    for c in calidad.COLUMNAS_FLAG + ['dato_valido']:
+        tabla = tabla.append_column(c, pa.array(flags[c].to_numpy(dtype=bool)))
+    return tabla
+
+
+def agregar_fecha_hora(tabla):
+    local = pc.local_timestamp(tabla['datetimeLocal'])
+    return (tabla.append_column('fecha', local.cast(pa.date32()))
+            .append_column('hora', pc.hour(local).cast(pa.int32())))
+
+
+def clasificar(tabla):
+    """Columnas nivel y color según los cortes de motor.NIVELES (sin recorrer filas)."""
+    etiquetas = [motor.NIVEL_OTROS] + [e for _, niveles in motor.NIVELES.values() for e in niveles]
+    codigos = np.zeros(tabla.num_rows, dtype=np.int32)  # 0: NIVEL_OTROS
+    valores = tabla['value'].to_numpy()
+    primero = 1
+    for parametro, (cortes, niveles) in motor.NIVELES.items():
+        filas = pc.equal(tabla['parameter'], parametro).to_numpy()
+        codigos[filas] = primero + np.searchsorted(cortes, valores[filas], side='left')
+        primero += len(niveles)
+    for i, columna in enumerate(['nivel', 'color']):
+        tabla = tabla.append_column(columna, pc.take(pa.array([e[i] for e in etiquetas]), codigos))
+    return tabla
+
+
+def _texto_largo(tabla):
+    """Textos como large_string, el mismo esquema que publica el motor pandas."""
+    campos = [pa.field(f.name, pa.large_string()) if pa.types.is_string(f.type) else f for f in tabla.schema]
+    return tabla.cast(pa.schema(campos))
+
+
+def preparar_tabla(tabla):
+    """Equivalente a motor.preparar_datos para una Table de cargar_archivos."""
+    with medir("limpieza"):
+        tabla = limpiar(tabla)
+
+    with medir("deduplicacion"):
+        tabla, contadores = deduplicar(tabla)
+    for nombre, valor in contadores.items():
+        metricas.registrar_valor("deduplicacion_filas", valor, tipo=nombre)
+
+    with medir("calidad"):
+        tabla = revisar_calidad(tabla)
+    tabla = agregar_fecha_hora(tabla)
+
+    with medir("clasificacion"):
+        tabla = clasificar(tabla)
+    columnas = (motor.COLUMNAS_ENTRADA + [c for c in COLUMNAS_OPCIONALES if c in tabla.column_names]
+                + [c for c in motor.COLUMNAS_PREPARADAS if c not in motor.COLUMNAS_ENTRADA])
+    return _texto_largo(tabla.select(columnas))
+
+
+# --- CONSULTAS SOBRE LA TABLA PREPARADA ---
+def ultimos_valores(tabla, parametro='pm25'):
+    """Como motor.ultimos_valores, agrupando en Arrow; solo el resultado pasa a pandas."""
+    filas = tabla.filter((pc.field('parameter') == parametro) & pc.field('dato_valido')).sort_by('datetimeLocal')
+    otras = [c for c in filas.column_names if c != 'location_name']
+    ultimos = filas.group_by('location_name', use_threads=False).aggregate([(c, "last") for c in otras])
+    ultimos = ultimos.rename_columns([c.removesuffix("_last") for c in ultimos.column_names])
+    return ultimos.select(['location_name'] + otras).sort_by('location_name').to_pandas()
+
+
+def resumen_diario(tabla):
+    """Como motor.resumen_diario: promedio, máximo y lecturas por estación, parámetro y día."""
+    claves = ['location_name', 'parameter', 'fecha']
+    resumen = (tabla.filter(pc.field('dato_valido'))
+               .group_by(claves, use_threads=False)
+               .aggregate([('value', "mean"), ('value', "max"), ('value', "count")]))
+    resumen = resumen.rename_columns({'value_mean': 'promedio', 'value_max': 'maximo', 'value_count': 'lecturas'})
+    return resumen.select(claves + ['promedio', 'maximo', 'lecturas']).sort_by([(c, "ascending") for c in claves]).to_pandas()
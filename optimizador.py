@@ -0,0 +1,166 @@
+# optimizador.py
+# Asignación de personal por establecimiento y turno para un periodo (una
+# semana por defecto), con dotaciones por rol limitadas.
+#
+# La demanda de cada turno sale del PM2.5 promedio de las estaciones de
+# referencia del establecimiento: la demanda diaria de estimar_demanda (con los
+# parámetros de calibracion.parametros_demanda) repartida entre los turnos. El personal disponible se
+# describe como grupos por rol: cuántas personas hay, cuántos turnos puede
+# hacer cada una en la semana y en qué establecimientos puede trabajar. Una
+# persona hace a lo más un turno por día: por grupo y fecha se asignan como
+# máximo "cantidad" turnos, lo que basta para repartirlos entre personas
+# distintas (en rotación) sin pasar de turnos_semana.
+#
+# Algoritmo voraz:
+#   1. Cubrir el mínimo de cada rol en todos los turnos, empezando por los de
+#      mayor demanda.
+#   2. Mientras queden consultas sin cubrir, asignar al turno con más demanda
+#      descubierta (cola de prioridad) una persona del grupo con mayor
+#      capacidad de atención que aún tenga turnos y personas libres ese día.
+# Para una red regional de una semana (decenas de establecimientos, 21 turnos
+# cada uno) resuelve en milisegundos.
+
+import heapq
+import json
+
+import pandas as pd
+
+import calibracion
+import reporte
+from metricas import medir
+
+# rol: consultas que atiende por turno y mínimo por turno (dotación base de 5)
+ROLES = {
+    'medico': {'capacidad': 12, 'minimo': 1},
+    'enfermera': {'capacidad': 8, 'minimo': 1},
+    'tecnico': {'capacidad': 6, 'minimo': 1},
+    'administrativo': {'capacidad': 0, 'minimo': 1},
+    'aseo': {'capacidad': 0, 'minimo': 1},
+}
+# personas por rol y turnos por semana de cada una (dotación por defecto de un Cesfam)
+PERSONAL = [
+    {'rol': 'medico', 'cantidad': 8, 'turnos_semana': 5},
+    {'rol': 'enfermera', 'cantidad': 10, 'turnos_semana': 5},
+    {'rol': 'tecnico', 'cantidad': 12, 'turnos_semana': 5},
+    {'rol': 'administrativo', 'cantidad': 5, 'turnos_semana': 5},
+    {'rol': 'aseo', 'cantidad': 5, 'turnos_semana': 5},
+]
+
+
+def red_por_defecto(df):
+    return {'establecimientos': reporte.establecimientos_por_defecto(df), 'roles': ROLES, 'personal': PERSONAL}
+
+
+def leer_red(ruta):
+    """JSON con "establecimientos" (como en reporte.py), "roles" y "personal".
+
+    En "personal", cada grupo puede limitarse a algunos establecimientos con la
+    lista "establecimientos" (por nombre); si no, puede ir a cualquiera.
+    """
+    with open(ruta, encoding="utf-8") as f:
+        red = json.load(f)
+    red.setdefault('roles', ROLES)
+    red.setdefault('personal', PERSONAL)
+    return red
+
+
+def validar_red(roles, personal):
+    """Revisa roles y grupos de personal; ValueError con todos los problemas encontrados."""
+    problemas = []
+    for rol, regla in roles.items():
+        capacidad = regla.get('capacidad') if isinstance(regla, dict) else None
+        if not isinstance(capacidad, (int, float)) or capacidad < 0:
+            problemas.append(f"rol '{rol}': falta 'capacidad' (consultas por turno, número >= 0)")
+        elif not isinstance(regla.get('minimo', 0), int) or regla.get('minimo', 0) < 0:
+            problemas.append(f"rol '{rol}': 'minimo' debe ser un entero >= 0")
+    for n, grupo in enumerate(personal, start=1):
+        if grupo.get('rol') not in roles:
+            problemas.append(f"personal #{n}: rol '{grupo.get('rol')}' no está en 'roles'")
+        for campo in ('cantidad', 'turnos_semana'):
+            if not isinstance(grupo.get(campo), int) or grupo[campo] < 0:
+                problemas.append(f"personal #{n}: falta '{campo}' (entero >= 0)")
+    if problemas:
+        raise ValueError("red inválida: " + "; ".join(problemas))
+
+
+def demanda_turnos(df, establecimientos, desde, hasta):
+    """Consultas esperadas en cada turno por establecimiento y fecha (demanda calibrada de cada uno)."""
+    df = df[(df['fecha'] >= desde) & (df['fecha'] <= hasta)]
+    tablas = []
+    for e in establecimientos:
+        turnos = reporte.dotacion_por_turno(df, e['estaciones'], 0, calibracion.parametros_demanda(e['nombre']))
+        tablas.append(turnos[['fecha', 'turno', 'pm25', 'consultas_esperadas']].assign(establecimiento=e['nombre']))
+    return pd.concat(tablas, ignore_index=True)
+
+
+def optimizar(demanda, roles, personal, dias=7):
+    """Devuelve (asignaciones, resumen por turno).
+
+    asignaciones: establecimiento, fecha, turno, rol, personas.
+    resumen: demanda, capacidad asignada, personas y consultas sin cubrir por turno.
+    """
+    validar_red(roles, personal)
+    with medir("optimizador"):
+        turnos = demanda.reset_index(drop=True)
+        n = len(turnos)
+        capacidad = [0] * n
+        asignado = {}  # (turno, grupo) -> personas
+        en_dia = {}  # (grupo, fecha) -> personas del grupo ya asignadas ese día
+        grupos = [dict(g, restante=g['turnos_semana'] * g['cantidad'] * dias // 7) for g in personal]
+        horario = list(zip(turnos['fecha'], turnos['turno']))
+        lugar = turnos['establecimiento'].tolist()
+        # Grupos que pueden trabajar en cada establecimiento (evita recorrer toda la red)
+        por_lugar = {e: [k for k, g in enumerate(grupos) if e in g.get('establecimientos', [e])] for e in set(lugar)}
+        faltantes = {}
+
+        def disponibles(i, rol=None):
+            return [k for k in por_lugar[lugar[i]]
+                    if (rol is None or grupos[k]['rol'] == rol) and grupos[k]['restante'] > 0
+                    and en_dia.get((k, horario[i][0]), 0) < grupos[k]['cantidad']]
+
+        def asignar(i, k):
+            grupos[k]['restante'] -= 1
+            en_dia[(k, horario[i][0])] = en_dia.get((k, horario[i][0]), 0) + 1
+            asignado[(i, k)] = asignado.get((i, k), 0) + 1
+            capacidad[i] += roles[grupos[k]['rol']]['capacidad']
+
+        # 1. Mínimos por rol, primero en los turnos de mayor demanda
+        for i in turnos['consultas_esperadas'].sort_values(ascending=False, kind='stable').index:
+            for rol, regla in roles.items():
+                for _ in range(regla.get('minimo', 0)):
+                    candidatos = disponibles(i, rol)
+                    if not candidatos:
+                        faltantes.setdefault(i, []).append(rol)
+                        break
+                    asignar(i, max(candidatos, key=lambda k: grupos[k]['restante']))
+
+        # 2. Demanda descubierta, de mayor a menor
+        cola = [(-(d - capacidad[i]), i) for i, d in enumerate(turnos['consultas_esperadas']) if d > capacidad[i]]
+        heapq.heapify(cola)
+        while cola:
+            _, i = heapq.heappop(cola)
+            candidatos = [k for k in disponibles(i) if roles[grupos[k]['rol']]['capacidad'] > 0]
+            if not candidatos:
+                continue  # sin personal para este turno: queda con déficit
+            asignar(i, max(candidatos, key=lambda k: (roles[grupos[k]['rol']]['capacidad'], grupos[k]['restante'])))
+            descubierto = turnos.at[i, 'consultas_esperadas'] - capacidad[i]
+            if descubierto > 0:
+                heapq.heappush(cola, (-descubierto, i))
+
+    filas = [(lugar[i], *horario[i], grupos[k]['rol'], personas) for (i, k), personas in asignado.items()]
+    asignaciones = (pd.DataFrame(filas, columns=['establecimiento', 'fecha', 'turno', 'rol', 'personas'])
+                    .groupby(['establecimiento', 'fecha', 'turno', 'rol'], as_index=False)['personas'].sum())
+    personas = asignaciones.groupby(['establecimiento', 'fecha', 'turno'])['personas'].sum()
+    resumen = turnos.assign(capacidad=capacidad)
+    resumen = resumen.merge(personas.rename('personal').reset_index(), on=['establecimiento', 'fecha', 'turno'], how='left')
+    resumen['personal'] = resumen['personal'].fillna(0).astype(int)
+    resumen['sin_cubrir'] = (resumen['consultas_esperadas'] - resumen['capacidad']).clip(lower=0)
+    resumen['roles_faltantes'] = [", ".join(faltantes.get(i, [])) for i in range(n)]
+    return asignaciones, resumen
+
+
+def optimizar_semana(df, red=None, desde=None, hasta=None):
+    red = red or red_por_defecto(df)
+    desde, hasta = reporte.periodo(df, desde, hasta)
+    demanda = demanda_turnos(df, red['establecimientos'], desde, hasta)
+    return optimizar(demanda, red['roles'], red['personal'], dias=(hasta - desde).days + 1)
@@ -0,0 +1,173 @@
+# reporte.py
+# Reporte semanal de gestión (Excel) por establecimiento: niveles diarios por
+# estación, episodios, consultas esperadas y dotación sugerida por turno.
+#
+# Todo sale de agregados calculados de una vez sobre la tabla preparada
+# (groupby, searchsorted); el libro se escribe con openpyxl en modo
+# write_only, fila a fila, así que la memoria no crece con el periodo.
+# Varios establecimientos se generan en paralelo (cli.py reporte --procesos).
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import alertas
+import calibracion
+import motor
+from metricas import medir
+
+DIAS_REPORTE = 7
+PASO_MUESTREO = pd.Timedelta(hours=1)  # las mediciones son horarias
+
+
+def establecimientos_por_defecto(df):
+    """Solo el Cesfam La Floresta, con la misma estación de referencia del dashboard."""
+    referencia = motor.estacion_referencia(motor.ultimos_valores(df, 'pm25'))
+    return [{'nombre': motor.ESTABLECIMIENTO, 'estaciones': [int(referencia['location_id'])],
+             'dotacion_base': motor.DOTACION_BASE}]
+
+
+def leer_establecimientos(ruta):
+    """JSON: [{"nombre": ..., "estaciones": [location_id, ...], "dotacion_base": 5}, ...]"""
+    with open(ruta, encoding="utf-8") as f:
+        establecimientos = json.load(f)
+    for e in establecimientos:
+        e.setdefault('dotacion_base', motor.DOTACION_BASE)
+    return establecimientos
+
+
+def periodo(df, desde=None, hasta=None, dias=DIAS_REPORTE):
+    """(desde, hasta) como fechas; por defecto la última semana con datos."""
+    hasta = pd.Timestamp(hasta).date() if hasta else df['fecha'].max()
+    desde = pd.Timestamp(desde).date() if desde else hasta - pd.Timedelta(days=dias - 1)
+    return desde, hasta
+
+
+# --- AGREGADOS ---
+def niveles_diarios(df):
+    resumen = motor.resumen_diario(df)
+    resumen['nivel'] = [motor.nivel_contaminacion(v, p)[0] for v, p in zip(resumen['promedio'], resumen['parameter'])]
+    return resumen.sort_values(['fecha', 'location_name', 'parameter'])
+
+
+def episodios(df):
+    """Tramos de horas válidas seguidas sobre el umbral de entrada de alertas.REGLAS.
+
+    Una hora faltante o inválida (salto mayor que PASO_MUESTREO) corta el tramo.
+    """
+    datos = df[df['dato_valido'] & df['parameter'].isin(list(alertas.REGLAS))].sort_values(
+        ['location_id', 'parameter', 'datetimeLocal'])
+    umbral = datos['parameter'].map({p: r['entrada'] for p, r in alertas.REGLAS.items()})
+    sobre = (datos['value'] > umbral).to_numpy()
+    serie = (datos['location_id'].astype(str) + "|" + datos['parameter']).to_numpy()
+    salto = (datos['datetimeLocal'].diff() > PASO_MUESTREO).to_numpy()[1:]
+    inicio_tramo = np.r_[True, (sobre[1:] != sobre[:-1]) | (serie[1:] != serie[:-1]) | salto]
+    tramos = datos.assign(tramo=np.cumsum(inicio_tramo))[sobre]
+    if tramos.empty:
+        return pd.DataFrame(columns=['location_name', 'parameter', 'inicio', 'fin', 'horas', 'maximo'])
+    return (tramos.groupby('tramo')
+            .agg(location_name=('location_name', 'first'), parameter=('parameter', 'first'),
+                 inicio=('datetimeLocal', 'min'), fin=('datetimeLocal', 'max'),
+                 horas=('value', 'size'), maximo=('value', 'max'))
+            .sort_values('inicio').reset_index(drop=True))
+
+
+def consultas_diarias(df, parametros=motor.PARAMETROS_DEMANDA_INICIALES):
+    """Consultas esperadas por estación y día según su PM2.5 promedio diario."""
+    pm25 = motor.resumen_diario(df[df['parameter'] == 'pm25'])
+    pm25['consultas_esperadas'] = motor.estimar_demanda_serie(pm25['promedio'], parametros)
+    return pm25[['fecha', 'location_name', 'promedio', 'maximo', 'consultas_esperadas']].sort_values(
+        ['fecha', 'location_name'])
+
+
+def dotacion_por_turno(df, estaciones, dotacion_base, parametros=motor.PARAMETROS_DEMANDA_INICIALES):
+    """PM2.5 promedio, consultas esperadas en el turno y dotación sugerida por fecha y turno."""
+    datos = df[df['dato_valido'] & (df['parameter'] == 'pm25') & df['location_id'].isin(estaciones)]
+    datos = datos.assign(turno=motor.turno_de_hora(datos['hora'].to_numpy()))
+    turnos = datos.groupby(['fecha', 'turno'], sort=True)['value'].mean().reset_index(name='pm25')
+    turnos['consultas_esperadas'] = motor.estimar_demanda_turno_serie(turnos['pm25'], parametros)
+    turnos['dotacion_base'] = dotacion_base
+    turnos['adicional'] = motor.dotacion_adicional_serie(turnos['pm25'])
+    turnos['total_recomendado'] = turnos['dotacion_base'] + turnos['adicional']
+    return turnos
+
+
+# --- ESCRITURA ---
+def _hoja(libro, titulo, tabla, encabezados):
+    hoja = libro.create_sheet(titulo)
+    hoja.append(encabezados)
+    for fila in tabla.itertuples(index=False):
+        hoja.append([v.replace(tzinfo=None) if isinstance(v, pd.Timestamp) else
+                     (v.item() if isinstance(v, np.generic) else v) for v in fila])
+
+
+def escribir_reporte(df, establecimiento, desde, hasta, ruta, parametros=motor.PARAMETROS_DEMANDA_INICIALES):
+    """Escribe el libro de un establecimiento para el periodo [desde, hasta] (ruta o archivo binario).
+
+    parametros: los de la demanda del establecimiento (calibracion.parametros_demanda).
+    """
+    from openpyxl import Workbook
+
+    with medir("reporte_agregados"):
+        df = df[(df['fecha'] >= desde) & (df['fecha'] <= hasta)]
+        niveles = niveles_diarios(df)
+        tramos = episodios(df)
+        consultas = consultas_diarias(df, parametros)
+        turnos = dotacion_por_turno(df, establecimiento['estaciones'], establecimiento['dotacion_base'], parametros)
+
+    with medir("reporte_excel"):
+        libro = Workbook(write_only=True)
+        resumen = libro.create_sheet("Resumen")
+        for fila in [
+            ["Establecimiento", establecimiento['nombre']],
+            ["Periodo", f"{desde} a {hasta}"],
+            ["Estaciones de referencia", ", ".join(map(str, establecimiento['estaciones']))],
+            ["Episodios sobre umbral", len(tramos)],
+            ["Turnos con dotación adicional", int((turnos['adicional'] > 0).sum())],
+            ["Generado", datetime.now().strftime("%Y-%m-%d %H:%M")],
+        ]:
+            resumen.append(fila)
+        _hoja(libro, "Niveles diarios", niveles,
+              ["Estación", "Parámetro", "Fecha", "Promedio", "Máximo", "Lecturas", "Nivel"])
+        _hoja(libro, "Episodios", tramos, ["Estación", "Parámetro", "Inicio", "Fin", "Horas", "Máximo"])
+        _hoja(libro, "Consultas", consultas, ["Fecha", "Estación", "PM2.5 promedio", "PM2.5 máximo", "Consultas esperadas (día)"])
+        _hoja(libro, "Dotación", turnos, ["Fecha", "Turno", "PM2.5", "Consultas esperadas (turno)", "Dotación base",
+                                          "Adicional", "Total recomendado"])
+        if isinstance(ruta, str):
+            os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        libro.save(ruta)
+    return ruta
+
+
+def nombre_archivo(establecimiento, desde, hasta):
+    nombre = "".join(c if c.isalnum() else "_" for c in establecimiento['nombre']).strip("_")
+    return f"reporte_{nombre}_{desde}_{hasta}.xlsx"
+
+
+def _generar(ruta_datos, establecimiento, desde, hasta, ruta, parametros):
+    # Cada proceso mapea la tabla ya publicada en el almacén (no la vuelve a preparar)
+    df, _ = motor.obtener_datos(ruta_datos)
+    return escribir_reporte(df, establecimiento, desde, hasta, ruta, parametros)
+
+
+def generar_reportes(ruta_datos, establecimientos=None, desde=None, hasta=None, directorio="reportes", procesos=None):
+    """Un libro por establecimiento. Devuelve las rutas escritas."""
+    df, _ = motor.obtener_datos(ruta_datos)
+    if df is None:
+        raise ValueError("No hay datos para el reporte")
+    establecimientos = establecimientos or establecimientos_por_defecto(df)
+    desde, hasta = periodo(df, desde, hasta)
+    rutas = [os.path.join(directorio, nombre_archivo(e, desde, hasta)) for e in establecimientos]
+    # La calibración se lee una vez aquí y cada proceso recibe los parámetros de su establecimiento
+    parametros = [calibracion.parametros_demanda(e['nombre']) for e in establecimientos]
+    if len(establecimientos) == 1 or procesos == 1:
+        return [escribir_reporte(df, e, desde, hasta, r, p) for e, r, p in zip(establecimientos, rutas, parametros)]
+    del df
+    n = len(establecimientos)
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        return list(pool.map(_generar, [ruta_datos] * n, establecimientos, [desde] * n, [hasta] * n, rutas,
+                             parametros))
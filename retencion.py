@@ -0,0 +1,333 @@
+# retencion.py
+# Retención por niveles de las mediciones importadas (importador.py).
+#
+#   crudo   : lecturas horarias de los últimos DIAS_CRUDOS días, en los archivos
+#             por estación del importador (openaq_location_<id>_archivo.parquet)
+#   horario : las filas quitadas de esos archivos, tal cual (todos los
+#             parámetros, también las inválidas), DIAS_HORARIOS días más atrás
+#             (almacen/agregados/horario/location_id=<id>/mes=<AAAA-MM>/)
+#   diario  : promedio, máximo, percentiles y horas de excedencia por día,
+#             DIAS_DIARIOS días antes del nivel horario (almacen/agregados/diario.parquet)
+#   mensual : las mismas métricas por mes de todo lo anterior al nivel horario,
+#             sin límite (almacen/agregados/mensual.parquet)
+#
+# Los niveles no se traslapan: un mes pasa del nivel horario a los agregados
+# cuando sale de su periodo, y se agrega entonces desde sus horas completas,
+# así que una corrección tardía dentro del nivel horario no deja un día o un
+# mes agregado a medias (las que llegan para meses ya agregados se descartan).
+# Solo se recortan los archivos del importador: las descargas que se dejan en
+# la carpeta de datos nunca se modifican. Los cortes caen en el primer día de
+# un mes. Primero se guardan los niveles y después se recortan los archivos;
+# una compactación interrumpida se puede repetir. resumen_diario y
+# serie_agregada combinan los agregados, los días del nivel horario
+# (agregados al leerlos) y las lecturas horarias.
+#
+# Sin AIRCESFAM_DIAS_CRUDOS (o --dias-crudos) no se compacta nada. Se ejecuta
+# solo de forma explícita, con `python cli.py retencion` (p. ej. desde una
+# tarea programada); un archivo de bloqueo evita dos compactaciones a la vez.
+
+import glob
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import almacen
+import calidad
+import importador
+import motor
+from metricas import medir
+
+logger = logging.getLogger("aircesfam.retencion")
+
+DIAS_CRUDOS = int(os.getenv("AIRCESFAM_DIAS_CRUDOS", "0")) or None
+DIAS_HORARIOS = int(os.getenv("AIRCESFAM_DIAS_HORARIOS", "90"))
+DIAS_DIARIOS = int(os.getenv("AIRCESFAM_DIAS_DIARIOS", str(3 * 365)))
+DIR_AGREGADOS = os.path.join(almacen.DIR_ALMACEN, "agregados")
+DIR_HORARIO = os.path.join(DIR_AGREGADOS, "horario")
+RUTA_ESTADO = os.path.join(almacen.DIR_ALMACEN, "retencion.json")
+RUTA_BLOQUEO = os.path.join(almacen.DIR_ALMACEN, "retencion.lock")
+BLOQUEO_VENCIDO = 6 * 3600  # segundos: un bloqueo más viejo quedó de un proceso caído
+
+# Horas sobre el límite de "Moderado" (mismos cortes que nivel_contaminacion)
+UMBRALES_EXCEDENCIA = {'pm25': 35, 'pm10': 154}
+PERCENTILES = {'p50': 0.5, 'p90': 0.9, 'p98': 0.98}
+CLAVES = ['location_id', 'location_name', 'parameter', 'fecha']
+COLUMNAS = CLAVES + ['promedio', 'maximo'] + list(PERCENTILES) + ['horas', 'horas_invalidas', 'horas_excedencia']
+
+
+def ruta_nivel(nivel):
+    return os.path.join(DIR_AGREGADOS, f"{nivel}.parquet")
+
+
+def inicio_mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def cortes(ultima_fecha, dias_crudos, dias_horarios=DIAS_HORARIOS, dias_diarios=DIAS_DIARIOS):
+    """Inicio de los periodos crudo, horario y diario, en primer día de mes."""
+    corte_crudo = inicio_mes(ultima_fecha - timedelta(days=dias_crudos))
+    corte_horario = inicio_mes(corte_crudo - timedelta(days=dias_horarios))
+    return corte_crudo, corte_horario, inicio_mes(corte_horario - timedelta(days=dias_diarios))
+
+
+# --- 1. AGREGACIÓN ---
+def preparar_horario(df):
+    """Filas de los archivos del importador con hora local, flags de calidad y fecha."""
+    df = calidad.revisar_calidad(motor.limpiar(df.copy()))
+    df['fecha'] = df['datetimeLocal'].dt.date
+    return df
+
+
+def agregar(df, nivel="diario"):
+    """Métricas por estación, parámetro y día (o mes) de cualquier parámetro.
+
+    Las métricas usan solo las lecturas válidas; horas_invalidas cuenta las que
+    no pasaron la revisión de calidad.
+    """
+    datos = df[['location_id', 'location_name', 'parameter', 'fecha']].assign(
+        value=df['value'].where(df['dato_valido']), invalida=~df['dato_valido'])
+    if nivel == "mensual":
+        datos = datos.assign(fecha=pd.to_datetime(almacen.mes_de(datos['fecha'])).date)
+    umbral = datos['parameter'].map(UMBRALES_EXCEDENCIA)
+    datos = datos.assign(excede=(datos['value'] > umbral).astype(float).where(umbral.notna() & datos['value'].notna()))
+    grupos = datos.groupby(CLAVES, sort=True, observed=True)
+    resultado = grupos['value'].agg(promedio='mean', maximo='max', horas='count')
+    cuantiles = grupos['value'].quantile(list(PERCENTILES.values())).unstack()
+    resultado[list(PERCENTILES)] = cuantiles.to_numpy()
+    resultado['horas_invalidas'] = grupos['invalida'].sum()
+    resultado['horas_excedencia'] = grupos['excede'].sum(min_count=1)
+    return resultado.reset_index()[COLUMNAS]
+
+
+def leer_nivel(nivel, desde=None, hasta=None, estaciones=None):
+    ruta = ruta_nivel(nivel)
+    if not os.path.exists(ruta):
+        return pd.DataFrame(columns=COLUMNAS)
+    filtros = []
+    if estaciones:
+        filtros.append(('location_id', 'in', [int(e) for e in estaciones]))
+    if desde is not None:
+        filtros.append(('fecha', '>=', inicio_mes(desde) if nivel == "mensual" else desde))
+    if hasta is not None:
+        filtros.append(('fecha', '<=', hasta))
+    return pd.read_parquet(ruta, filters=filtros or None)
+
+
+def _guardar_nivel(df, nivel, desde=None):
+    """Une con lo guardado (la agregación nueva reemplaza a la anterior) y descarta lo previo a desde."""
+    df = pd.concat([leer_nivel(nivel), df], ignore_index=True).drop_duplicates(CLAVES, keep='last')
+    if desde is not None:
+        df = df[df['fecha'] >= desde]
+    os.makedirs(DIR_AGREGADOS, exist_ok=True)
+    ruta_tmp = ruta_nivel(nivel) + ".tmp"
+    df.sort_values(CLAVES).to_parquet(ruta_tmp, index=False)
+    os.replace(ruta_tmp, ruta_nivel(nivel))
+    return len(df)
+
+
+# --- 2. NIVEL HORARIO ---
+def ruta_horario(location_id, mes):
+    return os.path.join(DIR_HORARIO, f"location_id={location_id}", f"mes={mes}", "part.parquet")
+
+
+def _mes_local(df):
+    return df['datetimeLocal'].astype(str).str[:7]  # "2025-07-01T08:00:00-04:00" -> "2025-07"
+
+
+def guardar_horario(df, location_id, mes):
+    """Une las filas con las ya guardadas de la estación y el mes (gana la última). Devuelve el mes completo."""
+    ruta = ruta_horario(location_id, mes)
+    if os.path.exists(ruta):
+        df = pd.concat([pd.read_parquet(ruta), df], ignore_index=True)
+    df = df.drop_duplicates(importador.CLAVE, keep='last').sort_values(['parameter', 'datetimeUtc'])
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    df.to_parquet(ruta + ".tmp", index=False)
+    os.replace(ruta + ".tmp", ruta)
+    return df
+
+
+def meses_horario(estaciones=None, desde=None, hasta=None):
+    """(location_id, mes, ruta) de cada mes guardado en el nivel horario, entre los meses de desde y hasta."""
+    estaciones = {int(e) for e in estaciones} if estaciones else None
+    meses = []
+    for directorio in sorted(glob.glob(os.path.join(DIR_HORARIO, "location_id=*", "mes=*"))):
+        location_id = int(os.path.basename(os.path.dirname(directorio)).removeprefix("location_id="))
+        mes = os.path.basename(directorio).removeprefix("mes=")
+        if ((estaciones is None or location_id in estaciones)
+                and (desde is None or mes >= desde.strftime("%Y-%m"))
+                and (hasta is None or mes <= hasta.strftime("%Y-%m"))):
+            meses.append((location_id, mes, os.path.join(directorio, "part.parquet")))
+    return meses
+
+
+def podar_horario(desde):
+    """Borra los meses del nivel horario anteriores a desde (primer día de mes). Devuelve meses borrados."""
+    antiguos = meses_horario(hasta=desde - timedelta(days=1))
+    for _, _, ruta in antiguos:
+        shutil.rmtree(os.path.dirname(ruta))
+    return len(antiguos)
+
+
+# --- 3. COMPACTACIÓN ---
+def _tomar_bloqueo():
+    os.makedirs(almacen.DIR_ALMACEN, exist_ok=True)
+    if os.path.exists(RUTA_BLOQUEO) and time.time() - os.path.getmtime(RUTA_BLOQUEO) > BLOQUEO_VENCIDO:
+        os.remove(RUTA_BLOQUEO)
+    try:
+        os.close(os.open(RUTA_BLOQUEO, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+def _ultima_fecha(archivos):
+    fechas = [pd.read_parquet(a, columns=['datetimeLocal'])['datetimeLocal'].astype(str).max() for a in archivos]
+    fechas = [f for f in fechas if isinstance(f, str)]
+    return date.fromisoformat(max(fechas)[:10]) if fechas else None
+
+
+def compactar(ruta_carpeta, dias_crudos=DIAS_CRUDOS, dias_horarios=DIAS_HORARIOS, dias_diarios=DIAS_DIARIOS,
+              simular=False):
+    """Pasa a los niveles del almacén lo anterior al periodo crudo y lo recorta de los
+    archivos del importador. Devuelve un resumen (dict) o None si no corresponde."""
+    if not dias_crudos:
+        return None
+    if not _tomar_bloqueo():
+        logger.info("Otra compactación está en curso")
+        return None
+    try:
+        archivos = importador.archivos_importados(ruta_carpeta)
+        ultima = _ultima_fecha(archivos)
+        if ultima is None:
+            return None
+        corte_crudo, corte_horario, corte_diario = cortes(ultima, dias_crudos, dias_horarios, dias_diarios)
+        mes_horario, mes_diario = corte_horario.strftime("%Y-%m"), corte_diario.strftime("%Y-%m")
+        resumen = {'corte_crudo': corte_crudo.isoformat(), 'corte_horario': corte_horario.isoformat(),
+                   'corte_diario': corte_diario.isoformat(), 'filas_compactadas': 0, 'filas_quitadas': 0,
+                   'archivos': 0}
+        meses_agregados = set()
+        if os.path.exists(ruta_nivel("mensual")):
+            mensual = leer_nivel("mensual")
+            meses_agregados = set(zip(mensual['location_id'], mensual['fecha'].map(lambda f: f.strftime("%Y-%m"))))
+        diarios, mensuales, recortes = [], [], []
+
+        def agregar_mes(preparado, mes):
+            mensuales.append(agregar(preparado, "mensual"))
+            if mes >= mes_diario:
+                diarios.append(agregar(preparado, "diario"))
+
+        # 1) Nivel horario, y diario y mensual de los meses anteriores a él
+        with medir("retencion_agregacion"):
+            for archivo in archivos:
+                df = pd.read_parquet(archivo)
+                conservar = df['datetimeLocal'].astype(str).str[:10] >= corte_crudo.isoformat()
+                if conservar.all():
+                    continue
+                viejas = df[~conservar]
+                resumen['filas_compactadas'] += len(viejas)
+                recortes.append((archivo, int(len(viejas))))
+                if simular:
+                    continue
+                for (location_id, mes), filas in viejas.groupby([viejas['location_id'], _mes_local(viejas)]):
+                    if mes >= mes_horario or os.path.exists(ruta_horario(location_id, mes)):
+                        guardar_horario(filas, location_id, mes)  # se agrega al salir del nivel horario
+                    elif (location_id, mes) not in meses_agregados:
+                        agregar_mes(preparar_horario(filas), mes)
+                    # un mes ya agregado y sin horas guardadas no se reemplaza por una corrección tardía
+            if not simular:
+                # Meses que salen del nivel horario: se agregan con todas sus horas
+                for location_id, mes, ruta in meses_horario(hasta=corte_horario - timedelta(days=1)):
+                    agregar_mes(preparar_horario(pd.read_parquet(ruta)), mes)
+                # Los niveles quedan guardados antes de tocar los archivos de datos
+                vacio = pd.DataFrame(columns=COLUMNAS)
+                resumen['dias'] = _guardar_nivel(pd.concat(diarios or [vacio], ignore_index=True), "diario",
+                                                 desde=corte_diario)
+                resumen['meses'] = _guardar_nivel(pd.concat(mensuales or [vacio], ignore_index=True), "mensual")
+                podar_horario(corte_horario)
+
+        # 2) Recorte de los archivos del importador
+        with medir("retencion_recorte"):
+            for archivo, quitadas in recortes:
+                if not simular:
+                    df = pd.read_parquet(archivo)
+                    importador.reemplazar_estacion(
+                        archivo, df[df['datetimeLocal'].astype(str).str[:10] >= corte_crudo.isoformat()])
+                resumen['filas_quitadas'] += quitadas
+                resumen['archivos'] += 1
+        if not simular:
+            resumen['fecha'] = datetime.now().isoformat(timespec="seconds")
+            with open(RUTA_ESTADO, "w", encoding="utf-8") as f:
+                json.dump(resumen, f, indent=2)
+        return resumen
+    finally:
+        os.remove(RUTA_BLOQUEO)
+
+
+# --- 4. CONSULTAS SOBRE AMBOS NIVELES ---
+def primera_fecha():
+    """Primer día con datos compactados o None."""
+    for nivel in ("mensual", "diario"):
+        ruta = ruta_nivel(nivel)
+        if os.path.exists(ruta):
+            fechas = pd.read_parquet(ruta, columns=['fecha'])['fecha']
+            if len(fechas):
+                return fechas.min()
+    meses = meses_horario()
+    if meses:
+        primero = min(meses, key=lambda m: m[1])[2]
+        return date.fromisoformat(pd.read_parquet(primero, columns=['datetimeLocal'])['datetimeLocal'].min()[:10])
+    return None
+
+
+def leer_diario(desde=None, hasta=None, estaciones=None):
+    """Nivel diario más los días del nivel horario, que se agregan al leerlos."""
+    guardado = leer_nivel("diario", desde, hasta, estaciones)
+    meses = meses_horario(estaciones, desde, hasta)
+    if not meses:
+        return guardado
+    dias = agregar(preparar_horario(pd.concat([pd.read_parquet(r) for _, _, r in meses], ignore_index=True)))
+    if desde is not None:
+        dias = dias[dias['fecha'] >= desde]
+    if hasta is not None:
+        dias = dias[dias['fecha'] <= hasta]
+    return dias.reset_index(drop=True) if guardado.empty else pd.concat([guardado, dias], ignore_index=True)
+
+
+def resumen_diario(df):
+    """motor.resumen_diario de las lecturas horarias más los días compactados que no están en ellas."""
+    crudo = motor.resumen_diario(df)
+    compactado = leer_diario()
+    if compactado.empty:
+        return crudo
+    compactado = compactado.rename(columns={'horas': 'lecturas'})[list(crudo.columns)]
+    claves = ['location_name', 'parameter', 'fecha']
+    repetidos = compactado.merge(crudo[claves], on=claves, how='left', indicator=True)['_merge'] == 'both'
+    return pd.concat([compactado[~repetidos.to_numpy()], crudo], ignore_index=True)
+
+
+def serie_agregada(desde, hasta, estaciones=None, excluir_fechas=()):
+    """Promedios compactados entre dos fechas con las columnas de una serie horaria.
+
+    Se usan los días de leer_diario donde existen y el nivel mensual antes
+    de ellos; cada punto queda a mediodía de su día (o el día 15 de su mes).
+    Los días de excluir_fechas (y los meses que los contienen, en el nivel
+    mensual) ya tienen lecturas horarias y no se repiten.
+    """
+    excluir_fechas = set(excluir_fechas)
+    diario = leer_diario(desde, hasta, estaciones)
+    mensual = leer_nivel("mensual", desde, hasta, estaciones)
+    if len(diario):
+        mensual = mensual[mensual['fecha'] < inicio_mes(diario['fecha'].min())]
+    if excluir_fechas:
+        diario = diario[~diario['fecha'].isin(excluir_fechas)]
+        mensual = mensual[~mensual['fecha'].isin({inicio_mes(f) for f in excluir_fechas})]
+    mensual = mensual.assign(fecha=mensual['fecha'].map(lambda f: f.replace(day=15)), resolucion="mensual")
+    serie = pd.concat([mensual, diario.assign(resolucion="diario")], ignore_index=True)
+    momento = pd.to_datetime(serie['fecha']) + pd.Timedelta(hours=12)
+    return (serie.assign(datetimeLocal=momento.dt.tz_localize(motor.ZONA_HORARIA), value=serie['promedio'])
+            [['location_id', 'location_name', 'parameter', 'fecha', 'datetimeLocal', 'value', 'resolucion']])
@@ -0,0 +1,298 @@
+# suscriptores.py
+# Registro local de suscriptores de AirCesfam (SQLite).
+# Es el registro oficial: índice único por correo normalizado, bajas mediante
+# token (sin borrar la fila) e importación/exportación masiva en CSV. La hoja
+# de Google "suscriptores_aircesfam" queda como espejo y se actualiza en un
+# hilo aparte (SincronizadorHoja), sin bloquear la interfaz.
+#
+# Cada suscriptor elige estaciones (o una ubicación, que se traduce a las
+# estaciones más cercanas). suscripciones_estacion es un índice invertido
+# estación -> suscriptores: para avisar de una alerta solo se recorren los
+# suscriptores de las estaciones afectadas, no la lista completa.
+
+import csv
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+from datetime import datetime
+
+import almacen
+
+logger = logging.getLogger("aircesfam.suscriptores")
+
+RUTA_DB = os.path.join(almacen.DIR_ALMACEN, "suscriptores.db")
+HOJA_ESPEJO = "suscriptores_aircesfam"
+ARCHIVO_CREDENCIALES = "credentials.json"
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS suscriptores (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    email_normalizado TEXT NOT NULL UNIQUE,
+    creado TEXT NOT NULL,
+    activo INTEGER NOT NULL DEFAULT 1,
+    token_baja TEXT NOT NULL UNIQUE,
+    baja TEXT,
+    sincronizado INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_suscriptores_pendientes ON suscriptores (sincronizado) WHERE sincronizado = 0;
+CREATE TABLE IF NOT EXISTS suscripciones_estacion (
+    location_id INTEGER NOT NULL,
+    suscriptor_id INTEGER NOT NULL REFERENCES suscriptores (id),
+    PRIMARY KEY (location_id, suscriptor_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_estaciones_suscriptor ON suscripciones_estacion (suscriptor_id);
+"""
+VERSION_ESQUEMA = 2
+TODAS_LAS_ESTACIONES = 0  # location_id comodín: recibe alertas de cualquier estación
+
+
+def normalizar_email(email):
+    return (email or "").strip().lower()
+
+
+def email_valido(email):
+    email = normalizar_email(email)
+    usuario, _, dominio = email.partition("@")
+    return bool(usuario) and "." in dominio and " " not in email
+
+
+def _ahora():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def conectar(ruta=RUTA_DB):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False)
+    conexion.row_factory = sqlite3.Row
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.executescript(ESQUEMA)
+    if conexion.execute("PRAGMA user_version").fetchone()[0] < VERSION_ESQUEMA:
+        # Los suscriptores anteriores a la elección de estaciones quedan con todas
+        with conexion:
+            _asignar_todas_si_faltan(conexion)
+            conexion.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+    return conexion
+
+
+def _asignar_todas_si_faltan(conexion):
+    conexion.execute(
+        "INSERT OR IGNORE INTO suscripciones_estacion (location_id, suscriptor_id) "
+        "SELECT ?, id FROM suscriptores WHERE id NOT IN (SELECT suscriptor_id FROM suscripciones_estacion)",
+        (TODAS_LAS_ESTACIONES,))
+
+
+def buscar(conexion, email):
+    """Búsqueda por el índice único del correo normalizado (O(log n))."""
+    return conexion.execute("SELECT * FROM suscriptores WHERE email_normalizado = ?",
+                            (normalizar_email(email),)).fetchone()
+
+
+def suscribir(conexion, email, estaciones=None):
+    """Registra o reactiva un correo. Devuelve (fila, es_nuevo).
+
+    estaciones: location_id de interés; None o vacío = todas. Si el correo ya
+    estaba activo solo se actualizan sus estaciones y es_nuevo es False (no hay
+    que volver a enviar la bienvenida). Todo ocurre en una transacción con
+    INSERT ... ON CONFLICT: dos altas simultáneas del mismo correo no chocan
+    con el índice único.
+    """
+    with conexion:
+        # Sin fila devuelta: el correo ya estaba activo (el WHERE descarta la actualización)
+        filas = conexion.execute(
+            "INSERT INTO suscriptores (email, email_normalizado, creado, token_baja) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (email_normalizado) DO UPDATE SET activo = 1, baja = NULL, sincronizado = 0 "
+            "WHERE activo = 0 RETURNING id",
+            (email.strip(), normalizar_email(email), _ahora(), secrets.token_urlsafe(16))).fetchall()
+        es_nuevo = bool(filas)
+        if es_nuevo or estaciones:
+            suscriptor_id = filas[0]['id'] if filas else buscar(conexion, email)['id']
+            _reemplazar_estaciones(conexion, suscriptor_id, estaciones)
+    return buscar(conexion, email), es_nuevo
+
+
+def _reemplazar_estaciones(conexion, suscriptor_id, estaciones=None):
+    estaciones = sorted({int(e) for e in estaciones}) if estaciones else [TODAS_LAS_ESTACIONES]
+    conexion.execute("DELETE FROM suscripciones_estacion WHERE suscriptor_id = ?", (suscriptor_id,))
+    conexion.executemany("INSERT INTO suscripciones_estacion (location_id, suscriptor_id) VALUES (?, ?)",
+                         [(e, suscriptor_id) for e in estaciones])
+
+
+def afectados(conexion, estaciones):
+    """Suscriptores activos de las estaciones dadas, vía el índice invertido.
+
+    Devuelve {suscriptor_id: (fila, [location_id afectados])} para enviar un
+    solo correo por persona. Los suscritos a todas reciben todas las estaciones.
+    """
+    estaciones = sorted({int(e) for e in estaciones})
+    if not estaciones:
+        return {}
+    marcas = ", ".join("?" * (len(estaciones) + 1))
+    cursor = conexion.execute(
+        "SELECT e.location_id AS estacion, s.* FROM suscripciones_estacion e "
+        "JOIN suscriptores s ON s.id = e.suscriptor_id "
+        f"WHERE e.location_id IN ({marcas}) AND s.activo = 1",
+        (TODAS_LAS_ESTACIONES, *estaciones))
+    resultado = {}
+    for fila in cursor:
+        _, lista = resultado.setdefault(fila['id'], (fila, []))
+        if fila['estacion'] == TODAS_LAS_ESTACIONES:
+            lista.extend(estaciones)
+        else:
+            lista.append(fila['estacion'])
+    return {k: (fila, sorted(set(lista))) for k, (fila, lista) in resultado.items()}
+
+
+def dar_de_baja(conexion, token):
+    """Baja lógica con el token enviado en los correos. Devuelve el correo o None."""
+    with conexion:
+        fila = conexion.execute("SELECT id, email FROM suscriptores WHERE token_baja = ? AND activo = 1",
+                                (token,)).fetchone()
+        if fila is None:
+            return None
+        conexion.execute("UPDATE suscriptores SET activo = 0, baja = ?, sincronizado = 0 WHERE id = ?",
+                         (_ahora(), fila['id']))
+    return fila['email']
+
+
+def contar(conexion, solo_activos=True):
+    condicion = " WHERE activo = 1" if solo_activos else ""
+    return conexion.execute(f"SELECT COUNT(*) FROM suscriptores{condicion}").fetchone()[0]
+
+
+def importar_csv(conexion, ruta):
+    """Importa correos desde un CSV (columna 'email', o la primera columna si no
+    hay encabezado). Los repetidos se ignoran. Devuelve (importados, omitidos)."""
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        filas = list(csv.reader(f))
+    if not filas:
+        return 0, 0
+    columna = 0
+    encabezado = [c.strip().lower() for c in filas[0]]
+    if "email" in encabezado:
+        columna = encabezado.index("email")
+        filas = filas[1:]
+    elif not email_valido(filas[0][0] if filas[0] else ""):
+        filas = filas[1:]
+
+    ahora = _ahora()
+    registros = {}
+    for fila in filas:
+        email = fila[columna].strip() if len(fila) > columna else ""
+        if email_valido(email):
+            registros.setdefault(normalizar_email(email), (email, normalizar_email(email), ahora, secrets.token_urlsafe(16)))
+
+    antes = contar(conexion, solo_activos=False)
+    with conexion:
+        conexion.executemany(
+            "INSERT OR IGNORE INTO suscriptores (email, email_normalizado, creado, token_baja) VALUES (?, ?, ?, ?)",
+            registros.values())
+        _asignar_todas_si_faltan(conexion)
+    importados = contar(conexion, solo_activos=False) - antes
+    return importados, len(filas) - importados
+
+
+def exportar_csv(conexion, ruta, solo_activos=True):
+    condicion = " WHERE activo = 1" if solo_activos else ""
+    cursor = conexion.execute(
+        "SELECT email, creado, activo, baja, "
+        "(SELECT group_concat(location_id, ';') FROM suscripciones_estacion WHERE suscriptor_id = s.id) "
+        f"FROM suscriptores s{condicion} ORDER BY id")
+    n = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["email", "creado", "activo", "baja", "estaciones"])
+        for fila in cursor:
+            escritor.writerow(tuple(fila))
+            n += 1
+    return n
+
+
+# --- ESPEJO EN GOOGLE SHEETS ---
+def abrir_hoja():
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    scope = [
+        "https://spreadsheets.google.com/feeds",
+        "https://www.googleapis.com/auth/drive"
+    ]
+    creds = ServiceAccountCredentials.from_json_keyfile_name(ARCHIVO_CREDENCIALES, scope)
+    client = gspread.authorize(creds)
+    return client.open(HOJA_ESPEJO).sheet1
+
+
+def _fila_hoja(fila):
+    return [fila['email'], fila['baja'] or fila['creado'], "activo" if fila['activo'] else "baja"]
+
+
+def sincronizar_hoja(conexion, hoja=None, lote=500):
+    """Refleja en la hoja los cambios pendientes (altas y bajas): una fila por correo.
+
+    Si el correo ya tiene fila se reescribe (todas, si quedaron repetidas de
+    versiones anteriores); si no, se agrega al final. Una lectura de la
+    columna de correos y a lo más un batch_update y un append_rows por lote.
+    """
+    pendientes = conexion.execute(
+        "SELECT id, email, email_normalizado, creado, activo, baja FROM suscriptores "
+        "WHERE sincronizado = 0 ORDER BY id LIMIT ?", (lote,)).fetchall()
+    if not pendientes:
+        return 0
+    hoja = hoja or abrir_hoja()
+    filas_hoja = {}
+    for n, email in enumerate(hoja.col_values(1), start=1):
+        filas_hoja.setdefault(normalizar_email(email), []).append(n)
+
+    cambios = []
+    nuevas = []
+    for f in pendientes:
+        if f['email_normalizado'] in filas_hoja:
+            cambios += [{'range': f"A{n}:C{n}", 'values': [_fila_hoja(f)]} for n in filas_hoja[f['email_normalizado']]]
+        else:
+            nuevas.append(_fila_hoja(f))
+    if cambios:
+        hoja.batch_update(cambios)
+    if nuevas:
+        hoja.append_rows(nuevas)
+    with conexion:
+        conexion.executemany("UPDATE suscriptores SET sincronizado = 1 WHERE id = ?", [(f['id'],) for f in pendientes])
+    return len(pendientes)
+
+
+class SincronizadorHoja:
+    """Hilo que refleja los cambios en Google Sheets cuando se le avisa."""
+
+    def __init__(self, ruta=RUTA_DB, intervalo=300):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self._aviso = threading.Event()
+        self._hilo = threading.Thread(target=self._ejecutar, name="espejo-suscriptores", daemon=True)
+        self._hilo.start()
+
+    def notificar(self):
+        self._aviso.set()
+
+    def _ejecutar(self):
+        # Sin credenciales o sin gspread no hay espejo: se avisa una vez y el hilo termina
+        if not os.path.exists(ARCHIVO_CREDENCIALES):
+            logger.warning("Espejo en Google Sheets desactivado: falta %s", ARCHIVO_CREDENCIALES)
+            return
+        try:
+            import gspread  # noqa: F401
+        except ImportError:
+            logger.warning("Espejo en Google Sheets desactivado: gspread no está instalado")
+            return
+        conexion = conectar(self.ruta)
+        hoja = None
+        while True:
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            try:
+                hoja = hoja or abrir_hoja()
+                while sincronizar_hoja(conexion, hoja):
+                    pass
+            except Exception as e:
+                hoja = None
+                logger.warning("No se pudo sincronizar la hoja de suscriptores: %s", e)
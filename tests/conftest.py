@@ -0,0 +1,8 @@
+# Los módulos de AirCesfam están en la raíz del repositorio (sin paquete).
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# El almacén de las pruebas nunca es el del proyecto
+os.environ.setdefault("AIRCESFAM_ALMACEN", tempfile.mkdtemp(prefix="aircesfam_pruebas_"))
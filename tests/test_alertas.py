@@ -0,0 +1,96 @@
+import importlib
+import json
+import multiprocessing
+import sys
+
+import pandas as pd
+import pytest
+
+import alertas
+
+
+def lecturas(valores, desde="2025-07-01 00:00", location_id=356, parametro='pm25', validos=None):
+    horas = pd.date_range(desde, periods=len(valores), freq="h", tz="America/Santiago")
+    return pd.DataFrame({'location_id': location_id, 'location_name': "Estación", 'parameter': parametro,
+                         'value': [float(v) for v in valores], 'datetimeLocal': horas,
+                         'dato_valido': True if validos is None else validos})
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    return str(tmp_path / "estado.json"), str(tmp_path / "alertas.jsonl")
+
+
+def tipos(transiciones):
+    return [t['tipo'] for t in transiciones]
+
+
+def test_abre_tras_horas_seguidas_sobre_el_umbral_y_cierra_con_histeresis(rutas):
+    # Entrada > 55 dos horas seguidas; salida <= 45 tres horas seguidas
+    activas, transiciones = alertas.actualizar(lecturas([60, 40, 60, 60, 50, 44, 44, 50, 44, 44, 44]), *rutas)
+    assert tipos(transiciones) == ['inicio', 'fin']
+    assert transiciones[0]['hora'].startswith("2025-07-01T03:00")
+    assert transiciones[1]['hora'].startswith("2025-07-01T10:00")
+    assert transiciones[1]['maximo'] == 60
+    assert activas == []
+
+
+def test_enfriamiento_y_brecha(rutas):
+    # Tras cerrarse a las 04:00 no se abre otra dentro de 6 horas aunque siga alto
+    df = lecturas([60, 60, 40, 40, 40, 60, 60, 60, 60, 60, 60, 60])
+    assert tipos(alertas.actualizar(df, *rutas)[1]) == ['inicio', 'fin', 'inicio']
+    # Una brecha de más de HORAS_BRECHA reinicia el conteo de horas sobre el umbral
+    otra = pd.concat([lecturas([60], location_id=808), lecturas([60], "2025-07-01 05:00", location_id=808)])
+    assert alertas.actualizar(otra, *rutas)[1] == []
+
+
+def test_solo_procesa_horas_nuevas_y_guarda_el_estado(rutas):
+    ruta, ruta_eventos = rutas
+    df = lecturas([60, 60, 60, 60])
+    activas, transiciones = alertas.actualizar(df.iloc[:2], ruta, ruta_eventos)
+    assert tipos(transiciones) == ['inicio'] and activas[0]['value'] == 60
+    assert alertas.actualizar(df.iloc[:2], ruta, ruta_eventos)[1] == []
+    assert alertas.actualizar(df, ruta, ruta_eventos)[1] == []
+    with open(ruta, encoding="utf-8") as f:
+        assert json.load(f)["356|pm25"]['ultima'].startswith("2025-07-01T03:00")
+    eventos, posicion = alertas.eventos_sin_enviar(ruta_eventos, ruta + ".cursor")
+    assert tipos(eventos) == ['inicio'] and posicion > 0
+
+
+def test_lecturas_invalidas_y_otros_parametros_no_cuentan(rutas):
+    df = pd.concat([lecturas([60, 60], validos=[True, False]), lecturas([500, 500], parametro='o3')])
+    assert alertas.actualizar(df, *rutas)[1] == []
+
+
+def test_estacion_nueva_trae_su_historia_de_arranque(rutas):
+    alertas.actualizar(lecturas([10, 10, 10, 10]), *rutas)
+    # Las horas anteriores al cursor de las demás series también se revisan
+    nueva = lecturas([60, 60, 10, 10, 10], location_id=808)
+    df = pd.concat([lecturas([10, 10, 10, 10, 10]), nueva])
+    assert [(t['tipo'], t['location_id']) for t in alertas.actualizar(df, *rutas)[1]] == [('inicio', 808), ('fin', 808)]
+
+
+def _actualizar_en_proceso(argumentos):
+    df, ruta, ruta_eventos = argumentos
+    return len(alertas.actualizar(df, ruta, ruta_eventos)[1])
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="usa fork")
+def test_procesos_simultaneos_emiten_cada_transicion_una_vez(rutas):
+    ruta, ruta_eventos = rutas
+    df = lecturas([60, 60, 60, 10, 10, 10] * 4)
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        emitidas = pool.map(_actualizar_en_proceso, [(df, ruta, ruta_eventos)] * 8)
+    with open(ruta_eventos, encoding="utf-8") as f:
+        registradas = [json.loads(linea) for linea in f]
+    assert sum(emitidas) == len(registradas)
+    assert sorted(emitidas, reverse=True)[1:] == [0] * 7
+
+
+def test_importa_sin_fcntl(monkeypatch):
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    try:
+        importlib.reload(alertas)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(alertas)
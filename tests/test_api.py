@@ -0,0 +1,63 @@
+import io
+from unittest import mock
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from tornado.testing import AsyncHTTPTestCase
+
+import api
+import calibracion
+
+
+def estado_con_datos(version="v1"):
+    estado = api.EstadoDatos("sin-carpeta")
+    estado.df = pd.DataFrame({'location_id': [356, 808, 808], 'location_name': ["Bocatoma", "JUNJI", "JUNJI"],
+                              'value': [10.0, 20.0, 30.0]})
+    estado.tabla = pa.Table.from_pandas(estado.df.assign(parameter="pm25"), preserve_index=False)
+    estado.version = version
+    return estado
+
+
+class PruebaApi(AsyncHTTPTestCase):
+    def get_app(self):
+        self.estado = estado_con_datos()
+        return api.crear_app(self.estado)
+
+    def test_etag_y_304(self):
+        respuesta = self.fetch("/api/version")
+        assert respuesta.code == 200
+        etag = respuesta.headers['Etag']
+        assert etag.startswith('"v1-')
+        assert self.fetch("/api/version", headers={'If-None-Match': etag}).code == 304
+        assert self.fetch("/api/version", headers={'If-None-Match': '"otra"'}).code == 200
+
+    def test_respuesta_se_serializa_una_vez_por_version(self):
+        self.fetch("/api/version")
+        assert len(self.estado.respuestas) == 1
+        self.fetch("/api/version")
+        assert len(self.estado.respuestas) == 1
+
+        # Versión nueva: la ETag anterior ya no sirve
+        etag = self.fetch("/api/version").headers['Etag']
+        self.estado.version, self.estado.respuestas = "v2", {}
+        respuesta = self.fetch("/api/version", headers={'If-None-Match': etag})
+        assert respuesta.code == 200 and respuesta.headers['Etag'].startswith('"v2-')
+
+    def test_calibracion_nueva_cambia_la_clave(self):
+        self.fetch("/api/version")
+        calibrados = {'base': 40, 'factores': (1.0,) * 5, 'version': "c1"}
+        with mock.patch.object(calibracion, "parametros_demanda", return_value=calibrados):
+            self.fetch("/api/version")
+        assert sorted(clave[2] or "" for clave in self.estado.respuestas) == ["", "c1"]
+
+    def test_sin_datos_responde_503(self):
+        self.estado.df = None
+        assert self.fetch("/api/version").code == 503
+
+    def test_exportar_por_partes(self):
+        respuesta = self.fetch("/api/exportar?formato=csv&estacion=JUNJI")
+        assert respuesta.code == 200
+        assert pa_csv.read_csv(io.BytesIO(respuesta.body))['value'].to_pylist() == [20.0, 30.0]
+        assert 'aircesfam_v1.csv' in respuesta.headers['Content-Disposition']
+        assert self.fetch("/api/exportar?formato=xlsx").code == 400
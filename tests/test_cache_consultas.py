@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import cache_consultas
+from cache_consultas import CacheLRU
+
+
+def guardar(cache, version, vista, n=100):
+    return cache.obtener(vista, version, lambda: b"x" * n)
+
+
+def test_acierto_no_recalcula():
+    cache = CacheLRU()
+    llamadas = []
+    for _ in range(3):
+        assert cache.obtener("serie", "v1", lambda: llamadas.append(1) or b"abc", estacion="A") == b"abc"
+    assert len(llamadas) == 1
+    assert cache.estado()['aciertos'] == 2 and cache.estado()['fallos'] == 1
+
+
+def test_presupuesto_expulsa_la_entrada_menos_usada():
+    cache = CacheLRU(presupuesto_bytes=250)
+    guardar(cache, "v1", "a")
+    guardar(cache, "v1", "b")
+    guardar(cache, "v1", "a")  # "a" pasa a ser la más usada
+    guardar(cache, "v1", "c")
+    assert [clave[1] for clave in cache.entradas] == ["a", "c"]
+    assert cache.bytes == 200 and cache.estado()['expulsiones'] == 1
+
+
+def test_valor_mayor_que_el_presupuesto_no_se_guarda():
+    cache = CacheLRU(presupuesto_bytes=50)
+    assert guardar(cache, "v1", "a") == b"x" * 100
+    assert not cache.entradas and cache.bytes == 0
+
+
+def test_version_nueva_descarta_la_version_menos_usada():
+    cache = CacheLRU()
+    guardar(cache, "v1", "a")
+    guardar(cache, "v2", "a")
+    guardar(cache, "v1", "b")  # v1 reaparece: ahora la menos usada es v2
+    guardar(cache, "v3", "a")
+    assert list(cache.versiones) == ["v1", "v3"]
+    assert {clave[0] for clave in cache.entradas} == {"v1", "v3"}
+    assert cache.estado()['invalidaciones'] == 1
+
+
+def test_tamano_de_figuras_sin_importar_plotly():
+    class Traza(dict):
+        pass
+
+    class Figura:
+        data = [Traza(x=[1, 2, 3], y=[4, 5, 6])]
+
+        def to_plotly_json(self):
+            return {}
+
+    assert cache_consultas.tamano(Figura()) == cache_consultas.BYTES_TRAZA + 6 * 64
+    codigo = "import sys, cache_consultas; print('plotly' in sys.modules)"
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(cache_consultas.__file__)), check=True)
+    assert salida.stdout.strip() == "False"
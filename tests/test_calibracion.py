@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import calibracion
+import motor
+
+ESTABLECIMIENTOS = [{'nombre': "Cesfam A", 'estaciones': [1]}]
+
+
+@pytest.fixture(autouse=True)
+def almacen_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(calibracion, "RUTA_VIGENTE", str(tmp_path / "calibracion.json"))
+    monkeypatch.setattr(calibracion, "DIR_VERSIONES", str(tmp_path / "calibracion"))
+
+
+def mediciones(dias=60):
+    """PM2.5 horario de la estación 1: días alternos limpios (8) y contaminados (45)."""
+    horas = pd.date_range("2025-05-01", periods=dias * 24, freq="h", tz=motor.ZONA_HORARIA)
+    valor = np.where((np.arange(len(horas)) // 24) % 2 == 0, 8.0, 45.0)
+    return pd.DataFrame({'location_id': 1, 'parameter': 'pm25', 'value': valor, 'datetimeLocal': horas,
+                         'dato_valido': True})
+
+
+def atenciones(ruta, df, base=30, factor=2):
+    """Un registro por atención: cada día repite el nivel del día anterior."""
+    diario = df.set_index('datetimeLocal')['value'].resample("D").mean()
+    filas = []
+    for dia, pm25 in diario.shift(1).dropna().items():
+        n = base if pm25 <= motor.CORTES_DEMANDA[0] else base * factor
+        filas += [{'fecha_hora': f"{dia:%Y-%m-%d} 10:00", 'cesfam': "Cesfam A"}] * n
+    pd.DataFrame(filas).to_csv(ruta, index=False)
+    return str(ruta)
+
+
+def test_ajustar_base_y_factores_por_tramo():
+    base, factores, error = calibracion.ajustar(np.array([5.0, 5.0, 40.0, 40.0]), np.array([30.0, 30.0, 60.0, 60.0]))
+    assert base == 30
+    assert factores[0] == 1.0 and factores[2] == 2.0
+    assert factores == sorted(factores) and error == 0
+
+
+def test_ajustar_sin_atenciones_en_dias_limpios_no_divide_por_cero():
+    base, factores, _ = calibracion.ajustar(np.array([5.0, 40.0]), np.array([0.0, 17.0]))
+    assert base == 10 and np.isfinite(factores).all()
+    assert calibracion.ajustar(np.array([5.0, 40.0]), np.array([0.0, 0.0]))[:2] == \
+        (0.0, list(motor.FACTORES_DEMANDA_INICIALES))
+
+
+def test_visitas_diarias_por_bloques(tmp_path, monkeypatch):
+    monkeypatch.setattr(calibracion, "FILAS_POR_BLOQUE", 7)
+    ruta = atenciones(tmp_path / "atenciones.csv", mediciones(dias=5))
+    visitas = calibracion.visitas_diarias(ruta, columna_establecimiento="cesfam")
+    assert visitas['visitas'].tolist() == [30, 60, 30, 60]
+    assert (visitas['establecimiento'] == "Cesfam A").all()
+
+
+def test_calibrar_guarda_publica_y_reutiliza_la_version(tmp_path):
+    df = mediciones()
+    ruta = atenciones(tmp_path / "atenciones.csv", df)
+    resultado = calibracion.calibrar(df, ruta, "v1", ESTABLECIMIENTOS, columna_establecimiento="cesfam")
+    parametros = resultado["Cesfam A"]
+    assert parametros['base'] == 30 and parametros['ventana_horas'] == 24
+    assert parametros['factores'][2] == 2.0
+    assert calibracion.cargar("Cesfam A") == parametros
+
+    os.remove(calibracion.RUTA_VIGENTE)
+    assert calibracion.calibrar(df, ruta, "v1", ESTABLECIMIENTOS, columna_establecimiento="cesfam") == resultado
+    assert calibracion.cargar("Cesfam A") == parametros
+
+
+def test_calibracion_nueva_conserva_los_demas_establecimientos(tmp_path):
+    otro = {'base': 20, 'factores': [1.0, 1.1, 1.2, 1.3, 1.4]}
+    with open(calibracion.RUTA_VIGENTE, "w", encoding="utf-8") as f:
+        json.dump({"Cesfam B": otro}, f)
+    df = mediciones()
+    calibracion.calibrar(df, atenciones(tmp_path / "atenciones.csv", df), "v1", ESTABLECIMIENTOS,
+                         columna_establecimiento="cesfam")
+    assert calibracion.cargar("Cesfam B") == otro
+    assert calibracion.cargar("Cesfam A")['base'] == 30
+
+
+def test_sin_dias_suficientes_no_guarda_ni_publica(tmp_path):
+    vigente = {"Cesfam A": {'base': 20, 'factores': [1.0, 1.1, 1.2, 1.3, 1.4]}}
+    with open(calibracion.RUTA_VIGENTE, "w", encoding="utf-8") as f:
+        json.dump(vigente, f)
+    df = mediciones(dias=10)
+    assert calibracion.calibrar(df, atenciones(tmp_path / "atenciones.csv", df), "v1", ESTABLECIMIENTOS,
+                                columna_establecimiento="cesfam") == {}
+    assert calibracion.cargar("Cesfam A") == vigente["Cesfam A"]
+    assert not os.path.exists(calibracion.DIR_VERSIONES)
+
+
+def test_parametros_demanda_calibrados_o_iniciales(tmp_path):
+    assert calibracion.parametros_demanda("Cesfam A") is motor.PARAMETROS_DEMANDA_INICIALES
+    assert motor.estimar_demanda(40) == int(motor.CONSULTAS_BASE_INICIAL * motor.FACTORES_DEMANDA_INICIALES[2])
+
+    df = mediciones()
+    calibracion.calibrar(df, atenciones(tmp_path / "atenciones.csv", df), "v1", ESTABLECIMIENTOS,
+                         columna_establecimiento="cesfam")
+    parametros = calibracion.parametros_demanda("Cesfam A")
+    assert parametros['base'] == 30 and parametros['version'] == calibracion.cargar("Cesfam A")['version']
+    assert motor.estimar_demanda(40, parametros) == 60
+    assert list(motor.estimar_demanda_serie([8.0, 40.0], parametros)) == [30, 60]
+    assert list(motor.estimar_demanda_turno_serie([8.0, 40.0], parametros)) == [10, 20]  # por turno
+    # Los demás establecimientos siguen con los valores iniciales
+    assert calibracion.parametros_demanda("Cesfam B") is motor.PARAMETROS_DEMANDA_INICIALES
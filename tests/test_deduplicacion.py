@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+import deduplicacion
+from deduplicacion import IndiceClaves
+
+
+def lecturas(horas, valores, location_id=356, parametro='pm25'):
+    return pd.DataFrame({'location_id': location_id, 'parameter': parametro,
+                         'datetimeUtc': [f"2025-07-01T{h:02d}:00:00Z" for h in horas],
+                         'value': np.asarray(valores, dtype=float)})
+
+
+def test_deduplicar_descarta_repetidas_y_conserva_la_ultima_correccion():
+    df = pd.concat([lecturas([0, 1, 2], [10, 20, 30]), lecturas([1, 2], [20, 35])], ignore_index=True)
+    resultado, contadores = deduplicacion.deduplicar(df)
+    assert resultado['value'].tolist() == [10, 20, 35]
+    assert contadores == {'recibidas': 5, 'nuevas': 3, 'duplicadas': 1, 'corregidas': 1}
+
+
+def test_deduplicar_conserva_el_orden_de_llegada():
+    df = lecturas([5, 3, 4], [1, 2, 3])
+    resultado, _ = deduplicacion.deduplicar(df)
+    assert resultado.index.tolist() == [0, 1, 2]
+
+
+def test_indice_incremental_acepta_solo_nuevas_y_corregidas():
+    indice = IndiceClaves()
+    assert len(indice.registrar(lecturas([0, 1, 2], [10, 20, 30]))) == 3
+    aceptadas = indice.registrar(lecturas([1, 2, 3], [20, 31, 40]))
+    assert aceptadas['value'].tolist() == [31, 40]
+    assert len(indice) == 4
+    assert indice.contadores == {'recibidas': 6, 'nuevas': 4, 'duplicadas': 1, 'corregidas': 1}
+
+
+def test_claves_distinguen_estacion_y_parametro():
+    indice = IndiceClaves()
+    indice.registrar(lecturas([0], [10]))
+    otras = pd.concat([lecturas([0], [10], location_id=808), lecturas([0], [10], parametro='pm10')])
+    assert len(indice.registrar(otras)) == 2
+
+
+def test_tramo_reciente_se_fusiona_sin_cambiar_resultados(monkeypatch):
+    monkeypatch.setattr(deduplicacion, "MINIMO_FUSION", 4)
+    indice = IndiceClaves()
+    for inicio in range(0, 24, 3):
+        indice.registrar(lecturas(range(inicio, inicio + 3), [inicio] * 3))
+    assert len(indice.claves_recientes) <= max(4, deduplicacion.FRACCION_FUSION * len(indice.claves))
+    assert np.all(np.diff(indice.claves.astype(np.float64)) >= 0)
+    # Todas quedan registradas: repetirlas no acepta ninguna, corregirlas sí
+    assert indice.registrar(lecturas(range(24), [h - h % 3 for h in range(24)])).empty
+    assert len(indice.registrar(lecturas([0, 23], [99, 99]))) == 2
+
+
+def test_guardar_y_leer_conserva_claves_contadores_y_fuente(tmp_path):
+    ruta = str(tmp_path / "indice.npz")
+    indice = IndiceClaves()
+    indice.registrar(lecturas([0, 1], [10, 20]))
+    indice.fuente = "123-456"
+    indice.guardar(ruta)
+
+    leido = IndiceClaves(ruta)
+    assert len(leido) == 2
+    assert leido.fuente == "123-456"
+    assert leido.contadores == indice.contadores
+    assert leido.registrar(lecturas([0, 1], [10, 20])).empty
@@ -0,0 +1,65 @@
+import io
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import pytest
+
+import cli
+import exportar
+
+
+def tabla(tipo_texto=pa.string()):
+    """Seis lecturas de dos estaciones y dos parámetros en tres días."""
+    return pa.table({
+        'location_id': pa.array([356, 356, 356, 808, 808, 808], pa.int64()),
+        'location_name': pa.array(["Bocatoma", "Bocatoma", "Bocatoma", "JUNJI", "JUNJI", "JUNJI"], tipo_texto),
+        'parameter': pa.array(["pm25", "pm10", "pm25", "pm25", "pm10", "pm25"], tipo_texto),
+        'value': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        'fecha': pa.array([date(2025, 7, d) for d in (1, 1, 2, 2, 3, 3)], pa.date32()),
+        'dato_valido': [True] * 6,
+    })
+
+
+def valores(tabla, **filtros):
+    return [v for lote in exportar.lotes(tabla, filas_por_lote=2, **filtros) for v in lote['value'].to_pylist()]
+
+
+@pytest.mark.parametrize("tipo_texto", [pa.string(), pa.large_string()])
+def test_filtros_con_columnas_string_y_large_string(tipo_texto):
+    t = tabla(tipo_texto)
+    assert valores(t, estaciones=["JUNJI"]) == [40.0, 50.0, 60.0]
+    assert valores(t, estaciones=["356"]) == [10.0, 20.0, 30.0]
+    assert valores(t, estaciones=["Bocatoma", "808"], parametros=["pm10"]) == [20.0, 50.0]
+    assert valores(t, desde=date(2025, 7, 2), hasta=date(2025, 7, 2)) == [30.0, 40.0]
+    assert valores(t) == [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+
+
+def test_csv_lleva_un_solo_encabezado_y_sin_filas_igual_se_entrega():
+    contenido = b"".join(exportar.generar(tabla(), "csv", parametros=["pm25"]))
+    leido = pa_csv.read_csv(io.BytesIO(contenido))
+    assert leido['value'].to_pylist() == [10.0, 30.0, 40.0, 60.0]
+    assert leido.column_names == ['location_id', 'location_name', 'parameter', 'value', 'dato_valido']
+
+    vacio = b"".join(exportar.generar(tabla(), "csv", parametros=["so2"]))
+    assert vacio.decode().strip() == '"location_id","location_name","parameter","value","dato_valido"'
+
+
+def test_parquet_por_partes_es_un_archivo_valido():
+    contenido = b"".join(exportar.generar(tabla(), "parquet", estaciones=["JUNJI"]))
+    leido = pq.read_table(io.BytesIO(contenido))
+    assert leido['value'].to_pylist() == [40.0, 50.0, 60.0]
+
+
+def test_formato_desconocido():
+    with pytest.raises(ValueError):
+        exportar.generar(tabla(), "xlsx")
+
+
+def test_cli_sin_tabla_publicada_termina_con_error(monkeypatch):
+    monkeypatch.setattr(cli, "_datos", lambda args: None)
+    monkeypatch.setattr(exportar, "tabla_publicada", lambda: None)
+    with pytest.raises(SystemExit) as salida:
+        cli.main(["exportar", "--formato", "csv"])
+    assert "No hay una tabla" in str(salida.value.code)
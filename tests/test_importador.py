@@ -0,0 +1,113 @@
+import gzip
+import os
+
+import pandas as pd
+import pytest
+
+import importador
+
+
+def fuente_openaq(ruta, location_id=9001, horas=range(3), valores=None, parametro='pm25', lat=-36.8, lon=-73.0):
+    """Archivo diario de OpenAQ (CSV con gzip) de una estación."""
+    valores = valores if valores is not None else [10.0 + h for h in horas]
+    df = pd.DataFrame({'location_id': location_id, 'sensors_id': 1, 'location': f"Estación {location_id}",
+                       'datetime': [f"2025-07-01T{h:02d}:00:00-04:00" for h in horas],
+                       'lat': lat, 'lon': lon, 'parameter': parametro, 'units': 'µg/m³', 'value': valores})
+    with gzip.open(ruta, "wt", encoding="utf-8") as f:
+        df.to_csv(f, index=False)
+
+
+@pytest.fixture
+def carpetas(tmp_path):
+    fuente, datos = tmp_path / "fuente", tmp_path / "datos"
+    fuente.mkdir()
+    return str(fuente), str(datos)
+
+
+def test_importa_por_estacion_con_filtros_de_parametro_y_region(carpetas):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"))
+    fuente_openaq(os.path.join(fuente, "b.csv.gz"), parametro='so2')
+    fuente_openaq(os.path.join(fuente, "c.csv.gz"), location_id=9002, lat=-33.4)
+
+    archivos, filas, agregadas, errores = importador.importar(fuente, datos, region=(-37.2, -36.4, -73.4, -72.6))
+    assert (archivos, filas, agregadas, errores) == (3, 3, 3, [])
+    assert importador.archivos_importados(datos) == [importador.ruta_destino(datos, 9001)]
+    df = pd.read_parquet(importador.ruta_destino(datos, 9001))
+    assert df.columns.tolist() == importador.COLUMNAS
+    assert df['datetimeUtc'].tolist() == [f"2025-07-01T{h:02d}:00:00Z" for h in (4, 5, 6)]
+
+
+def test_reimportar_no_reescribe_y_aplica_correcciones(carpetas):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"))
+    importador.importar(fuente, datos)
+    ruta = importador.ruta_destino(datos, 9001)
+    modificado = os.stat(ruta).st_mtime_ns
+
+    assert importador.importar(fuente, datos)[2] == 0
+    assert os.stat(ruta).st_mtime_ns == modificado
+
+    fuente_openaq(os.path.join(fuente, "b.csv.gz"), horas=[2, 3], valores=[99.0, 13.0])
+    assert importador.importar(fuente, datos)[2] == 2
+    assert pd.read_parquet(ruta)['value'].tolist() == [10.0, 11.0, 99.0, 13.0]
+
+
+def test_indice_se_reconstruye_si_el_archivo_cambio_a_mano(carpetas):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"))
+    importador.importar(fuente, datos)
+    ruta = importador.ruta_destino(datos, 9001)
+    pd.read_parquet(ruta).iloc[:1].to_parquet(ruta, index=False)  # se borraron filas a mano
+
+    assert importador.importar(fuente, datos)[2] == 2
+    assert len(pd.read_parquet(ruta)) == 3
+
+
+def test_reemplazar_estacion_recuerda_las_claves_quitadas(carpetas):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"))
+    importador.importar(fuente, datos)
+    ruta = importador.ruta_destino(datos, 9001)
+    modificado = os.stat(ruta).st_mtime_ns
+
+    importador.reemplazar_estacion(ruta, pd.read_parquet(ruta).iloc[2:])
+    assert len(pd.read_parquet(ruta)) == 1
+    assert os.stat(ruta).st_mtime_ns == modificado
+    # Las filas quitadas no vuelven al importar otra vez el mismo archivo
+    assert importador.importar(fuente, datos)[2] == 0
+
+    importador.reemplazar_estacion(ruta, pd.read_parquet(ruta).iloc[:0])
+    assert not os.path.exists(ruta)
+    assert importador.importar(fuente, datos)[2] == 0
+
+
+def test_archivo_ilegible_se_informa_sin_detener_la_importacion(carpetas):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"))
+    with open(os.path.join(fuente, "roto.csv.gz"), "wb") as f:
+        f.write(b"no es gzip")
+
+    archivos, _, agregadas, errores = importador.importar(fuente, datos)
+    assert (archivos, agregadas) == (2, 3)
+    assert [nombre for nombre, _ in errores] == ["roto.csv.gz"]
+
+
+def test_estaciones_se_escriben_por_tandas_y_gana_el_archivo_posterior(carpetas, monkeypatch):
+    fuente, datos = carpetas
+    fuente_openaq(os.path.join(fuente, "a.csv.gz"), horas=[0, 1])
+    fuente_openaq(os.path.join(fuente, "b.csv.gz"), location_id=9002)
+    fuente_openaq(os.path.join(fuente, "c.csv.gz"), horas=[1, 2], valores=[99.0, 12.0])
+    monkeypatch.setattr(importador, "FILAS_POR_ESTACION", 4)
+    monkeypatch.setattr(importador, "FILAS_EN_MEMORIA", 4)
+    escrituras = []
+    guardar = importador.guardar_estacion
+    monkeypatch.setattr(importador, "guardar_estacion",
+                        lambda df, d: escrituras.append((int(df['location_id'].iloc[0]), len(df))) or guardar(df, d))
+
+    archivos, filas, agregadas, errores = importador.importar(fuente, datos, hilos=1)
+    assert (archivos, filas, agregadas, errores) == (3, 7, 6, [])
+    # 9002 se escribe al pasar de FILAS_EN_MEMORIA entre las dos; 9001 al llegar a FILAS_POR_ESTACION
+    assert escrituras == [(9002, 3), (9001, 4)]
+    assert pd.read_parquet(importador.ruta_destino(datos, 9001))['value'].tolist() == [10.0, 99.0, 12.0]
+    assert len(pd.read_parquet(importador.ruta_destino(datos, 9002))) == 3
@@ -0,0 +1,31 @@
+import pandas as pd
+import pytest
+
+import motor
+
+CASOS = [
+    ('pm25', 0.0, 'Bueno'), ('pm25', 12.0, 'Bueno'), ('pm25', 12.1, 'Moderado'), ('pm25', 35.0, 'Moderado'),
+    ('pm25', 35.1, 'Dañino S. G.'), ('pm25', 55.0, 'Dañino S. G.'), ('pm25', 150.0, 'Dañino'),
+    ('pm25', 250.0, 'Muy Dañino'), ('pm25', 251.0, 'Peligroso'),
+    ('pm10', 54.0, 'Bueno'), ('pm10', 54.5, 'Moderado'), ('pm10', 354.0, 'Dañino'), ('pm10', 355.0, 'Peligroso'),
+    ('o3', 500.0, 'Moderado'), ('no2', 1.0, 'Moderado'),
+]
+
+
+def test_clasificar_en_los_limites_de_cada_nivel():
+    df = pd.DataFrame(CASOS, columns=['parameter', 'value', 'esperado'])
+    resultado = motor.clasificar(df.copy())
+    assert resultado['nivel'].tolist() == df['esperado'].tolist()
+    assert resultado.loc[df['parameter'].isin(['o3', 'no2']), 'color'].eq(motor.NIVEL_OTROS[1]).all()
+
+
+@pytest.mark.parametrize("parametro, valor, _", CASOS)
+def test_clasificar_coincide_con_nivel_contaminacion(parametro, valor, _):
+    fila = motor.clasificar(pd.DataFrame({'parameter': [parametro], 'value': [valor]})).iloc[0]
+    assert (fila['nivel'], fila['color']) == motor.nivel_contaminacion(valor, parametro)
+
+
+def test_clasificar_conserva_el_indice():
+    df = pd.DataFrame({'parameter': ['pm10', 'pm25'], 'value': [10.0, 300.0]}, index=[7, 3])
+    resultado = motor.clasificar(df)
+    assert resultado.loc[3, 'nivel'] == 'Peligroso' and resultado.loc[7, 'nivel'] == 'Bueno'
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import almacen
+import importador
+import retencion
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DESCARGA = "openaq_location_356_measurments.csv"
+
+
+def fuente_openaq(ruta, desde="2024-12-01", hasta="2025-04-30 23:00", location_id=9001, ajuste=None):
+    """Archivo de OpenAQ con lecturas horarias de pm25 y so2; cada 97 horas un negativo."""
+    horas = pd.date_range(desde, hasta, freq="h", tz="America/Santiago")
+    partes = []
+    for parametro in ('pm25', 'so2'):
+        valores = np.random.default_rng(location_id).gamma(2, 10, len(horas)).round(1)
+        valores[::97] = -5.0
+        partes.append(pd.DataFrame({
+            'location_id': location_id, 'location': f"Estación {location_id}", 'parameter': parametro,
+            'value': valores if ajuste is None else valores + ajuste, 'units': 'µg/m³',
+            'datetime': horas.strftime('%Y-%m-%dT%H:%M:%S%z').str[:-2] + ':' + horas.strftime('%z').str[-2:],
+            'lat': -36.8, 'lon': -73.0}))
+    pd.concat(partes, ignore_index=True).to_parquet(ruta, index=False)
+
+
+def huella(ruta):
+    with open(ruta, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+@pytest.fixture
+def red(tmp_path, monkeypatch):
+    """Carpeta de datos con una descarga y un archivo del importador; almacén temporal."""
+    almacen_tmp = tmp_path / "almacen"
+    monkeypatch.setattr(almacen, "DIR_ALMACEN", str(almacen_tmp))
+    monkeypatch.setattr(retencion, "DIR_AGREGADOS", str(almacen_tmp / "agregados"))
+    monkeypatch.setattr(retencion, "DIR_HORARIO", str(almacen_tmp / "agregados" / "horario"))
+    monkeypatch.setattr(retencion, "RUTA_ESTADO", str(almacen_tmp / "retencion.json"))
+    monkeypatch.setattr(retencion, "RUTA_BLOQUEO", str(almacen_tmp / "retencion.lock"))
+    fuente, datos = tmp_path / "fuente", tmp_path / "datos"
+    fuente.mkdir()
+    datos.mkdir()
+    shutil.copy(os.path.join(RAIZ, DESCARGA), datos / DESCARGA)
+    fuente_openaq(str(fuente / "a.parquet"))
+    importador.importar(str(fuente), str(datos), parametros=['pm25', 'so2'])
+    return str(fuente), str(datos)
+
+
+def compactar(datos, **opciones):
+    # Último día 2025-04-30: crudo desde 2025-03-01, horario febrero, diario enero, solo mensual diciembre
+    opciones = {'dias_crudos': 30, 'dias_horarios': 20, 'dias_diarios': 20, **opciones}
+    return retencion.compactar(datos, **opciones)
+
+
+def test_cortes_en_primer_dia_de_mes():
+    assert retencion.cortes(date(2025, 4, 30), 30, 20, 20) == (date(2025, 3, 1), date(2025, 2, 1), date(2025, 1, 1))
+
+
+def test_sin_politica_no_compacta(red):
+    assert retencion.compactar(red[1], dias_crudos=None) is None
+
+
+def test_solo_recorta_los_archivos_del_importador(red):
+    _, datos = red
+    descarga = os.path.join(datos, DESCARGA)
+    antes = huella(descarga)
+
+    resumen = compactar(datos)
+    assert resumen['corte_crudo'] == "2025-03-01" and resumen['archivos'] == 1
+    assert huella(descarga) == antes
+    crudo = pd.read_parquet(importador.ruta_destino(datos, 9001))
+    assert crudo['datetimeLocal'].min().startswith("2025-03-01")
+    assert resumen['filas_quitadas'] == resumen['filas_compactadas'] == 2 * (31 + 31 + 28) * 24
+
+
+def test_niveles_conservan_todos_los_parametros_y_las_lecturas_invalidas(red):
+    _, datos = red
+    compactar(datos)
+
+    horario = pd.read_parquet(retencion.ruta_horario(9001, "2025-02"))
+    assert sorted(horario['parameter'].unique()) == ['pm25', 'so2']
+    assert len(horario) == 2 * 28 * 24 and (horario['value'] < 0).any()
+    assert [mes for _, mes, _ in retencion.meses_horario()] == ["2025-02"]
+
+    # Los niveles no se traslapan: el diario guardado termina donde empieza el horario
+    diario = retencion.leer_nivel("diario")
+    assert diario['fecha'].min() == date(2025, 1, 1) and diario['fecha'].max() == date(2025, 1, 31)
+    assert sorted(diario['parameter'].unique()) == ['pm25', 'so2']
+    assert ((diario['horas'] + diario['horas_invalidas']) == 24).all()
+    dias = retencion.leer_diario()
+    assert dias['fecha'].max() == date(2025, 2, 28) and len(dias) == 2 * (31 + 28)
+
+    mensual = retencion.leer_nivel("mensual").set_index(['parameter', 'fecha'])
+    diciembre = mensual.loc[('so2', date(2024, 12, 1))]
+    assert diciembre['horas'] + diciembre['horas_invalidas'] == 31 * 24 and diciembre['horas_invalidas'] > 0
+    assert sorted(set(mensual.index.get_level_values('fecha'))) == [date(2024, 12, 1), date(2025, 1, 1)]
+
+
+def test_mes_que_sale_del_nivel_horario_se_agrega_completo(red):
+    _, datos = red
+    compactar(datos)
+    febrero = retencion.leer_diario(date(2025, 2, 1), date(2025, 2, 28))
+
+    compactar(datos, dias_horarios=0)
+    assert retencion.meses_horario() == []
+    diario = retencion.leer_nivel("diario")
+    assert diario['fecha'].max() == date(2025, 2, 28)
+    pd.testing.assert_frame_equal(diario[diario['fecha'] >= date(2025, 2, 1)].reset_index(drop=True), febrero)
+    mensual = retencion.leer_nivel("mensual")
+    feb = mensual[(mensual['fecha'] == date(2025, 2, 1)) & (mensual['parameter'] == 'pm25')].iloc[0]
+    assert feb['horas'] + feb['horas_invalidas'] == 28 * 24
+
+
+def test_repetir_e_importar_de_nuevo_no_cambia_nada(red):
+    fuente, datos = red
+    compactar(datos)
+    diario = retencion.leer_nivel("diario")
+
+    assert importador.importar(fuente, datos, parametros=['pm25', 'so2'])[2] == 0
+    resumen = compactar(datos)
+    assert resumen['filas_compactadas'] == 0 and resumen['archivos'] == 0
+    pd.testing.assert_frame_equal(retencion.leer_nivel("diario"), diario)
+
+
+def test_correccion_tardia_reagrega_el_dia_completo(red, tmp_path):
+    fuente, datos = red
+    compactar(datos)
+    fuente_openaq(str(tmp_path / "fuente" / "b.parquet"), "2025-02-10 06:00", "2025-02-10 07:00", ajuste=1000)
+    fuente_openaq(str(tmp_path / "fuente" / "c.parquet"), "2025-01-10 06:00", "2025-01-10 07:00", ajuste=1000)
+    mensual = retencion.leer_nivel("mensual")
+    assert importador.importar(fuente, datos, parametros=['pm25', 'so2'])[2] == 8
+
+    compactar(datos)
+    diario = retencion.leer_diario().set_index(['parameter', 'fecha'])
+    dia = diario.loc[('pm25', date(2025, 2, 10))]
+    assert dia['horas'] + dia['horas_invalidas'] == 24 and dia['maximo'] > 1000
+    # Enero ya no tiene nivel horario: sus agregados no se reemplazan por dos horas
+    assert diario.loc[('pm25', date(2025, 1, 10)), 'maximo'] < 1000
+    enero = retencion.leer_nivel("mensual")
+    enero = enero[enero['fecha'] == date(2025, 1, 1)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(enero, mensual[mensual['fecha'] == date(2025, 1, 1)].reset_index(drop=True))
+
+
+def test_simular_no_escribe(red):
+    _, datos = red
+    ruta = importador.ruta_destino(datos, 9001)
+    antes = huella(ruta)
+    resumen = compactar(datos, simular=True)
+    assert resumen['filas_quitadas'] > 0
+    assert huella(ruta) == antes
+    assert not os.path.exists(retencion.DIR_AGREGADOS)
+
+
+def test_serie_agregada_omite_dias_con_lecturas_horarias(red):
+    _, datos = red
+    compactar(datos)
+    serie = retencion.serie_agregada(date(2024, 12, 1), date(2025, 2, 28), [9001])
+    assert serie.groupby('resolucion').size().to_dict() == {'diario': 2 * (31 + 28), 'mensual': 2}
+
+    serie = retencion.serie_agregada(date(2024, 12, 1), date(2025, 2, 28), [9001],
+                                     excluir_fechas=[date(2024, 12, 5), date(2025, 2, 1)])
+    assert serie.groupby('resolucion').size().to_dict() == {'diario': 2 * (31 + 27)}
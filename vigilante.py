@@ -0,0 +1,73 @@
+# vigilante.py
+# Vigilancia de la versión de datos publicada, compartida por todas las
+# sesiones de un proceso.
+#
+# Un solo hilo por proceso (compartido()) revisa cada SEGUNDOS_REVISION
+# segundos la huella de los archivos fuente (solo os.stat) y, si cambió, anuncia
+# la versión nueva. No prepara datos: la primera sesión que pide la versión la
+# carga con el cargador en caché del dashboard, que la prepara una sola vez.
+# Las sesiones en modo "en vivo" solo leen `version` en memoria y nunca tocan
+# el disco para saber si hay datos nuevos, así que el costo no crece con la
+# cantidad de pantallas abiertas.
+
+import logging
+import threading
+import time
+
+import motor
+
+logger = logging.getLogger("aircesfam.vigilante")
+
+SEGUNDOS_REVISION = 10
+
+_vigilantes = {}  # carpeta de datos -> Vigilante del proceso
+_lock = threading.Lock()
+
+
+class Vigilante:
+    def __init__(self, ruta_datos, segundos=SEGUNDOS_REVISION):
+        self.ruta_datos = ruta_datos
+        self.segundos = segundos
+        self.version = motor.version_datos(motor.listar_archivos(ruta_datos))
+        self.publicada = time.time()  # cuándo se anunció la versión vigente
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def revisar(self):
+        """Anuncia la versión nueva si cambiaron los archivos. Devuelve True si hubo cambio."""
+        version = motor.version_datos(motor.listar_archivos(self.ruta_datos))
+        if version is None or version == self.version:
+            return False
+        return self.anunciar(version)
+
+    def anunciar(self, version):
+        """Marca una versión como vigente (p. ej. la que acaba de cargar una
+        ejecución del dashboard, antes de que el vigilante la vea)."""
+        with self._lock:
+            if version == self.version:
+                return False
+            self.version, self.publicada = version, time.time()
+        logger.info("Versión de datos %s publicada", version)
+        return True
+
+    def iniciar(self):
+        def ciclo():
+            while True:
+                time.sleep(self.segundos)
+                try:
+                    self.revisar()
+                except Exception:
+                    logger.exception("Error al revisar la versión de datos")
+
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=ciclo, name="vigilante", daemon=True)
+            self._hilo.start()
+        return self
+
+
+def compartido(ruta_datos, segundos=SEGUNDOS_REVISION):
+    """El vigilante de la carpeta en este proceso; se crea e inicia la primera vez."""
+    with _lock:
+        if ruta_datos not in _vigilantes:
+            _vigilantes[ruta_datos] = Vigilante(ruta_datos, segundos).iniciar()
+        return _vigilantes[ruta_datos]
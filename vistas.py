@@ -0,0 +1,53 @@
+# vistas.py
+# Construcción de los gráficos y el mapa del dashboard, separada de la
+# interfaz para poder medirla y reutilizarla fuera de Streamlit. folium y
+# plotly se importan al construir cada vista, no al importar el módulo.
+
+from motor import PARAMETROS_DEMANDA_INICIALES, estimar_demanda
+
+COLORES_MAPA = {'green': 'green', 'yellow': 'beige', 'orange': 'orange', 'red': 'red', 'purple': 'purple', 'maroon': 'darkred'}
+
+
+def figura_tendencia(df_filtrado, estacion):
+    import plotly.express as px
+
+    return px.line(df_filtrado, x='datetimeLocal', y='value', color='parameter',
+                   title=f"Contaminantes en {estacion}",
+                   labels={'value': 'Concentración (µg/m³)', 'datetimeLocal': 'Fecha y Hora'})
+
+
+def construir_mapa(df, ultimos_pm25, parametros=PARAMETROS_DEMANDA_INICIALES):
+    import folium
+    from folium.plugins import MarkerCluster
+
+    lat_mean = df['latitude'].mean()
+    lon_mean = df['longitude'].mean()
+    m = folium.Map(location=[lat_mean, lon_mean], zoom_start=8)
+    marker_cluster = MarkerCluster().add_to(m)
+
+    for _, row in ultimos_pm25.iterrows():
+        folium.Marker(
+            location=[row['latitude'], row['longitude']],
+            popup=f"<b>{row['location_name']}</b><br>PM2.5: {row['value']:.1f} µg/m³<br>Nivel: {row['nivel']}<br>Consultas esperadas: {estimar_demanda(row['value'], parametros)}",
+            icon=folium.Icon(color=COLORES_MAPA.get(row['color'], 'gray'))
+        ).add_to(marker_cluster)
+    return m
+
+
+def figura_correlacion(matriz):
+    import plotly.express as px
+
+    fig = px.imshow(matriz.round(2), zmin=-1, zmax=1, color_continuous_scale="RdBu_r",
+                    text_auto=len(matriz) <= 20, aspect="auto", title="Correlación entre estaciones y contaminantes")
+    fig.update_layout(xaxis_title=None, yaxis_title=None)
+    return fig
+
+
+def figura_desfase(correlaciones, referencia):
+    import plotly.express as px
+
+    fig = px.line(correlaciones, markers=True, title=f"Correlación con desfase respecto de {referencia}",
+                  labels={'desfase_horas': f"Desfase (h): > 0, {referencia} se adelanta", 'value': 'r',
+                          'variable': 'Serie'})
+    fig.add_vline(x=0, line_dash="dot", line_color="gray")
+    return fig